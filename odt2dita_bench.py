@@ -0,0 +1,370 @@
+# ODT to DITA converter - benchmark
+# Generates synthetic ODT documents of growing size, converts them with odt2dita_oasis.py
+# and reports the time of every conversion phase, flagging phases that grow super-linearly, and the peak memory
+# NOTE: the peak_kb of a phase is the peak memory of the whole process at the end of that phase (ru_maxrss),
+# not the peak within the phase, so it never goes down from one phase to the next; the phase that raises it is
+# the one where memory use grows to a new peak
+# Python 2.7, like the converter; runs offline, nothing but the standard library is needed
+#
+# Generate one document:
+#    python odt2dita_bench.py generate out.odt -headings 200 -spans 8
+# Run the benchmark (the sizes multiply the number of headings):
+#    python odt2dita_bench.py run -sizes 1,2,4,8 -o results.json
+#
+# 0.43 OASIS 2026/10/18 first version
+
+import zipfile
+import random
+import os
+import os.path
+import sys
+import subprocess
+import tempfile
+import shutil
+import math
+import json
+import argparse
+
+
+# The shape of a generated document
+# Every heading starts a section, and every section has the same content, so the document grows linearly with headings
+# A paragraph has "spans" spans; tables are rows x columns; lists are nested "listdepth" levels deep;
+# cross-references point to bookmarks in the same or earlier sections
+DefaultShape={"headings":20,      # headings (sections), at outline levels 1 to 3
+              "paragraphs":5,     # text paragraphs per section
+              "spans":4,          # text spans per paragraph
+              "tables":1,         # tables per section
+              "rows":4,           # rows per table
+              "columns":3,        # columns per table
+              "lists":1,          # nested lists per section
+              "listdepth":3,      # nesting levels of every list, two items per level
+              "bookmarks":2,      # bookmarks per section
+              "xrefs":2,          # cross-references per section
+              "footnotes":1,      # footnotes per section
+              "notes":1,          # note paragraphs per section ("Note:", "Caution!" ...), the prefix in its own span
+              "images":1,         # images per section
+              "code":3}           # code paragraphs per section
+
+# Namespace declarations for all the XML files
+Namespaces=('xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+            'xmlns:style="urn:oasis:names:tc:opendocument:xmlns:style:1.0" '
+            'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" '
+            'xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" '
+            'xmlns:draw="urn:oasis:names:tc:opendocument:xmlns:drawing:1.0" '
+            'xmlns:fo="urn:oasis:names:tc:opendocument:xmlns:xsl-fo-compatible:1.0" '
+            'xmlns:xlink="http://www.w3.org/1999/xlink" '
+            'xmlns:dc="http://purl.org/dc/elements/1.1/" '
+            'xmlns:meta="urn:oasis:names:tc:opendocument:xmlns:meta:1.0" '
+            'xmlns:svg="urn:oasis:names:tc:opendocument:xmlns:svg-compatible:1.0" '
+            'office:version="1.2"')
+
+Words="alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu nu xi omicron pi rho sigma tau upsilon".split()
+
+# Paragraph and text styles; the converter recognizes bold, italic and "Cour*" fonts as monospace
+StylesXML=('<?xml version="1.0" encoding="UTF-8"?><office:document-styles %s><office:styles>'
+           '<style:style style:name="Standard" style:family="paragraph"/>'
+           '<style:style style:name="Code" style:family="paragraph" style:parent-style-name="Standard">'
+           '<style:text-properties style:font-name="Courier New"/></style:style>'
+           '<style:style style:name="Table_20_Heading" style:family="paragraph" style:parent-style-name="Standard">'
+           '<style:text-properties fo:font-weight="bold"/></style:style>'
+           '<style:style style:name="Footnote" style:family="paragraph" style:parent-style-name="Standard"/>'
+           '<style:style style:name="Note" style:family="paragraph" style:parent-style-name="Standard"/>'
+           '<text:list-style style:name="L1"><text:list-level-style-number text:level="1"/>'
+           '<text:list-level-style-bullet text:level="2"/><text:list-level-style-number text:level="3"/></text:list-style>'
+           '</office:styles><office:automatic-styles/></office:document-styles>') % Namespaces
+
+AutomaticStylesXML=('<office:automatic-styles>'
+                    '<style:style style:name="T1" style:family="text"><style:text-properties fo:font-weight="bold"/></style:style>'
+                    '<style:style style:name="T2" style:family="text"><style:text-properties fo:font-style="italic"/></style:style>'
+                    '<style:style style:name="T3" style:family="text"><style:text-properties style:font-name="Courier New"/></style:style>'
+                    '<style:style style:name="T4" style:family="text"><style:text-properties fo:font-weight="bold" fo:font-style="italic"/></style:style>'
+                    '<style:style style:name="P1" style:family="paragraph" style:parent-style-name="Code"/>'
+                    '</office:automatic-styles>')
+
+SpanStyles=["T1","T2","T3","T4",None]
+
+# Note paragraphs: paragraph style, note information string, start of the text after it
+# The converter takes off the string and the separators after it (":", "-", "!" ...), but not the "(" or "&"
+NoteCases=[("Standard","Note:","(optional)"),
+           ("Standard","Tip:","&amp;"),
+           ("Note","Note","- restart"),
+           ("Note","Caution!","hot")]
+
+ManifestXML=('<?xml version="1.0" encoding="UTF-8"?>'
+             '<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" manifest:version="1.2">'
+             '<manifest:file-entry manifest:full-path="/" manifest:media-type="application/vnd.oasis.opendocument.text"/>'
+             '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+             '<manifest:file-entry manifest:full-path="styles.xml" manifest:media-type="text/xml"/>'
+             '<manifest:file-entry manifest:full-path="meta.xml" manifest:media-type="text/xml"/>'
+             '%s</manifest:manifest>')
+
+# A 1x1 PNG image
+ImagePNG=('\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89'
+          '\x00\x00\x00\rIDATx\x9cc\xf8\x0f\x00\x00\x01\x01\x00\x05\x18\xd8N\x00\x00\x00\x00IEND\xaeB`\x82')
+
+
+# == GENERATOR ==============
+
+# Write a synthetic ODT document with the given shape (a dictionary like DefaultShape; missing keys take the default)
+# The same shape and seed always give the same document
+def GenerateODT(path,Shape={},Seed=0):
+    shape=dict(DefaultShape)
+    shape.update(Shape)
+    r=random.Random(Seed)
+
+    def Text(n):
+        return " ".join([r.choice(Words) for i in range(n)])
+
+    def Paragraph():
+        parts=[]
+        for i in range(shape["spans"]):
+            style=SpanStyles[i%len(SpanStyles)]
+            if style==None:
+                parts.append(Text(r.randint(2,6))+" ")
+            else:
+                parts.append('<text:span text:style-name="%s">%s</text:span> ' % (style,Text(r.randint(1,4))))
+        return "".join(parts)
+
+    def List(depth):
+        items=[]
+        for i in range(2):
+            item='<text:list-item><text:p>%s</text:p>' % Text(4)
+            if depth>1 and i==1:
+                item=item+List(depth-1)
+            items.append(item+'</text:list-item>')
+        return '<text:list>%s</text:list>' % "".join(items)
+
+    Bookmarks=[]
+    Images=[]
+    Body=[]
+    for h in range(shape["headings"]):
+        Body.append('<text:h text:outline-level="%d">Section %d %s</text:h>' % (1+h%3,h,Text(2)))
+        for p in range(shape["paragraphs"]):
+            Body.append('<text:p text:style-name="Standard">%s</text:p>' % Paragraph())
+        for b in range(shape["bookmarks"]):
+            name="bm_%d_%d" % (h,b)
+            Bookmarks.append(name)
+            Body.append('<text:p><text:bookmark text:name="%s"/>%s</text:p>' % (name,Paragraph()))
+        for x in range(shape["xrefs"]):
+            if Bookmarks<>[]:
+                Body.append('<text:p>%s see <text:bookmark-ref text:reference-format="text" text:ref-name="%s">%s</text:bookmark-ref></text:p>'
+                            % (Text(3),r.choice(Bookmarks),Text(2)))
+        for f in range(shape["footnotes"]):
+            Body.append('<text:p>%s<text:note text:id="ftn%d_%d" text:note-class="footnote"><text:note-citation>%d</text:note-citation>'
+                        '<text:note-body><text:p text:style-name="Footnote">%s</text:p></text:note-body></text:note></text:p>'
+                        % (Text(5),h,f,f+1,Text(6)))
+        # The prefix and the text after it are adjacent spans with the same formatting, which the converter
+        # reads as one run, see NoteCases
+        for n in range(shape["notes"]):
+            style,prefix,start=NoteCases[(h*shape["notes"]+n)%len(NoteCases)]
+            Body.append('<text:p text:style-name="%s"><text:span text:style-name="T1">%s</text:span><text:span text:style-name="T1"> %s %s</text:span></text:p>'
+                        % (style,prefix,start,Text(4)))
+        for i in range(shape["images"]):
+            name="Pictures/image%d_%d.png" % (h,i)
+            Images.append(name)
+            Body.append('<text:p><draw:frame draw:name="Image%d_%d" svg:width="1cm" svg:height="1cm"><draw:image xlink:href="%s"/></draw:frame></text:p>'
+                        % (h,i,name))
+        for t in range(shape["tables"]):
+            rows=['<table:table-header-rows><table:table-row>%s</table:table-row></table:table-header-rows>'
+                  % "".join(['<table:table-cell><text:p text:style-name="Table_20_Heading">Column %d</text:p></table:table-cell>' % c
+                             for c in range(shape["columns"])])]
+            for row in range(shape["rows"]):
+                rows.append('<table:table-row>%s</table:table-row>'
+                            % "".join(['<table:table-cell><text:p>%s</text:p></table:table-cell>' % Text(3) for c in range(shape["columns"])]))
+            Body.append('<table:table table:name="Table%d_%d"><table:table-column table:number-columns-repeated="%d"/>%s</table:table>'
+                        % (h,t,shape["columns"],"".join(rows)))
+        for l in range(shape["lists"]):
+            Body.append(List(shape["listdepth"]).replace("<text:list>",'<text:list text:style-name="L1">',1))
+        for c in range(shape["code"]):
+            Body.append('<text:p text:style-name="P1">    call_%s(%d);</text:p>' % (r.choice(Words),c))
+
+    content=('<?xml version="1.0" encoding="UTF-8"?><office:document-content %s>%s<office:body><office:text>'
+             '<text:sequence-decls/>%s</office:text></office:body></office:document-content>') % (Namespaces,AutomaticStylesXML,"\n".join(Body))
+    meta=('<?xml version="1.0" encoding="UTF-8"?><office:document-meta %s><office:meta>'
+          '<dc:title>Benchmark document %d</dc:title></office:meta></office:document-meta>') % (Namespaces,shape["headings"])
+    manifest=ManifestXML % "".join(['<manifest:file-entry manifest:full-path="%s" manifest:media-type="image/png"/>' % name for name in Images])
+
+    # mimetype must be the first file, and not compressed
+    odt=zipfile.ZipFile(path,"w",zipfile.ZIP_DEFLATED)
+    try:
+        odt.writestr(zipfile.ZipInfo("mimetype"),"application/vnd.oasis.opendocument.text")
+        odt.writestr("META-INF/manifest.xml",manifest)
+        odt.writestr("content.xml",content)
+        odt.writestr("styles.xml",StylesXML)
+        odt.writestr("meta.xml",meta)
+        for name in Images:
+            odt.writestr(name,ImagePNG)
+    finally:
+        odt.close()
+
+
+# == BENCHMARK ==============
+
+# Convert one document with odt2dita_oasis.py in a new process, so that the peak memory is its own
+# Returns the conversion report, as written with -r
+def ConvertWithReport(InFile,OutDir,Extra=[]):
+    converter=os.path.join(os.path.dirname(os.path.abspath(__file__)),"odt2dita_oasis.py")
+    devnull=open(os.devnull,"w")
+    try:
+        subprocess.check_call([sys.executable,converter,InFile,OutDir,"-r"]+Extra,stdout=devnull,stderr=subprocess.STDOUT)
+    finally:
+        devnull.close()
+    NameRoot=os.path.splitext(os.path.basename(InFile))[0]
+    reportfile=open(os.path.join(OutDir,NameRoot+".report.json"),"rb")
+    try:
+        return json.load(reportfile)
+    finally:
+        reportfile.close()
+
+# Growth exponent of Times over Sizes: the slope of log(time) over log(size), by least squares
+# 1 is linear, 2 quadratic; None if there are not two sizes with a time of at least MinTime
+def GrowthExponent(Sizes,Times,MinTime):
+    points=[(math.log(size),math.log(t)) for (size,t) in zip(Sizes,Times) if t>=MinTime]
+    if len(points)<2:
+        return None
+    meanx=sum([x for (x,y) in points])/len(points)
+    meany=sum([y for (x,y) in points])/len(points)
+    sxx=sum([(x-meanx)**2 for (x,y) in points])
+    if sxx==0:
+        return None
+    return sum([(x-meanx)*(y-meany) for (x,y) in points])/sxx
+
+# Run the benchmark: a document of Shape with headings multiplied by every one of Sizes, converted Repeat times
+# The fastest run of every phase is taken; a phase with a growth exponent over Threshold is flagged
+# Returns the results as a dictionary
+def RunBenchmark(Sizes,Shape={},Repeat=1,Threshold=1.25,MinTime=0.01,WorkDir=None,Extra=[]):
+    shape=dict(DefaultShape)
+    shape.update(Shape)
+    KeepWorkDir=(WorkDir<>None)
+    if WorkDir==None:
+        WorkDir=tempfile.mkdtemp(prefix="odt2dita_bench")
+    Runs=[]
+    try:
+        for size in Sizes:
+            runshape=dict(shape)
+            runshape["headings"]=shape["headings"]*size
+            infile=os.path.join(WorkDir,"bench%d.odt" % size)
+            GenerateODT(infile,runshape)
+            best=None
+            for i in range(Repeat):
+                outdir=os.path.join(WorkDir,"bench%d_%d" % (size,i))
+                # a kept work directory can have the output of an earlier run in it
+                if os.path.isdir(outdir):
+                    shutil.rmtree(outdir)
+                os.makedirs(outdir)
+                report=ConvertWithReport(infile,outdir,Extra)
+                if best==None:
+                    best=report
+                else:
+                    # keep the fastest time of every phase
+                    fastest=dict([(phase["phase"],phase) for phase in best["phases"]])
+                    for phase in report["phases"]:
+                        if phase["phase"] in fastest and phase["wall"]<fastest[phase["phase"]]["wall"]:
+                            fastest[phase["phase"]].update(phase)
+                    if report["total"]["wall"]<best["total"]["wall"]:
+                        best["total"]=report["total"]
+                if not KeepWorkDir:
+                    shutil.rmtree(outdir)
+            print "size %4d: %6d headings, %8.2fs, peak %8d KB" % (size,runshape["headings"],best["total"]["wall"],best["total"]["peak_kb"])
+            Runs.append({"size":size,"shape":runshape,"bytes":os.path.getsize(infile),"report":best})
+            if not KeepWorkDir:
+                os.remove(infile)
+    finally:
+        if not KeepWorkDir:
+            shutil.rmtree(WorkDir,True)
+
+    # phases in the order they first appear
+    PhaseNames=[]
+    for run in Runs:
+        for phase in run["report"]["phases"]:
+            if not phase["phase"] in PhaseNames:
+                PhaseNames.append(phase["phase"])
+
+    Phases=[]
+    for name in PhaseNames:
+        walls=[]
+        peaks=[]
+        for run in Runs:
+            found=[phase for phase in run["report"]["phases"] if phase["phase"]==name]
+            if found==[]:
+                walls.append(0.0)
+                peaks.append(0)
+            else:
+                walls.append(found[0]["wall"])
+                peaks.append(found[0]["peak_kb"])
+        exponent=GrowthExponent(Sizes,walls,MinTime)
+        Phases.append({"phase":name,"wall":walls,"peak_kb":peaks,"exponent":exponent,
+                       "superlinear":exponent<>None and exponent>Threshold})
+    return {"sizes":Sizes,"threshold":Threshold,"runs":Runs,"phases":Phases}
+
+# Print the benchmark results as a table: the time of every phase at every size, and the growth exponent
+def PrintBenchmark(Results):
+    print
+    print "%-36s" % "phase"+"".join(["%10s" % ("x"+str(size)) for size in Results["sizes"]])+"  exponent"
+    for phase in Results["phases"]:
+        if phase["exponent"]==None:
+            exponent="       -"
+        else:
+            exponent="%8.2f" % phase["exponent"]
+        if phase["superlinear"]:
+            exponent=exponent+"  SUPER-LINEAR"
+        print "%-36s" % phase["phase"][:36]+"".join(["%10.3f" % wall for wall in phase["wall"]])+"  "+exponent
+    print "%-36s" % "peak memory, KB"+"".join(["%10d" % run["report"]["total"]["peak_kb"] for run in Results["runs"]])
+    Flagged=[phase["phase"] for phase in Results["phases"] if phase["superlinear"]]
+    if Flagged<>[]:
+        print
+        print "Phases growing faster than size^%.2f: %s" % (Results["threshold"],", ".join(Flagged))
+
+
+# Shape options for the command line, one for every DefaultShape key
+def AddShapeArguments(parser):
+    for key in sorted(DefaultShape.keys()):
+        parser.add_argument("-"+key,type=int,help="default %d" % DefaultShape[key])
+
+def ShapeFromArguments(args):
+    Shape={}
+    for key in DefaultShape.keys():
+        if getattr(args,key)<>None:
+            Shape[key]=getattr(args,key)
+    return Shape
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser("Benchmark for the ODT to DITA converter")
+    subparsers=parser.add_subparsers(dest="command")
+
+    generateparser=subparsers.add_parser("generate",help="write one synthetic ODT document")
+    generateparser.add_argument("outfile",help="the ODT file to write")
+    generateparser.add_argument("-seed",type=int,default=0,help="random seed, default 0")
+    AddShapeArguments(generateparser)
+
+    runparser=subparsers.add_parser("run",help="convert documents of growing size and report the time of every phase; "
+                                    "the peak memory (peak_kb in the JSON) of a phase is the peak of the process at its end, so it never goes down")
+    runparser.add_argument("-sizes",default="1,2,4,8",help="comma separated multipliers for the number of headings, default 1,2,4,8")
+    runparser.add_argument("-repeat",type=int,default=1,help="conversions of every size, the fastest is taken; default 1")
+    runparser.add_argument("-threshold",type=float,default=1.25,help="growth exponent over which a phase is flagged, default 1.25")
+    runparser.add_argument("-mintime",type=float,default=0.01,help="times under this many seconds are ignored for the exponent, default 0.01")
+    runparser.add_argument("-workdir",help="keep the documents and the output in this directory (optional)")
+    runparser.add_argument("-o",help="write the results as JSON to this file (optional)")
+    runparser.add_argument("-ns",help="pass -ns to the converter: do NOT stream content.xml (optional)",action="store_true")
+    AddShapeArguments(runparser)
+
+    args=parser.parse_args()
+
+    if args.command=="generate":
+        GenerateODT(args.outfile,ShapeFromArguments(args),args.seed)
+    else:
+        Sizes=[int(size) for size in args.sizes.split(",")]
+        Extra=[]
+        if args.ns:
+            Extra.append("-ns")
+        if args.workdir<>None and not os.path.isdir(args.workdir):
+            os.makedirs(args.workdir)
+        Results=RunBenchmark(Sizes,ShapeFromArguments(args),args.repeat,args.threshold,args.mintime,args.workdir,Extra)
+        PrintBenchmark(Results)
+        if args.o<>None:
+            outfile=open(args.o,"wb")
+            json.dump(Results,outfile,indent=2,separators=(",",": "))
+            outfile.close()
+        if True in [phase["superlinear"] for phase in Results["phases"]]:
+            sys.exit(1)
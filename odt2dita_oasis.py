@@ -128,36 +128,74 @@
 # 0.41 2014/12/09 Aggressive formula detection mode
 # 0.41 OASIS 1 2016/10/10 OASIS branch
 # 0.42 OASIS 2017/10/04 open source, command line interface, removed skipping boilerplate as it is confusing on small documents, added "notitle"
+# 0.43 OASIS 2026/10/18 performance work for large documents:
+#    content.xml is streamed with pulldom, one top level block at a time (-ns to parse it whole as before)
+#    conversion state moved from globals into a Converter object, options into ConversionOptions;
+#     ConvertODTToDITA() is now a wrapper, several conversions can run in one process
+#    batch mode: many files, directories or manifests (-m) converted on a process pool (-j)
+#    linear time white space collapsing and text accumulation in AddTextAsChild
+#    IDRegistry for AllIDs: set lookup, per base ID suffix counter, report of non-unique topic IDs
+#    BookmarksDuplicate is a union-find forest (BookmarkAliases), chains of ID moves resolve correctly
+#    PostprocessFixNestedParagraphs raises all misplaced <p>s in one pass; CanContainP is a set
+#    TagWalk: postprocessing passes that can share one walk of the tree find their elements together
+#    topic content is moved, not copied, from the initial DOM into the topic DOMs
+#    every topic is written out and freed as soon as it is postprocessed
+#    WriteXML writes topics and the map straight to the file, byte for byte as toxml()
+#    topic files can be written on a pool of threads (-w), errors are reported per file and stop the map
+#    Tk is only imported when the GUI starts (StartGUI), importing the module has no side effects
+#    ConversionLog instead of the DebugText string: lazy formatting, repeats counted, streaming to a file;
+#     the module level debug() and the GUI log into one too
+#    ConversionReport: wall and CPU time of every phase and node/ID counters, written as JSON with -r
+#    odt2dita_bench.py: synthetic ODT generator and scaling benchmark; the report has the process peak memory at the end of every phase
+#    style properties are bitmasks (StyleBits), no set copies for every span
+#    resolved span style properties are cached (SpanStyles), the hit count is in the report
+#    styles cache (-c): the styles from a styles.xml are saved on disk and reused by documents from the same template
+#    style inheritance works whatever order styles are defined in; list types by level are worked out with the styles
+#    PostprocessCodeblock puts every codeblock together once (AssembleCodeblock), linear in the code length
+#    line breaks can split the paragraph while it is read (SplitLinebreaks, -sl), instead of the PostprocessLinebreak pass
+#    adjacent spans with the same formatting go into one element (StartRun in ProcessParagraph)
+#     - a note information string takes off only the separators after it (NoteSeparators), not the start of the next span
+#    otherprops marks kept by node in Converter.Otherprops, no otherprops attributes and no PostprocessRemoveOtherprops
+#    the output is built with light tree nodes (LightNode) instead of minidom, -md for minidom
 
 import xml.dom
 import xml.dom.minidom
+import xml.dom.minicompat
+import xml.dom.pulldom
 import sys
 import os
 import os.path
 import zipfile
-from Tkinter import *
-from Tix import *
-import tkMessageBox
-import tkFont
-import tkFileDialog
 import codecs
 import copy
+import collections
+import re
 import argparse
+import multiprocessing
+import multiprocessing.pool
+import time
+import json
+import threading
+import hashlib
+import cPickle
+import tempfile
+# resource is only there on Unix; without it, the conversion report has no memory figures
+try:
+    import resource
+except ImportError:
+    resource=None
 
 
 
 
 # INPUT DATA
-# This should be replaced with a nice graphical input window
-# And an unzip routine from the original ODT file should be added
-# For now, manually unzip and set InputDirectory to the full path to unzipped ODT
+# These are the options set by the GUI or the command line
+# Since 0.43 they are only the defaults for a ConversionOptions object, which is what the conversion uses
 
 InputFile="NOT SELECTED"
 
 OutputDirectory="NOT SELECTED"
 
-# Frame Mode - use "headingN" style names as heading indicators
-
 # Skip the first amount of output sections
 # Useful for skipping boilerplate
 SkipOutputSections=0
@@ -173,40 +211,39 @@ NameRoot=""
 DebugLevel=3
 
 # Options added in 0.36
-#DoNotPrefix=False
+DoNotPrefix=False
 #UsePrettyXml=False
 
 # Added in 0.41
 AggressiveFormula=False
 
-# GLOBAL DATA
-
-# Document title - to be worked out from meta.xml
-DocumentTitle=""
+# Added in 0.43
+# Read content.xml as a stream, expanding one top level block at a time, instead of parsing it whole
+# This keeps memory use down on large documents
+StreamContent=True
 
-# Bookmarks dictionary
-# Key is the bookmark name, as in document
-# Member is a tuple (DocID,reference_in_document)
-BookmarksDictionary={}
+# Split the output paragraph at every line break while reading it (see ProcessParagraph), instead of leaving
+# a <temp:linebreak> to PostprocessLinebreak; much faster on documents with many line breaks
+# Off by default: the output is not yet always the same as with the postprocessing pass,
+# see BreakParagraph in ProcessParagraph for the differences
+SplitLinebreaks=False
 
-# Duplicate bookmarks
-# While the bookmark is normally just saved as the ID of the parent paragraph or title, there can be two bookmarks for one
-# This dictionary is used in this case
-BookmarksDuplicate={}
+# Build the output (the initial output DOM and the topics) with the light tree nodes, see LightNode,
+# instead of minidom; False uses minidom, which is slower and takes more memory
+LightTree=True
 
-# Styles dictionary
-# Key is the style name, and member is a set of keywords with the style properties
-# Style properties defined as of this version: "bold", "italic", "monospace","note"
-# "notbold","notitalic","notmonospace","uicontrol","caption","header"
-StylesDictionary={"":set([])}
+# Directory for the styles cache, "" for none
+# The styles worked out from a styles.xml are saved there, and documents with the same styles.xml
+# (from the same template) and the same options skip parsing it; see Converter.ReadStylesCache
+StylesCacheDir=""
 
+# Write a report of the time spent in every phase of the conversion, and counters, as <NameRoot>.report.json
+# next to the ditamap; see ConversionReport
+WriteReport=False
 
-# Outline levels for styles
-#StylesOutlineLevels={"":0}
-
-# This counter is increased when starting to process a table, decreased when ending the table.
-# !!!!!!!!!! this is not a proper solution !!!!!!!!!!!!!
-InTable=0
+# Number of threads writing out topic files; with 1, topics are written one after another
+# More threads help when the output directory is slow to open and close files in, such as a network share
+WriteThreads=1
 
 # Frame Mode - use "headingN" style names as headings
 FrameMode=False
@@ -218,18 +255,13 @@ TaskPost=False
 ReplaceBoldWith=""
 ReplaceItalicWith=""
 
-# Frame Mode styles dictionary
-# Used only in Frame Mode
-# Contains only styles with "headingN" in name or if the parent style is in the list
-# The value is an integer - the heading level
-
-FrameModeStylesDictionary={}
+# STATIC DATA
 
 # Style tags
 # This is a dictionary of tags by which style properties are represented
 # At present this is static
 # NOTE: for "off" styles this is the tag thagt is to be turned off
-# NOTE: for "otherprops" styles this is the string added to the otherprops attribute
+# NOTE: for "otherprops" styles this is not used since 0.43, see Converter.Otherprops
 StyleTags={"bold":"b","italic":"i","monospace":"codeph","note":"note",
            "notbold":"b","notitalic":"i","notmonospace":"codeph","uicontrol":"uicontrol",
            "caption":"caption","header":"header"}
@@ -247,46 +279,52 @@ StylesCharacterOff=set(["notbold","notitalic","notmonospace"])
 StylesParagraph=set(["note"])
 
 # Which style properties are "otherprops" styles. They are paragraph level styles and
-# reflected by adding a string to the "otherprops" attribute of the <p> or other parent tag,
-# for use in postprocessing
+# reflected by marking the <p> or other parent tag, for use in postprocessing
+# 0.43: the marks are kept in Converter.Otherprops, not in an "otherprops" attribute
 StylesOtherprops=set(["caption","header","monospace"])
 
-# List styles are handled separately because each has a number of levels
-# We take a "dictionary of dictionaries" approach
-# Each member in the ListStylesDictionary is a dictionary of level to string
-# String can be "number" or "bullet"
-ListStylesDictionary={"":{}}
-
-# Current list level and stack of list style names
-# FIXME: use of globals is probably not a good idea
-CurrentListLevel=0
-ListStyleNamesStack=[""]
-
-# Output DOMs
-# This is a list of tuples (DOM, level)
-# DOM is the output DOM
-# level is the outline level
-# note we do not save DOM IDs separately, to avoid complicated data structures
-OutputDOMs=[]
-
-# Automatically created IDs
-# We often need to replace the ID of a topic - other tags too perhaps in later versions
-# that was first created as automatic. In such cases we need to ensure that the ID is indeed
-# automatic. If the ID to be replaced is already from the document we have a non-standard situation
-AutoCreatedIDs=[]
-
-# All IDs, auto-created and otherwise
-# This is here to catch non-unique IDs, which should not happen anyhow
-# A non-unique ID may lead to a non-unique file name and other glitches, so is a non-standard situation
-AllIDs=[]
-
-# ID counter. For use in autocreating IDs; increases each time an ID is autocreated
-# Initiated with 0 because the very first output DOM is somewhat likely to be empty
-#  (and therefore not output to a DITA file)
-AutoID_Counter=0
-
-# 0.38 additional files to unzip
-ToUnzip=set([])
+# Style properties as bits of an integer, added in 0.43
+# The conversion keeps the properties of a style as one int, so working out the properties of a span
+# is a few integer operations instead of copying and combining sets
+# The bits of the character styles are in the order their tags are nested in, which is the order the sets gave
+StyleBitNames=["monospace","uicontrol","bold","italic","notbold","notitalic","notmonospace","note","caption","header"]
+StyleBits=dict([(name,1<<i) for (i,name) in enumerate(StyleBitNames)])
+
+# The bits for a collection of style property names
+def StyleMask(names):
+    mask=0
+    for name in names:
+        mask=mask|StyleBits[name]
+    return mask
+
+MaskCharacter=StyleMask(StylesCharacter)
+MaskCharacterOff=StyleMask(StylesCharacterOff)
+MaskParagraph=StyleMask(StylesParagraph)
+MaskOtherprops=StyleMask(StylesOtherprops)
+
+# For every combination of "off" bits, the character bits that they switch off
+CharacterOffMasks={}
+for offmask in range(0,MaskCharacterOff+1):
+    if offmask & ~MaskCharacterOff:
+        continue
+    CharacterOffMasks[offmask]=0
+    for name in StylesCharacterOff:
+        if offmask & StyleBits[name]:
+            CharacterOffMasks[offmask]=CharacterOffMasks[offmask] | StyleBits[name[3:]]
+
+# The StyleTags of the properties in a mask, in bit order; made once for every mask
+def StyleMaskTags(mask):
+    try:
+        return StyleMaskTagLists[mask]
+    except KeyError:
+        tags=tuple([StyleTags[name] for name in StyleBitNames if mask & StyleBits[name]])
+        StyleMaskTagLists[mask]=tags
+        return tags
+
+StyleMaskTagLists={}
+
+# Version of the styles cache files; change it when what ProcessStylesNode works out changes
+StylesCacheVersion=2
 
 # Tags to ignore
 # Tags that, when found in text or other places, are to be ignored
@@ -297,51 +335,69 @@ TagsToIgnore=["text:table-of-content",  # Ignore the TOC
               "office:forms",
               "text:bookmark-end"]
 
-# Current output DOM and its <body>
-# FIXME: keeping the current output DOM global is not a good solution - only a simple one
-InitialOutputDOM=None
-InitialOutputBody=None
-CurrentOutputTitle=None
+# Which tags can contain <p>, for PostprocessFixNestedParagraphs
+# WARNING: This is from DITA help and IS PROBABLY TOO MUCH
+# If illicit <p>s show up, the tag om which they show up must be removed from here
+# 0.43: a set, as it is checked for every <p>
+CanContainP=set(["dita","data","title","shortdesc","desc","note","lq","q","sli",
+                 "li","itemgroup","dthd","ddhd","dt","dd","fig","figgroup","pre",
+                 "lines","ph","alt","object","stentry","draft-comment","fn",
+                 "indexterm","index-base","cite","xref","table","tgroup","entry",
+                 "author","source","publisher","copyright","copyrholder","category",
+                 "keywords","prodinfo","prodname","brand","series","platform","prognum",
+                 "featnum","component","topic","navtitle","searchtitle","abstract",
+                 "body","section","example","prolog","metadata","related-links",
+                 "linktext","linkinfo","linkpool","concept","conbody","task","taskbody",
+                 "prereq","context","steps","steps-unordered","step","cmd","info",
+                 "substeps","substep","tutorialinfo","stepxmp","choice","chhead",
+                 "choptionhd","chdeschd","chrow","choption","chdesc","stepresult","result",
+                 "postreq","reference","refbody","refsyn","properties","prophead",
+                 "proptypehd","propvaluehd","propdeschd","property","proptype","propvalue",
+                 "propdesc","glossentry","glossterm","glossdef","uicontrol","screen",
+                 "tt","sup","sub","codeph","codeblock","var","synph","oper","delim","sep",
+                 "parml","plentry","pt","pd","syntaxdiagram","synblk","groupseq",
+                 "groupchoice","groupcomp","fragment","fragref","synnote","repsep",
+                 "msgph","msgblock","filepath","userinput","systemoutput","area","coords",
+                 "index-see","index-see-also","index-sort-as"])
+
+
+# A run of white space, as collapsed by AddTextAsChild
+# With re.UNICODE this matches exactly the characters for which isspace() is true
+WhiteSpaceRun=re.compile(r"\s+",re.UNICODE)
+
+# Note information strings, for PostprocessNotes and PostprocessNotesFromParagraphs
+NoteTypes=["note","attention","caution","danger","fastpath","important",
+           "remember","restriction","tip"]
 
-# Current output DOM's <keywords>
-# FIXME: do not use a global?
-# set to None until the thing is actually created
-CurrentOutputKeywords=None
+# Punctuation between a note information string and the note text, removed with the string (and white space)
+# 0.43: only these - other characters that can start text, like "(", "[", "&" or quotes, are kept
+NoteSeparators=u":;,.!-\u2013\u2014"
 
 # === SERVICE FUNCTIONS ====================
+# These do not depend on the conversion state
 
-# Debug output, with its global
-DebugText=""
+# Debug output for the user interface, with its global
+# 0.43: the messages go into a ConversionLog, like those of a conversion; NewLog starts a new one,
+#  and ConvertODTToDITA does so and gives it to the Converter, so the conversion logs into it too
+Log=None
 
-def debug(level,message):
-    global DebugText
-    if level<=DebugLevel:
-        DebugText=DebugText+message+"\n"
+def NewLog():
+    global Log
+    Log=ConversionLog(DebugLevel)
+    return Log
+
+# If args are given, the message is formatted with them, only when it is to be logged
+def debug(level,message,*args):
+    if Log==None:
+        NewLog()
+    Log.Write(level,message,args)
 
-# Report an unprocessed tag in a parent tag, unless it's to be ignored
-def unprocessed(parenttag,tag):
-    if not (tag in TagsToIgnore):
-        debug(3,"Unprocessed tag in "+parenttag+" : "+tag)
 
 # copy attributes from input node to output node - assume both are elements
+# 0.43: items() works for minidom and light tree nodes
 def CopyAttributes(InputNode,OutputNode):
-    for i in range(0,InputNode.attributes.length):
-        attr=InputNode.attributes.item(i)
-        OutputNode.setAttribute(attr.nodeName,attr.value)
-
-
-
-
-# Carefully destroy a node and all its child nodes - remove from tree and unlink
-# Save the ID (or any child node ID) to the parent node
-def DestroyNode(node):
-    while node.firstChild<>None:
-        #print "destroying a child node"
-        DestroyNode(node.firstChild)
-
-    SaveId(node)
-    node.parentNode.removeChild(node)
-    node.unlink()
+    for name,value in InputNode.attributes.items():
+        OutputNode.setAttribute(name,value)
 
 # Find the first text node under the node
 # If the node is text or None return itself; if the none is non-text and non-element/doc return None
@@ -377,3014 +433,4326 @@ def FindLastText(node):
         return result
     else:
         return None
+    
+# Service for postprocessing
+# Determine if a DITA node, presumed to be a paragraph-like entity (<p> or like it)
+# contains only stuff allowed in a "plain" paragraph, without images or anything, thus suitable
+# for a title, codeblock, etc
+# always true for non-Element nodes (this simplifies recursion)
+# IMPORTANT: relies on <p>s not being nested, so only for use after PostprocessFixNestedParagraphs
+
+def IsSimpleParagraph(node):
+    result=True
+    if node.nodeType==xml.dom.Node.ELEMENT_NODE:
+        if node.tagName in ["p","codeph","b","i"]:  # the usual formatting in a simple paragraph
+            # check all child nodes
+            for childnode in node.childNodes:
+                result=(result and IsSimpleParagraph(childnode))
+        else: # a different tag found - not a simple paragraph
+            result=False
+    return result
+
+# Service: get the text content of a node, as one string
+def GetTextAsString(node):
+    if node.nodeType==xml.dom.Node.TEXT_NODE:
+        return node.data
+    elif node.nodeType==xml.dom.Node.ELEMENT_NODE:
+        result=""
+        for childnode in node.childNodes:
+            result=result+GetTextAsString(childnode)
+        return result
 
+# Service: do a replace in the text content of a node
+# FIXME: does not handle cases when the replace would straddle text nodes
+def ReplaceText(node,old,new):
+    if node.nodeType==xml.dom.Node.TEXT_NODE:
+        node.data=node.data.replace(old,new)
+    elif node.nodeType in [xml.dom.Node.ELEMENT_NODE,xml.dom.Node.DOCUMENT_NODE]:
+        for childnode in node.childNodes:
+            ReplaceText(childnode,old,new)
+                
 
-# Move all child nodes from InputNode to OutputNode, to follow its existing children
-# Merge text nodes (this is done by built-in normalize method)
-# If TextSeparator is present, place the text between the original children and the moved ones
-# NOTE: does not delete InputNode even though strips it of all children
-def MoveChildNodes(InputNode,OutputNode,TextSeparator=''):
+# Service: remove the nodes in Nodes from their parents and unlink them
+# Done in one pass over the children of every parent: removeChild() searches the children for every node,
+#  which is slow when many nodes are removed from a parent with many children
+def RemoveNodes(Nodes):
+    Parents={}
+    for node in Nodes:
+        parent=node.parentNode
+        if not parent in Parents:
+            Parents[parent]=set([])
+        Parents[parent].add(node)
+    for parent,removed in Parents.iteritems():
+        Children=[node for node in parent.childNodes if not node in removed]
+        previous=None
+        for node in Children:
+            node.previousSibling=previous
+            if previous<>None:
+                previous.nextSibling=node
+            previous=node
+        if previous<>None:
+            previous.nextSibling=None
+        parent.childNodes[:]=Children
+    for node in Nodes:
+        node.parentNode=None
+        node.previousSibling=None
+        node.nextSibling=None
+        node.unlink()
 
-    # add TextSeparator    
-    if TextSeparator<>"":
-        newnode=InitialOutputDOM.createTextNode(TextSeparator)
-        OutputNode.appendChild(newnode)
+# Service: find all descendant elements of node with any of TagNames in one walk
+# Returns a dictionary from tag name to the list of elements, each list in document order,
+#  so Found[tag] is the same as node.getElementsByTagName(tag)
+# If Report is given, the nodes walked are counted in it as "nodes visited"
+def GetElementsByTagNames(node,TagNames,Report=None):
+    Found={}
+    for tag in TagNames:
+        Found[tag]=[]
+    visited=0
+    stack=list(reversed(node.childNodes))
+    while stack:
+        node=stack.pop()
+        visited=visited+1
+        if node.nodeType==xml.dom.Node.ELEMENT_NODE:
+            if node.tagName in Found:
+                Found[node.tagName].append(node)
+            if node.childNodes:
+                stack.extend(reversed(node.childNodes))
+    if Report<>None:
+        Report.Count("nodes visited",visited)
+    return Found
+
+# Service: the number of descendant nodes of node
+def CountNodes(node):
+    count=0
+    stack=list(node.childNodes)
+    while stack:
+        node=stack.pop()
+        count=count+1
+        if node.childNodes:
+            stack.extend(node.childNodes)
+    return count
+
+# Service: write a DOM out as XML to a file opened in binary mode
+# The bytes are the same as from DOM.toxml(encoding); added in 0.43 to write straight to the file,
+#  without making the whole document into a string and then decoding and encoding it again
+# Text is written out in parts of up to XMLWriteParts strings
+def WriteXML(DOM,outfile,encoding="utf-8"):
+    parts=[u'<?xml version="1.0" encoding="%s"?>' % encoding]
+
+    def Flush():
+        outfile.write(u"".join(parts).encode(encoding))
+        del parts[:]
+
+    def WriteNode(node):
+        if len(parts)>=XMLWriteParts:
+            Flush()
+        if node.nodeType==xml.dom.Node.ELEMENT_NODE:
+            parts.append(u"<"+node.tagName)
+            for name,value in sorted(node.attributes.items()):
+                parts.append(u' %s="%s"' % (name,EscapeXML(value)))
+            if node.childNodes:
+                parts.append(u">")
+                for childnode in node.childNodes:
+                    WriteNode(childnode)
+                parts.append(u"</%s>" % node.tagName)
+            else:
+                parts.append(u"/>")
+        elif node.nodeType==xml.dom.Node.TEXT_NODE:
+            parts.append(EscapeXML(node.data))
+        elif node.nodeType==xml.dom.Node.DOCUMENT_TYPE_NODE:
+            parts.append(DoctypeString(node))
+        else:
+            parts.append(node.toxml())
+
+    for node in DOM.childNodes:
+        WriteNode(node)
+    Flush()
+
+XMLWriteParts=4096
+
+# Service: escape text or an attribute value for WriteXML, as minidom does
+def EscapeXML(data):
+    if XMLEscapeChars.search(data)==None:
+        return data
+    return data.replace("&","&amp;").replace("<","&lt;").replace("\"","&quot;").replace(">","&gt;")
+
+XMLEscapeChars=re.compile(u'[&<">]')
+
+# Service: the <!DOCTYPE> declaration for WriteXML, as minidom writes it
+# There are only a few document types, so the string is made once for each
+def DoctypeString(node):
+    key=(node.name,node.publicId,node.systemId,node.internalSubset)
+    if not key in DoctypeStrings:
+        DoctypeStrings[key]=node.toxml()
+    return DoctypeStrings[key]
+
+DoctypeStrings={}
+
+# One tree walk shared by several postprocessing passes
+# Each pass registers the tag names it scans and a handler; Run finds the elements for all the tag names
+# in one walk, then calls every handler, in the order registered, with the dictionary from GetElementsByTagNames
+# So a pass sees the elements as they were before the passes registered before it had run.
+# A pass can only be registered after passes that do not create, reorder or rename elements with its tag names.
+# Removed elements are fine if the pass skips elements with no children, as unlink() removes the children
+# With a Report, the walk is timed as the "TagWalk" phase and every handler as the phase named when registering it
+class TagWalk(object):
+    def __init__(self,Report=None):
+        self.Report=Report
+        self.TagNames=set()
+        self.Handlers=[]
+
+    def Register(self,TagNames,Handler,Name=None):
+        self.TagNames.update(TagNames)
+        self.Handlers.append((Handler,Name))
+
+    def Run(self,DOM):
+        if self.Report==None:
+            Found=GetElementsByTagNames(DOM,self.TagNames)
+            for Handler,Name in self.Handlers:
+                Handler(Found)
+            return
+        with self.Report.Phase("TagWalk"):
+            Found=GetElementsByTagNames(DOM,self.TagNames,self.Report)
+        for Handler,Name in self.Handlers:
+            with self.Report.Phase(Name):
+                Handler(Found)
 
-    # move nodes
-    while InputNode.hasChildNodes():
-        OutputNode.appendChild(InputNode.firstChild)
 
-    # Normalize text nodes
+# Final processing: rename all tags with a certain name to another name
+def FinalTagRename(DOM,OldName,NewName):
+    NodesToRename=[]
+    for RNode in DOM.getElementsByTagName(OldName):
+        NodesToRename.append(RNode)
+    for RNode in NodesToRename:
+        RNode.tagName=NewName
 
-    OutputNode.normalize()
+# == LIGHT OUTPUT TREE ==============================
+# Added in 0.43: nodes for the output DOMs (the initial output DOM and the topics) that are lighter than minidom
+# A minidom element has an instance dictionary, a dictionary of attributes (and one more for namespaces)
+# and a NodeList, and every call checks node types and clears ID caches. A document of 100000 nodes
+# is all of that 100000 times, and every pass pays for the checks.
+# These nodes have __slots__, get a dictionary of attributes only when an attribute is set, and have
+# just the part of the minidom API that the conversion uses, behaving as minidom does:
+# - childNodes is the list of children, changed in place, so a loop over it sees changes as it would in minidom
+# - parentNode, previousSibling and nextSibling are attributes kept up to date, as RemoveNodes expects
+# - getAttribute() gives "" for a missing attribute, removeAttribute() raises NotFoundErr for one
+# - unlink() takes the tree apart, normalize() joins and drops text nodes the same way
+# - getElementsByTagName() gives a NodeList, so item() and length work
+# A light document can hold a minidom DocumentType node. WriteXML writes a light document as it does a minidom one.
+# Used when the LightTree option is on; the input documents are always minidom
+
+class LightNode(object):
+    __slots__=("parentNode","previousSibling","nextSibling","ownerDocument")
+    childNodes=()
+    firstChild=None
+    lastChild=None
+
+    def hasChildNodes(self):
+        return False
+
+    def unlink(self):
+        self.parentNode=None
+        self.ownerDocument=None
+        self.previousSibling=None
+        self.nextSibling=None
+
+class LightText(LightNode):
+    __slots__=("data",)
+    nodeType=xml.dom.Node.TEXT_NODE
+    nodeName="#text"
+
+    def __init__(self,data,ownerDocument=None):
+        self.data=data
+        self.parentNode=None
+        self.previousSibling=None
+        self.nextSibling=None
+        self.ownerDocument=ownerDocument
+
+# A node with children: an element or a document
+class LightParent(LightNode):
+    __slots__=("childNodes",)
+
+    def __init__(self,ownerDocument=None):
+        self.childNodes=[]
+        self.parentNode=None
+        self.previousSibling=None
+        self.nextSibling=None
+        self.ownerDocument=ownerDocument
+
+    @property
+    def firstChild(self):
+        if self.childNodes:
+            return self.childNodes[0]
+        return None
 
+    @property
+    def lastChild(self):
+        if self.childNodes:
+            return self.childNodes[-1]
+        return None
 
-# Get the element child of a DOM
-def GetElementChild(DOM):
-    for childnode in DOM.childNodes:
-        if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-            return childnode
-    debug(1,"GetElementChild failed to get element child")
-    return None
-            
-        
+    def hasChildNodes(self):
+        return len(self.childNodes)>0
 
+    def appendChild(self,newChild):
+        if newChild.parentNode<>None:
+            newChild.parentNode.removeChild(newChild)
+        if self.childNodes:
+            last=self.childNodes[-1]
+            newChild.previousSibling=last
+            last.nextSibling=newChild
+        else:
+            newChild.previousSibling=None
+        self.childNodes.append(newChild)
+        newChild.nextSibling=None
+        newChild.parentNode=self
+        return newChild
+
+    def insertBefore(self,newChild,refChild):
+        if newChild.parentNode<>None:
+            newChild.parentNode.removeChild(newChild)
+        if refChild==None:
+            return self.appendChild(newChild)
+        try:
+            index=self.childNodes.index(refChild)
+        except ValueError:
+            raise xml.dom.NotFoundErr()
+        self.childNodes.insert(index,newChild)
+        newChild.nextSibling=refChild
+        refChild.previousSibling=newChild
+        if index:
+            node=self.childNodes[index-1]
+            node.nextSibling=newChild
+            newChild.previousSibling=node
+        else:
+            newChild.previousSibling=None
+        newChild.parentNode=self
+        return newChild
+
+    def removeChild(self,oldChild):
+        # taking the last child off is the usual case, and needs no search
+        if self.childNodes and self.childNodes[-1] is oldChild:
+            self.childNodes.pop()
+        else:
+            try:
+                self.childNodes.remove(oldChild)
+            except ValueError:
+                raise xml.dom.NotFoundErr()
+        if oldChild.nextSibling<>None:
+            oldChild.nextSibling.previousSibling=oldChild.previousSibling
+        if oldChild.previousSibling<>None:
+            oldChild.previousSibling.nextSibling=oldChild.nextSibling
+        oldChild.nextSibling=None
+        oldChild.previousSibling=None
+        oldChild.parentNode=None
+        return oldChild
+
+    def getElementsByTagName(self,name):
+        Found=xml.dom.minicompat.NodeList()
+        stack=list(reversed(self.childNodes))
+        while stack:
+            node=stack.pop()
+            if node.nodeType==xml.dom.Node.ELEMENT_NODE:
+                if name=="*" or node.tagName==name:
+                    Found.append(node)
+                if node.childNodes:
+                    stack.extend(reversed(node.childNodes))
+        return Found
+
+    # as minidom's Node.normalize()
+    def normalize(self):
+        L=[]
+        for child in self.childNodes:
+            if child.nodeType==xml.dom.Node.TEXT_NODE:
+                if not child.data:
+                    # empty text node; discard
+                    if L:
+                        L[-1].nextSibling=child.nextSibling
+                    if child.nextSibling<>None:
+                        child.nextSibling.previousSibling=child.previousSibling
+                    child.unlink()
+                elif L and L[-1].nodeType==xml.dom.Node.TEXT_NODE:
+                    # collapse text node
+                    node=L[-1]
+                    node.data=node.data+child.data
+                    node.nextSibling=child.nextSibling
+                    if child.nextSibling<>None:
+                        child.nextSibling.previousSibling=node
+                    child.unlink()
+                else:
+                    L.append(child)
+            else:
+                L.append(child)
+                if child.nodeType==xml.dom.Node.ELEMENT_NODE:
+                    child.normalize()
+        self.childNodes[:]=L
+
+    def unlink(self):
+        for childnode in self.childNodes:
+            childnode.unlink()
+        self.childNodes=[]
+        LightNode.unlink(self)
+
+class LightElement(LightParent):
+    __slots__=("tagName","Attributes")
+    nodeType=xml.dom.Node.ELEMENT_NODE
+
+    def __init__(self,tagName,ownerDocument=None):
+        LightParent.__init__(self,ownerDocument)
+        self.tagName=tagName
+        self.Attributes=None
+
+    @property
+    def nodeName(self):
+        return self.tagName
+
+    # The attributes as a dictionary from name to value (minidom gives a NamedNodeMap; items() works on both)
+    @property
+    def attributes(self):
+        if self.Attributes==None:
+            return {}
+        return self.Attributes
+
+    def getAttribute(self,name):
+        if self.Attributes==None:
+            return ""
+        return self.Attributes.get(name,"")
+
+    def setAttribute(self,name,value):
+        if self.Attributes==None:
+            self.Attributes={}
+        self.Attributes[name]=value
+
+    def hasAttribute(self,name):
+        return self.Attributes<>None and name in self.Attributes
+
+    def removeAttribute(self,name):
+        if self.Attributes==None or not name in self.Attributes:
+            raise xml.dom.NotFoundErr()
+        del self.Attributes[name]
+
+    def unlink(self):
+        self.Attributes=None
+        LightParent.unlink(self)
+
+# A document with a root element named RootTagName, and the given DocumentType node if any,
+#  as from impl.createDocument(None,RootTagName,Doctype)
+class LightDocument(LightParent):
+    __slots__=()
+    nodeType=xml.dom.Node.DOCUMENT_NODE
+
+    def __init__(self,RootTagName,Doctype=None):
+        LightParent.__init__(self)
+        if Doctype<>None:
+            self.appendChild(Doctype)
+        self.appendChild(self.createElement(RootTagName))
+
+    def createElement(self,tagName):
+        return LightElement(tagName,self)
+
+    def createTextNode(self,data):
+        return LightText(data,self)
+
+# == CONVERSION OPTIONS AND STATE ==============================
+# Added in 0.43 so that conversions are independent of each other - several can run
+# in one process, in threads or one after another, without resetting globals
+
+# Options for one conversion
+# A new object takes the module level option values above as defaults
+class ConversionOptions(object):
+    def __init__(self):
+        self.InputFile=InputFile
+        self.OutputDirectory=OutputDirectory
+        self.SkipOutputSections=SkipOutputSections
+        self.Process_AntiquaAsBold=Process_AntiquaAsBold
+        self.Process_DeleteBadLinks=Process_DeleteBadLinks
+        self.NameRoot=NameRoot
+        self.DebugLevel=DebugLevel
+        self.DoNotPrefix=DoNotPrefix
+        self.AggressiveFormula=AggressiveFormula
+        self.StreamContent=StreamContent
+        self.SplitLinebreaks=SplitLinebreaks
+        self.LightTree=LightTree
+        self.WriteThreads=WriteThreads
+        self.WriteReport=WriteReport
+        self.StylesCacheDir=StylesCacheDir
+        self.FrameMode=FrameMode
+        self.TaskPost=TaskPost
+        self.ReplaceBoldWith=ReplaceBoldWith
+        self.ReplaceItalicWith=ReplaceItalicWith
+
+# Registry of the IDs used in a conversion, auto-created and otherwise
+# Membership is a set lookup; for every base ID Unique keeps the last numeric suffix tried,
+# so that a title repeated many times does not probe base1, base2... from the start every time
+# Collisions is a list of (base ID, issued ID) for every ID that had to be made unique
+class IDRegistry(object):
+    def __init__(self):
+        self.IDs=set()
+        self.NextSuffix={}
+        self.Collisions=[]
+
+    def __contains__(self,ID):
+        return ID in self.IDs
+
+    def __len__(self):
+        return len(self.IDs)
+
+    # Register an ID as is; returns False if it was already registered
+    def Add(self,ID):
+        if ID in self.IDs:
+            return False
+        self.IDs.add(ID)
+        return True
+
+    # Register and return a unique ID based on IDbase - IDbase itself if free,
+    # otherwise IDbase with the lowest number suffix (from 1) that is free
+    # IDs are never removed, so a suffix found taken once stays taken and need not be tried again
+    def Unique(self,IDbase):
+        if not IDbase in self.IDs:
+            self.IDs.add(IDbase)
+            return IDbase
+        n=self.NextSuffix.get(IDbase,1)
+        while IDbase+str(n) in self.IDs:
+            n=n+1
+        ID=IDbase+str(n)
+        self.NextSuffix[IDbase]=n+1
+        self.IDs.add(ID)
+        self.Collisions.append((IDbase,ID))
+        return ID
+
+# Bookmark IDs that no longer have an element of their own, and the IDs they now point to
+# Kept as a union-find forest: every alias points to another ID, and Find follows the pointers
+# to the ID that is really in the document, shortening the path as it goes
+# An ID pointing to None is a broken link
+# Used to be a dictionary in which every move rescanned all entries to repoint them
+class BookmarkAliases(object):
+    def __init__(self):
+        self.Parent={}
+
+    def __iter__(self):
+        return iter(self.Parent)
+
+    def __len__(self):
+        return len(self.Parent)
+
+    # Return the ID that ID resolves to, or None if the link is broken
+    def Find(self,ID):
+        root=ID
+        while root in self.Parent:
+            nextID=self.Parent[root]
+            if nextID==root:
+                break
+            root=nextID
+            if root==None:
+                break
+        # path compression
+        while ID<>root and ID in self.Parent and self.Parent[ID]<>ID:
+            nextID=self.Parent[ID]
+            self.Parent[ID]=root
+            ID=nextID
+        return root
+
+    # Make ID an alias of Target, together with everything that already pointed to ID
+    # Target None breaks the links
+    def Set(self,ID,Target):
+        if Target==None:
+            self.Parent[ID]=None
+            return
+        root=self.Find(Target)
+        if root==ID:
+            # Target was itself an alias of ID - make Target the real one
+            del self.Parent[Target]
+            root=Target
+        self.Parent[ID]=root
+
+# The log of one conversion, replacing the DebugText string in 0.43
+# A message is only formatted (message % args) if its level is not over Level
+# A message that has already been logged is not logged again, only counted; WriteRepeats logs the counts
+# under a "Repeated messages:" line, and so does Close for any repeats since
+# Every line is written to Stream (a file) and passed to Callback (a function) if these are set,
+# and the last MaxLines lines are kept for Text
+class ConversionLog(object):
+    def __init__(self,Level,Stream=None,Callback=None,MaxLines=10000):
+        self.Level=Level
+        self.Stream=Stream
+        self.Callback=Callback
+        self.Lines=collections.deque(maxlen=MaxLines)
+        self.LinesDropped=0
+
+        # Repeats of every message logged, in the order first logged
+        # Only up to MaxCounted different messages are counted, after that all are logged as they come
+        self.Repeats=collections.OrderedDict()
+        self.MaxCounted=MaxLines
+
+    def Write(self,level,message,args=()):
+        if level>self.Level:
+            return
+        if args:
+            message=message % args
+        if message in self.Repeats:
+            self.Repeats[message]=self.Repeats[message]+1
+            return
+        if len(self.Repeats)<self.MaxCounted:
+            self.Repeats[message]=0
+        self.WriteLine(message)
+
+    def WriteLine(self,line):
+        if len(self.Lines)==self.Lines.maxlen:
+            self.LinesDropped=self.LinesDropped+1
+        self.Lines.append(line)
+        if self.Stream<>None:
+            self.Stream.write(line+"\n")
+        if self.Callback<>None:
+            self.Callback(line)
+
+    # Log the counts of repeated messages, and start counting anew
+    def WriteRepeats(self):
+        Repeated=[(message,repeats) for message,repeats in self.Repeats.iteritems() if repeats>0]
+        if Repeated<>[]:
+            self.WriteLine("Repeated messages:")
+            for message,repeats in Repeated:
+                self.WriteLine(message+" (repeated "+str(repeats)+" more times)")
+        self.Repeats.clear()
+
+    def Close(self):
+        self.WriteRepeats()
+
+    # The lines kept, as one string
+    def Text(self):
+        text="".join([line+"\n" for line in self.Lines])
+        if self.LinesDropped>0:
+            text="("+str(self.LinesDropped)+" earlier lines not kept)\n"+text
+        return text
+
+# Wall and CPU time of every phase of one conversion, and counters; added in 0.43
+# For every phase, the peak memory use of the process at its end is kept too, so the phase where it grows shows
+# A phase is timed with "with Report.Phase(name):"; phases nest, and the time of a nested phase
+# is not counted in the enclosing one, so the phase times add up to the total
+# A phase that runs several times (like a pass over every topic) adds up its times and counts its calls
+# Phase must only be used on the thread that runs the conversion; other threads use AddTime,
+# and as the CPU time is for the whole process, it overlaps with that of the phases running at the time
+class ConversionReport(object):
+    def __init__(self):
+        self.Phases=collections.OrderedDict()
+        self.Counters=collections.OrderedDict()
+        for name in ["nodes visited","nodes created","nodes moved","IDs moved"]:
+            self.Counters[name]=0
+        self.Running=[]
+        self.Lock=threading.Lock()
+        self.StartWall=time.time()
+        self.StartCPU=CPUTime()
+
+    def Phase(self,Name):
+        return ReportPhase(self,Name)
+
+    def AddTime(self,Name,Wall,CPU):
+        peak=PeakMemory()
+        with self.Lock:
+            if not Name in self.Phases:
+                self.Phases[Name]=[0.0,0.0,0,0]
+            times=self.Phases[Name]
+            times[0]=times[0]+Wall
+            times[1]=times[1]+CPU
+            times[2]=times[2]+1
+            times[3]=max(times[3],peak)
+
+    def Count(self,Name,n=1):
+        self.Counters[Name]=self.Counters.get(Name,0)+n
+
+    # The report as a dictionary, the way it is written out as JSON
+    def AsDict(self):
+        phases=[]
+        with self.Lock:
+            for name,(wall,cpu,calls,peak) in self.Phases.iteritems():
+                phases.append(collections.OrderedDict([("phase",name),("wall",round(wall,6)),
+                                                       ("cpu",round(cpu,6)),("calls",calls),("peak_kb",peak)]))
+        total=collections.OrderedDict([("wall",round(time.time()-self.StartWall,6)),
+                                       ("cpu",round(CPUTime()-self.StartCPU,6)),("peak_kb",PeakMemory())])
+        return collections.OrderedDict([("phases",phases),("counters",self.Counters),("total",total)])
+
+    def Write(self,path,**Extra):
+        Report=collections.OrderedDict(Extra)
+        Report.update(self.AsDict())
+        outfile=open(path,"wb")
+        try:
+            json.dump(Report,outfile,indent=2)
+            outfile.write("\n")
+        finally:
+            outfile.close()
+
+# One running phase of a ConversionReport
+class ReportPhase(object):
+    def __init__(self,Report,Name):
+        self.Report=Report
+        self.Name=Name
+
+    def __enter__(self):
+        # [name,start wall,start CPU,wall in nested phases,CPU in nested phases]
+        self.Report.Running.append([self.Name,time.time(),CPUTime(),0.0,0.0])
+
+    def __exit__(self,ExceptionType,ExceptionValue,Traceback):
+        (name,startwall,startcpu,nestedwall,nestedcpu)=self.Report.Running.pop()
+        wall=time.time()-startwall
+        cpu=CPUTime()-startcpu
+        self.Report.AddTime(name,wall-nestedwall,cpu-nestedcpu)
+        if self.Report.Running<>[]:
+            self.Report.Running[-1][3]=self.Report.Running[-1][3]+wall
+            self.Report.Running[-1][4]=self.Report.Running[-1][4]+cpu
+        return False
+
+# CPU time (user and system) of the process so far
+def CPUTime():
+    times=os.times()
+    return times[0]+times[1]
+
+# Peak memory use (resident set size) of the process so far in kilobytes, 0 if unknown
+def PeakMemory():
+    if resource==None:
+        return 0
+    peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform=="darwin":
+        # in bytes on Mac OS X
+        peak=peak/1024
+    return peak
+
+# One conversion of an ODT file into DITA
+# All the data that used to be global lives here; use a new Converter for every conversion
+# The log goes to LogStream and LogCallback as it is written, see ConversionLog; DebugText has the last lines
+# A ConversionLog can be given as Log instead, then the conversion logs into it (LogStream and LogCallback are not used)
+class Converter(object):
+    def __init__(self,Options,LogStream=None,LogCallback=None,Log=None):
+        self.Options=Options
+
+        # Debug output
+        if Log==None:
+            Log=ConversionLog(Options.DebugLevel,LogStream,LogCallback)
+        self.Log=Log
+
+        # Phase times and counters
+        self.Report=ConversionReport()
+
+        # Set at the very end of a successful Run
+        self.Completed=False
+
+        # Document title - to be worked out from meta.xml
+        self.DocumentTitle=""
+
+        # Bookmarks dictionary
+        # Key is the bookmark name, as in document
+        # Member is a tuple (DocID,reference_in_document)
+        self.BookmarksDictionary={}
+
+        # Duplicate bookmarks
+        # While the bookmark is normally just saved as the ID of the parent paragraph or title, there can be two bookmarks for one
+        # BookmarksDuplicate keeps these, and the IDs moved away from removed elements, see BookmarkAliases
+        self.BookmarksDuplicate=BookmarkAliases()
+
+        # Styles dictionary
+        # Key is the style name, and member is a set of keywords with the style properties
+        # Style properties defined as of this version: "bold", "italic", "monospace","note"
+        # "notbold","notitalic","notmonospace","uicontrol","caption","header"
+        # 0.43: the set is a mask of StyleBits
+        self.StylesDictionary={"":0}
+
+        # Resolved style properties of a text:span, by (inherited style properties, span style name)
+        # A few styles account for most spans, so most spans are resolved here; emptied when styles are added
+        self.SpanStyles={}
+        self.SpanCount=0
+        self.SpanStyleHits=0
+
+        # "Otherprops" style properties of output nodes, by node - a mask of the MaskOtherprops bits
+        # Added in 0.43; before, they were strings in an "otherprops" attribute, found with .find()
+        #  and removed from every topic at the end. Only the initial output DOM is marked, and
+        #  the marks are dropped when it is broken up into topics
+        self.Otherprops={}
+
+        # Outline levels for styles
+        #self.StylesOutlineLevels={"":0}
+
+        # This counter is increased when starting to process a table, decreased when ending the table.
+        # !!!!!!!!!! this is not a proper solution !!!!!!!!!!!!!
+        self.InTable=0
+
+        # Frame Mode styles dictionary
+        # Used only in Frame Mode
+        # Contains only styles with "headingN" in name or if the parent style is in the list
+        # The value is an integer - the heading level
+        self.FrameModeStylesDictionary={}
+
+        # List styles are handled separately because each has a number of levels
+        # We take a "dictionary of dictionaries" approach
+        # Each member in the ListStylesDictionary is a dictionary of level to string
+        # String can be "number" or "bullet"
+        # 0.43: the member is a tuple of the list types by level, see ProcessStylesNodes
+        self.ListStylesDictionary={"":("",)}
+
+        # Style properties by the name of a style, see StyleNameProperties
+        self.StyleNameMasks={}
+
+        # Current list level and stack of list style names
+        self.CurrentListLevel=0
+        self.ListStyleNamesStack=[""]
+
+        # Output DOMs
+        # This is a list of tuples (DOM, level)
+        # DOM is the output DOM
+        # level is the outline level
+        # note we do not save DOM IDs separately, to avoid complicated data structures
+        self.OutputDOMs=[]
+
+        # Automatically created IDs
+        # We often need to replace the ID of a topic - other tags too perhaps in later versions
+        # that was first created as automatic. In such cases we need to ensure that the ID is indeed
+        # automatic. If the ID to be replaced is already from the document we have a non-standard situation
+        self.AutoCreatedIDs=[]
+
+        # All IDs, auto-created and otherwise
+        # This is here to catch non-unique IDs, which should not happen anyhow
+        # A non-unique ID may lead to a non-unique file name and other glitches, so is a non-standard situation
+        self.AllIDs=IDRegistry()
+
+        # ID counter. For use in autocreating IDs; increases each time an ID is autocreated
+        # Initiated with 0 because the very first output DOM is somewhat likely to be empty
+        #  (and therefore not output to a DITA file)
+        self.AutoID_Counter=0
+
+        # 0.38 additional files to unzip
+        self.ToUnzip=set([])
+
+        # Current output DOM and its <body>
+        self.InitialOutputDOM=None
+        self.InitialOutputBody=None
+        self.CurrentOutputTitle=None
+
+        # Current output DOM's <keywords>
+        # set to None until the thing is actually created
+        self.CurrentOutputKeywords=None
+
+        # The paragraph start mark for ignoring white space at start of paragraph
+        self.IsStartParagraph=True
+
+        # Text node that AddTextAsChild and AddSpacesAsChild are currently adding to, and the text for it
+        # see AppendText
+        self.PendingTextNode=None
+        self.PendingText=[]
+
+        # Set when a <temp:linebreak> was made, so PostprocessLinebreak has work to do (see ProcessParagraph)
+        self.TempLinebreaks=False
+
+
+    # Debug output
+    # If args are given, the message is formatted with them, only when it is to be logged
+    def debug(self,level,message,*args):
+        self.Log.Write(level,message,args)
+
+    # The log as one string
+    @property
+    def DebugText(self):
+        return self.Log.Text()
+
+    # Report an unprocessed tag in a parent tag, unless it's to be ignored
+    def unprocessed(self,parenttag,tag):
+        if not (tag in TagsToIgnore):
+            self.debug(3,"Unprocessed tag in %s : %s",parenttag,tag)
+
+
+    # Carefully destroy a node and all its child nodes - remove from tree and unlink
+    # Save the ID (or any child node ID) to the parent node
+    def DestroyNode(self,node):
+        while node.firstChild<>None:
+            #print "destroying a child node"
+            self.DestroyNode(node.firstChild)
+
+        self.SaveId(node)
+        node.parentNode.removeChild(node)
+        node.unlink()
 
-# Get the ID from an output DOM
-def GetID(DOM):
-    topicnode=GetElementChild(DOM)
-    if topicnode.nodeType<>xml.dom.Node.ELEMENT_NODE:
-        debug(1,"GetID: non-element last child")
-        return("")
 
-    #FIXME: here we check for the fact that this is the root element of a valid DITA doc
-    #but really valid DITA documents can have several root element not just <topic>
-    #for now we only create <topic> but we do need to check properly here
-    if not (topicnode.tagName in ["topic","concept","task","reference"]):
-        debug(1,"GetID: non-DITA first child (not topic type")
-        return("")
+    # Move all child nodes from InputNode to OutputNode, to follow its existing children
+    # Merge text nodes (this is done by built-in normalize method)
+    # If TextSeparator is present, place the text between the original children and the moved ones
+    # NOTE: does not delete InputNode even though strips it of all children
+    def MoveChildNodes(self,InputNode,OutputNode,TextSeparator=''):
 
-    return(topicnode.getAttribute("id"))
+        # add TextSeparator    
+        if TextSeparator<>"":
+            newnode=self.InitialOutputDOM.createTextNode(TextSeparator)
+            OutputNode.appendChild(newnode)
 
-# Set the ID for an output DOM
-def SetID(DOM,idstring):
-    topicnode=GetElementChild(DOM)
+        # move nodes
+        self.Report.Count("nodes moved",len(InputNode.childNodes))
+        while InputNode.hasChildNodes():
+            OutputNode.appendChild(InputNode.firstChild)
 
-    #FIXME: here we check for the fact that this is the root element of a valid DITA doc
-    #but really valid DITA documents can have several root element not just <topic>
-    #for now we only create <topic> but we do need to check properly here
-    if not (topicnode.tagName in ["topic","concept","task","reference"]):
-        debug(1,"SetID: non-DITA first child (not topic type)")
-        return("")
+        # Normalize text nodes
 
-    topicnode.setAttribute("id",idstring)
+        OutputNode.normalize()
 
-# Get the title node for an output DOM
-def GetTitleNode(DOM):
-    topicnode=GetElementChild(DOM)
-    
-    if not (topicnode.tagName in ["topic","concept","task","reference"]):
-        debug(1,"GetTitleNode: non-DITA first child (not topic type")
-        return("")
 
-    for childnode in topicnode.childNodes:
-        if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-            if childnode.tagName=="title":
+    # Get the element child of a DOM
+    def GetElementChild(self,DOM):
+        for childnode in DOM.childNodes:
+            if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
                 return childnode
-    debug(1,"GetTitleNode: did not find title node")
-    return None
+        self.debug(1,"GetElementChild failed to get element child")
+        return None
             
+        
 
-# Create, and return, a new <temp:topic> in the INITIAL output DOM, append to node
-# New for version 0.015
-# The <temp:title> has the <title> node as well as the <prolog> set up for the keywords
 
-def CreateNewTempTopic(node):
-    global IsStartParagraph
-    IsStartParagraph=True
+    # Get the ID from an output DOM
+    def GetID(self,DOM):
+        topicnode=self.GetElementChild(DOM)
+        if topicnode.nodeType<>xml.dom.Node.ELEMENT_NODE:
+            self.debug(1,"GetID: non-element last child")
+            return("")
 
-    TTNode=InitialOutputDOM.createElement("temp:topic")
-    node.appendChild(TTNode)
+        #FIXME: here we check for the fact that this is the root element of a valid DITA doc
+        #but really valid DITA documents can have several root element not just <topic>
+        #for now we only create <topic> but we do need to check properly here
+        if not (topicnode.tagName in ["topic","concept","task","reference"]):
+            self.debug(1,"GetID: non-DITA first child (not topic type")
+            return("")
 
-    TitleElement=InitialOutputDOM.createElement("title")
-    TTNode.appendChild(TitleElement)
-    global CurrentOutputTitle
-    CurrentOutputTitle=TitleElement
+        return(topicnode.getAttribute("id"))
 
-    prolognode=InitialOutputDOM.createElement("prolog")
-    TTNode.appendChild(prolognode)
-    metadatanode=InitialOutputDOM.createElement("metadata")
-    prolognode.appendChild(metadatanode)
-    global CurrentOutputKeywords
-    CurrentOutputKeywords=InitialOutputDOM.createElement("keywords")
-    metadatanode.appendChild(CurrentOutputKeywords)
+    # Set the ID for an output DOM
+    def SetID(self,DOM,idstring):
+        topicnode=self.GetElementChild(DOM)
 
-    return TTNode
+        #FIXME: here we check for the fact that this is the root element of a valid DITA doc
+        #but really valid DITA documents can have several root element not just <topic>
+        #for now we only create <topic> but we do need to check properly here
+        if not (topicnode.tagName in ["topic","concept","task","reference"]):
+            self.debug(1,"SetID: non-DITA first child (not topic type)")
+            return("")
 
+        topicnode.setAttribute("id",idstring)
 
+    # Get the title node for an output DOM
+    def GetTitleNode(self,DOM):
+        topicnode=self.GetElementChild(DOM)
     
+        if not (topicnode.tagName in ["topic","concept","task","reference"]):
+            self.debug(1,"GetTitleNode: non-DITA first child (not topic type")
+            return("")
+
+        for childnode in topicnode.childNodes:
+            if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                if childnode.tagName=="title":
+                    return childnode
+        self.debug(1,"GetTitleNode: did not find title node")
+        return None
             
-# Create the INITIAL output DOM
-# This DOM is used for main processing and most postprocessing
-# It has only the body node, and is later "broken up" into actual output DOMs
-# New for version 0.015
-
-def CreateInitialOutputDOM():
-    global InitialOutputDOM
-    impl=xml.dom.getDOMImplementation("minidom")
-    InitialOutputDOM=impl.createDocument(None,"conbody",None)
-    global InitialOutputBody
-    InitialOutputBody=GetElementChild(InitialOutputDOM)
-    CreateNewTempTopic(InitialOutputBody)
-    
 
+    # Create, and return, a new <temp:topic> in the INITIAL output DOM, append to node
+    # New for version 0.015
+    # The <temp:title> has the <title> node as well as the <prolog> set up for the keywords
 
+    def CreateNewTempTopic(self,node):
+        self.IsStartParagraph=True
 
+        TTNode=self.InitialOutputDOM.createElement("temp:topic")
+        node.appendChild(TTNode)
 
+        TitleElement=self.InitialOutputDOM.createElement("title")
+        TTNode.appendChild(TitleElement)
+        self.CurrentOutputTitle=TitleElement
 
+        prolognode=self.InitialOutputDOM.createElement("prolog")
+        TTNode.appendChild(prolognode)
+        metadatanode=self.InitialOutputDOM.createElement("metadata")
+        prolognode.appendChild(metadatanode)
+        self.CurrentOutputKeywords=self.InitialOutputDOM.createElement("keywords")
+        metadatanode.appendChild(self.CurrentOutputKeywords)
 
-# Remove all childless element children of a node
-# This is to facilitate things like paragraph processing: there may be lots of bold etc tags
-#  but if there is no content all such tags should be removed
-# All child elements are processed recursively, but all non-element children remain
-# ONLY elements from a certain list - "b","i","codeph","p","note" - are removed
+        return TTNode
 
-def RemoveChildlessElementChildrenPara(node):
-    # child nodes flagged for removal
-    ChildNodesToRemove=[]
 
-    for childnode in node.childNodes:
-        
-        # processing a child node now
-        # only interested if it is an element
-        if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-            # first remove any of its own element children by recursion 
-            RemoveChildlessElementChildrenPara(childnode)
-
-            # now if this child node is childless, flag it for removal
-            # not removing immediately just to avoid trouble with the for statement
-            if not childnode.hasChildNodes():
-                if childnode.tagName in ["b","i","codeph","p","note"]:
-                    ChildNodesToRemove.append(childnode)
-
-    # remove flagged child nodes, and return
-    for childnode in ChildNodesToRemove:
-        SaveId(childnode)
-        node.removeChild(childnode)
-        childnode.unlink()
-    return()
+    
             
-# The paragraph start mark for ignoring white space at start of paragraph
-# FIXME: using a global for this is probably not a good way
-IsStartParagraph=True
-
-# Add some text as text child data to OutputNode
-# Processes white space, and does not create another text child is the last child is text already
-
-def AddTextAsChild(text,OutputNode):
-
-    global IsStartParagraph
+    # Create the INITIAL output DOM
+    # This DOM is used for main processing and most postprocessing
+    # It has only the body node, and is later "broken up" into actual output DOMs
+    # New for version 0.015
+
+    def CreateInitialOutputDOM(self):
+        if self.Options.LightTree:
+            self.InitialOutputDOM=LightDocument("conbody")
+        else:
+            impl=xml.dom.getDOMImplementation("minidom")
+            self.InitialOutputDOM=impl.createDocument(None,"conbody",None)
+        self.InitialOutputBody=self.GetElementChild(self.InitialOutputDOM)
+        self.CreateNewTempTopic(self.InitialOutputBody)
     
-    # if text is empty, simply return as we have nothing to add
-    if text=="":
-        return()
 
-    # determine if the last child of OutputNode is text, and if so does it end with white space 
-    # also, if this is the paragraph start, beginning spaces are to be removed as if after a space
-    wasSpace=IsStartParagraph 
-    ExistingText=False
-    if OutputNode.lastChild <> None:
-        if OutputNode.lastChild.nodeType==xml.dom.Node.TEXT_NODE:
-            ExistingText=True
-            wasSpace=OutputNode.lastChild.data[len(OutputNode.lastChild.data)-1].isspace()
 
-        
+    # Remove all childless element children of a node
+    # This is to facilitate things like paragraph processing: there may be lots of bold etc tags
+    #  but if there is no content all such tags should be removed
+    # All child elements are processed recursively, but all non-element children remain
+    # ONLY elements from a certain list - "b","i","codeph","p","note" - are removed
 
-    # process the text data, shrinking all white space
-
-    data=text
-    newdata=""
-    while data<>"":
-        # process data[0]
-        if data[0].isspace():
-            # add a space if this is the first white space
-            if not wasSpace:
-                newdata=newdata+" "
-                wasSpace=True
-        else:
-            wasSpace=False
-            newdata=newdata+data[0]
-        # now remove data[0]
-        data=data[1:]
+    def RemoveChildlessElementChildrenPara(self,node):
+        # child nodes flagged for removal
+        ChildNodesToRemove=[]
 
+        for childnode in node.childNodes:
         
-        
-    # if resulting text is empty, simply return as we have nothing to add
-    if newdata=="":
+            # processing a child node now
+            # only interested if it is an element
+            if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                # first remove any of its own element children by recursion 
+                self.RemoveChildlessElementChildrenPara(childnode)
+
+                # now if this child node is childless, flag it for removal
+                # not removing immediately just to avoid trouble with the for statement
+                if not childnode.hasChildNodes():
+                    if childnode.tagName in ["b","i","codeph","p","note"]:
+                        ChildNodesToRemove.append(childnode)
+
+        # remove flagged child nodes, and return
+        for childnode in ChildNodesToRemove:
+            self.SaveId(childnode)
+            node.removeChild(childnode)
+            childnode.unlink()
         return()
 
-    # add resulting text
-    if ExistingText:
-        OutputNode.lastChild.data=OutputNode.lastChild.data+newdata
-    else:
-        newnode=InitialOutputDOM.createTextNode(newdata)
-        OutputNode.appendChild(newnode)
+    # Add some text as text child data to OutputNode
+    # Processes white space, and does not create another text child is the last child is text already
+    # 0.43: white space is collapsed with a regular expression instead of char by char,
+    #  and the text is collected by AppendText rather than added to the node data every time
 
-    IsStartParagraph=False
-    return()
+    def AddTextAsChild(self,text,OutputNode):
 
+        # if text is empty, simply return as we have nothing to add
+        if text=="":
+            return()
 
-# Add number spaces as text child data to OutputNode
-# Does not create another text child is the last child is text already
-# And supports AddTextAsChild globals
+        # determine if the last child of OutputNode is text, and if so does it end with white space 
+        # also, if this is the paragraph start, beginning spaces are to be removed as if after a space
+        wasSpace=self.IsStartParagraph 
+        if OutputNode.lastChild <> None:
+            if OutputNode.lastChild is self.PendingTextNode:
+                wasSpace=self.PendingText[-1][-1:].isspace()
+            elif OutputNode.lastChild.nodeType==xml.dom.Node.TEXT_NODE:
+                wasSpace=OutputNode.lastChild.data[len(OutputNode.lastChild.data)-1].isspace()
 
-def AddSpacesAsChild(number,OutputNode):
+        # process the text data, shrinking all white space into one space
+        # white space at the start is removed altogether if there was white space before
+        newdata=WhiteSpaceRun.sub(" ",text)
+        if wasSpace and newdata[0]==" ":
+            newdata=newdata[1:]
 
-    global IsStartParagraph
-    
-    # determine if the last child of OutputNode is text
-    
-    ExistingText=False
-    if OutputNode.lastChild <> None:
-        if OutputNode.lastChild.nodeType==xml.dom.Node.TEXT_NODE:
-            ExistingText=True
-
-    newdata=""
-    for i in range(0,number):
-        newdata=newdata+" "
-
-    # add resulting text
-    if ExistingText:
-        OutputNode.lastChild.data=OutputNode.lastChild.data+newdata
-    else:
-        newnode=InitialOutputDOM.createTextNode(newdata)
-        OutputNode.appendChild(newnode)
+        # if resulting text is empty, simply return as we have nothing to add
+        if newdata=="":
+            return()
+
+        # add resulting text
+        self.AppendText(newdata,OutputNode)
 
-    IsStartParagraph=False
-    return()
+        self.IsStartParagraph=False
+        return()
 
 
+    # Add number spaces as text child data to OutputNode
+    # Does not create another text child is the last child is text already
+    # And supports AddTextAsChild globals
 
-# == PROCESSING ==========================================================
+    def AddSpacesAsChild(self,number,OutputNode):
 
-# process a styles list node
-# The styles list is either <office:automatic-styles> in content.xml
-#  or <office:styles> and <office:automatic-styles> in styles.xml
-# All element children of the styles list node are to be fed to this procedure
-def ProcessStylesNode(InputNode):
-    global StylesDictionary
-    global ListStylesDictionary
-#    global StylesOutlineLevels
+        # add resulting text
+        self.AppendText(" "*number,OutputNode)
 
-#    print "PSN started"
-    
-    if InputNode.nodeType<>xml.dom.Node.ELEMENT_NODE:
-        debug(1,"ProcessStyleNode: non-element node received")
+        self.IsStartParagraph=False
         return()
 
-    for node in InputNode.childNodes:
-      if node.nodeType==xml.dom.Node.ELEMENT_NODE:
-        if node.tagName=="style:style": #process para/char/etc styles
-            StyleName=node.getAttribute("style:name")
-            
-            if StyleName in StylesDictionary:
-                # do not process duplicate style name
-                debug(1,"ProcessStyleNode: duplicate style "+StyleName)
-                continue
-              
 
-            # note: in the future we might distinguish by style:family attribute here
-            # not yet needed at this stage so proceed straight to working out properties
+    # Add newdata to the text child that is the last child of OutputNode, or create one if the last child is not text
+    # Appending to the data of a text node copies the whole string every time, so the text for the last
+    # text node written to is collected in PendingText and only joined into its data by FlushText
+    # NOTE: the data of PendingTextNode is not up to date until FlushText is called
 
-            # initialize style properties 
-            StyleProperties=set([])
+    def AppendText(self,newdata,OutputNode):
+        if OutputNode.lastChild<>None and OutputNode.lastChild is self.PendingTextNode:
+            if newdata<>"":
+                self.PendingText.append(newdata)
+            return
 
-            # first checks for note, header and caption
+        self.FlushText()
+        if OutputNode.lastChild<>None and OutputNode.lastChild.nodeType==xml.dom.Node.TEXT_NODE:
+            self.PendingTextNode=OutputNode.lastChild
+            self.PendingText=[OutputNode.lastChild.data,newdata]
+        else:
+            self.PendingTextNode=self.InitialOutputDOM.createTextNode(newdata)
+            self.PendingText=[newdata]
+            OutputNode.appendChild(self.PendingTextNode)
 
-            if StyleName.lower().find("note")>-1:
-                StyleProperties.add("note")
-            if StyleName.lower().find("head")>-1:
-                StyleProperties.add("header")
-            if StyleName.lower().find("caption")>-1:
-                StyleProperties.add("caption")
+    # Write the collected text into PendingTextNode
+    def FlushText(self):
+        if self.PendingTextNode<>None:
+            self.PendingTextNode.data="".join(self.PendingText)
+            self.PendingTextNode=None
+            self.PendingText=[]
 
-            # get the parent style name, and add parent style attributes and outline level if present
-            parentstyle=node.getAttribute("style:parent-style-name")
-            try:
-                StyleProperties = StyleProperties | StylesDictionary[parentstyle]
-            except KeyError: pass  
-#            try:
-#                StylesOutlineLevels[StyleName]=StylesOutlineLevels[parentstyle]
-#            except KeyError: StylesOutlineLevels[StyleName]=0
-
-            # get the outline level for the style
-#            try:
-#                if node.hasAttribute("style:default-outline-level"):
-#                    StylesOutlineLevels[StyleName]=int(node.getAttribute("style:default-outline-level"))
-#                    print "Style "+StyleName+" outline level "+str(StylesOutlineLevels[StyleName])
-#            except ValueError:pass
 
-            
-            # do second checks for note/header/caption
-            if parentstyle.lower().find("note")>-1:
-                StyleProperties.add("note")
-            if parentstyle.lower().find("head")>-1:
-                StyleProperties.add("header")
-            if parentstyle.lower().find("caption")>-1:
-                StyleProperties.add("caption")
-
-            # Process heading styles for Frame Mode
-            if FrameMode:
-                if parentstyle in FrameModeStylesDictionary:
-                    FrameModeStylesDictionary[StyleName]=FrameModeStylesDictionary[parentstyle]
-                    debug(3,"found Frame heading child style: "+StyleName)
-                elif StyleName.lower().find("heading")>-1:
-                    LevelStr=StyleName[StyleName.lower().find("heading")+7:]
-                    try:
-                        nn=int(LevelStr)
-                        FrameModeStylesDictionary[StyleName]=nn
-                        debug(3,"found Frame heading level "+LevelStr+" style name "+StyleName)
-                    except ValueError: pass # no number means not a Frame heading
-                    
 
+    # == PROCESSING ==========================================================
 
+    # process a styles list node
+    # The styles list is either <office:automatic-styles> in content.xml
+    #  or <office:styles> and <office:automatic-styles> in styles.xml
+    # All element children of the styles list node are to be fed to this procedure
+    def ProcessStylesNode(self,InputNode):
+        self.ProcessStylesNodes([InputNode])
 
+    # process several styles list nodes together, so that styles in one can inherit from styles in another
+    # 0.43: a style's parent is found wherever it is defined in the styles list nodes, before or after the style;
+    #  styles are first collected by name, then every style is worked out after its parent (inheritance graph
+    #  in topological order), each exactly once. Before, a parent defined after its child was ignored.
+    # Styles already in StylesDictionary (from earlier calls) are final and can be parents too.
+    def ProcessStylesNodes(self,InputNodes):
+    #    global StylesOutlineLevels
 
-            # other style properties are in child elements whose names include "properties"
-            # so we cycle through all child elements finding such nodes
-            # and check their attributes for the properties that we detect
+    #    print "PSN started"
 
-            for childnode in node.childNodes:
-                if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                    childTagName=childnode.tagName
-                    if childTagName.find("properties")>-1:
-                        # this is a properties element - look for properties
+        # a span style that was not defined so far may be defined now
+        self.SpanStyles.clear()
 
-                        # look for bold and notbold
-                        if childnode.getAttribute("fo:font-weight").find("bold")>-1:
-                            StyleProperties.add("bold")
-                        if childnode.getAttribute("fo:font-weight").find("normal")>-1:
-                            StyleProperties.add("notbold")
-                            StyleProperties.discard("bold") # if it was in parent
+        # style name to style:style node, for the styles to work out, and their names in document order
+        StyleNodes={}
+        StyleOrder=[]
 
-                        
-                        # look for italic and notitalic
-                        if childnode.getAttribute("fo:font-style").find("italic")>-1:
-                            StyleProperties.add("italic")
+        for InputNode in InputNodes:
+          if InputNode.nodeType<>xml.dom.Node.ELEMENT_NODE:
+            self.debug(1,"ProcessStyleNode: non-element node received")
+            continue
 
-                        if childnode.getAttribute("fo:font-style").find("normal")>-1:
-                            StyleProperties.add("notitalic")
-                            StyleProperties.discard("italic") # if it was in parent
-                            
-                        # look for monospace and notmonospace
-                        # FIXME: is there a better way than checking for "Cour*" fonts?
-                        fontname=childnode.getAttribute("style:font-name").lower()
-                        if fontname<>"":
-                            if fontname.find("cour")>-1:
-                                StyleProperties.add("monospace")
-                            else:
-                                StyleProperties.add("notmonospace")
-                                StyleProperties.discard("monospace") # if it was in parent
-                            global Process_AntiquaAsBold
-                            if Process_AntiquaAsBold and fontname.find("antiqua")>-1:
-                                StyleProperties.add("bold")
-                            
-            # Save the style properties in the dictionary
-#            print StyleName
-            StylesDictionary[StyleName]=StyleProperties
-        elif node.tagName in ["text:liststyle","text:list-style"]: #process list styles
-            #print "Found list styles"
-            StyleName=node.getAttribute("style:name")
-            StyleLevels={}
-
-            # list levels are in child elements - text:list-level-style-bullet
-            # and text:list-level-style-number
+          for node in InputNode.childNodes:
+            if node.nodeType==xml.dom.Node.ELEMENT_NODE:
+              if node.tagName=="style:style": #process para/char/etc styles
+                StyleName=node.getAttribute("style:name")
             
-            for childnode in node.childNodes:
-                if childnode.tagName=="text:list-level-style-bullet":
-                    StyleLevels[int(childnode.getAttribute("text:level"))]="bullet"
-                if childnode.tagName=="text:list-level-style-number":
-                    StyleLevels[int(childnode.getAttribute("text:level"))]="number"
+                if StyleName in self.StylesDictionary or StyleName in StyleNodes:
+                    # do not process duplicate style name
+                    self.debug(1,"ProcessStyleNode: duplicate style %s",StyleName)
+                    continue
+
+                StyleNodes[StyleName]=node
+                StyleOrder.append(StyleName)
+              elif node.tagName in ["text:liststyle","text:list-style"]: #process list styles
+                #print "Found list styles"
+                StyleName=node.getAttribute("style:name")
+                StyleLevels={}
+
+                # list levels are in child elements - text:list-level-style-bullet
+                # and text:list-level-style-number
+            
+                for childnode in node.childNodes:
+                    if childnode.nodeType<>xml.dom.Node.ELEMENT_NODE:
+                        continue
+                    if childnode.tagName=="text:list-level-style-bullet":
+                        StyleLevels[int(childnode.getAttribute("text:level"))]="bullet"
+                    if childnode.tagName=="text:list-level-style-number":
+                        StyleLevels[int(childnode.getAttribute("text:level"))]="number"
+
+                # 0.43: the list type of every level is worked out here once, as by the spec:
+                #  if a level is not defined, the next lower defined level is used
+                # ListTypes[level] is the list type, "" if no level up to it is defined;
+                #  for levels over the last one, the last one is used
+                ListTypes=[""]
+                if StyleLevels<>{}:
+                    for level in range(1,max(StyleLevels.keys())+1):
+                        ListTypes.append(StyleLevels.get(level,ListTypes[level-1]))
+                self.ListStylesDictionary[StyleName]=tuple(ListTypes)
+
+        # work out every style after its parent
+        # Parents are followed with an explicit stack, as a long chain of styles could be too deep for recursion
+        for StyleName in StyleOrder:
+            stack=[StyleName]
+            while stack<>[]:
+                name=stack[-1]
+                if name in self.StylesDictionary:
+                    stack.pop()
+                    continue
+                parentstyle=StyleNodes[name].getAttribute("style:parent-style-name")
+                if parentstyle in StyleNodes and not (parentstyle in self.StylesDictionary):
+                    if parentstyle in stack:
+                        # a loop of parents - break it here, the style gets no parent properties
+                        self.debug(1,"ProcessStyleNode: style %s is its own ancestor",parentstyle)
+                    else:
+                        stack.append(parentstyle)
+                        continue
+                self.ProcessStyle(name,StyleNodes[name])
+                stack.pop()
+
+    # The style properties given by the name of a style: note, header and caption
+    # Made once for every name, as the same names are used over and over as parents
+    def StyleNameProperties(self,StyleName):
+        try:
+            return self.StyleNameMasks[StyleName]
+        except KeyError:
+            StyleProperties=0
+            lowername=StyleName.lower()
+            if lowername.find("note")>-1:
+                StyleProperties=StyleProperties|StyleBits["note"]
+            if lowername.find("head")>-1:
+                StyleProperties=StyleProperties|StyleBits["header"]
+            if lowername.find("caption")>-1:
+                StyleProperties=StyleProperties|StyleBits["caption"]
+            self.StyleNameMasks[StyleName]=StyleProperties
+            return StyleProperties
+
+    # Work out the properties of one style:style node and put them in StylesDictionary
+    # The parent style, if it is defined at all, must be in StylesDictionary already
+    def ProcessStyle(self,StyleName,node):
+        # note: in the future we might distinguish by style:family attribute here
+        # not yet needed at this stage so proceed straight to working out properties
+
+        # initialize style properties (a mask of StyleBits)
+        # first checks for note, header and caption
+        StyleProperties=self.StyleNameProperties(StyleName)
+
+        # get the parent style name, and add parent style attributes and outline level if present
+        parentstyle=node.getAttribute("style:parent-style-name")
+        try:
+            StyleProperties = StyleProperties | self.StylesDictionary[parentstyle]
+        except KeyError: pass  
+    #            try:
+    #                StylesOutlineLevels[StyleName]=StylesOutlineLevels[parentstyle]
+    #            except KeyError: StylesOutlineLevels[StyleName]=0
+
+        # get the outline level for the style
+    #            try:
+    #                if node.hasAttribute("style:default-outline-level"):
+    #                    StylesOutlineLevels[StyleName]=int(node.getAttribute("style:default-outline-level"))
+    #                    print "Style "+StyleName+" outline level "+str(StylesOutlineLevels[StyleName])
+    #            except ValueError:pass
 
-            ListStylesDictionary[StyleName]=StyleLevels
+            
+        # do second checks for note/header/caption
+        StyleProperties=StyleProperties|self.StyleNameProperties(parentstyle)
+
+        # Process heading styles for Frame Mode
+        if self.Options.FrameMode:
+            if parentstyle in self.FrameModeStylesDictionary:
+                self.FrameModeStylesDictionary[StyleName]=self.FrameModeStylesDictionary[parentstyle]
+                self.debug(3,"found Frame heading child style: %s",StyleName)
+            elif StyleName.lower().find("heading")>-1:
+                LevelStr=StyleName[StyleName.lower().find("heading")+7:]
+                try:
+                    nn=int(LevelStr)
+                    self.FrameModeStylesDictionary[StyleName]=nn
+                    self.debug(3,"found Frame heading level %s style name %s",LevelStr,StyleName)
+                except ValueError: pass # no number means not a Frame heading
+            
 
 
-                            
-# process a paragraph - presumably the contents of a <text:p> node
-# such a node is passed but we do NOT check it in any way, so it can be a different tag
-#  (this allows using the function for <text:h> when heading processing is not enabled)
-# returns True if any result was rendered into the output, False otherwise
-# Note that a <p> is NOT created; if a <p> is neded the OutputNode should be it
-#  (this is because it can be the first paragraph of a cell/item)
-# ParagraphStyleProperties is a style properties set
-# If IsTitle=True, this is a <text:h> node going into a title, ignore paragraph style
-#  and restrictions apply
-
-def ProcessParagraph(InputNode,OutputNode,ParagraphStyleProperties=set([]),IsTitle=False):
-
-    # LOCAL FUNCTIONS OPERATING AN OUTPUT NODE STACK
-    # output node stack: get current output node
-    def CurrentOutputNode():
-        return(OutputNodes[len(OutputNodes)-1])
-    
-    # output node stack: add a node with the given tag name as output node, add to stack
-    # FIXME: add attribute support?
-    def StartOutputNode(tag):
-        newnode=InitialOutputDOM.createElement(tag)
-        CurrentOutputNode().appendChild(newnode)
-        OutputNodes.append(newnode)
-
-    # output node stack: end the current output node, use the previous one
-    def EndOutputNode():
-        OutputNodes.pop()
-
-    # output node stack: peel the output stack until we reach peelnode or (error!)
-    # the original OutputNode
-    def PeelOutputStack(peelnode):
-        while not CurrentOutputNode() in [peelnode,OutputNode]:
-            EndOutputNode()
-        if CurrentOutputNode()<>peelnode:
-            debug(3,"PeelOutputStack called with a peelnode not in the stack")
-
-    # Set (only to true - this is a one way trigger) and get peeled flag
-    # FIXME: this is a hack, but namespace issues happen otherwise
-    def SetPeeled():
-        Peeled.append(1)
-    def GetPeeled():
-        if Peeled==[]:
-            return(False)
-        else:
-            return(True)
-
-    # LOCAL FUNCTION FOR PROCESSING TEXT
-    # Required because <text:span> can be nested
-    # Process all children of LocalInputNode into the current output node as per stack
-    # The style properties (character only are processed) are considered already set up
-    #  as by LocalStyleProperties
-    def LocalProcessText(LocalInputNode,LocalStyleProperties,DebugPrints=False):
-        if DebugPrints:
-            print "LocalProcessText called with DebugPrints"
-            print LocalStyleProperties
-        for childnode in LocalInputNode.childNodes:
-            # process plain text by copying it
-            if childnode.nodeType==xml.dom.Node.TEXT_NODE:
-                AddTextAsChild(childnode.data,CurrentOutputNode())
-                
-            # process child elements
-            # FIXME: this currently is NOT verified to process every possible child as per spec!
-            #  (unprocessed child nodes will be logged at debug level 3)
+        # other style properties are in child elements whose names include "properties"
+        # so we cycle through all child elements finding such nodes
+        # and check their attributes for the properties that we detect
+
+        for childnode in node.childNodes:
             if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                if DebugPrints:
-                    print "processing node "+childnode.tagName+" with text:style-name: "+childnode.getAttribute("text:style-name")
-                    print LocalStyleProperties
+                childTagName=childnode.tagName
+                if childTagName.find("properties")>-1:
+                    # this is a properties element - look for properties
+
+                    # look for bold and notbold
+                    if childnode.getAttribute("fo:font-weight").find("bold")>-1:
+                        StyleProperties=StyleProperties|StyleBits["bold"]
+                    if childnode.getAttribute("fo:font-weight").find("normal")>-1:
+                        StyleProperties=StyleProperties|StyleBits["notbold"]
+                        StyleProperties=StyleProperties&~StyleBits["bold"] # if it was in parent
+
                 
-                if childnode.tagName in ["text:description","text:sequence"]:
-                    # process contents as text
-                    LocalProcessText(childnode,LocalStyleProperties)
-                elif childnode.tagName=="text:span":
-                    # get new style
-                    try:
-                        newstyleproperties=StylesDictionary[childnode.getAttribute("text:style-name")]
-                    except KeyError:
-                        # a rare ODT issue - style not defined
-                        #!!TEMP
-                        #print "not found"
-                        newstyleproperties=LocalStyleProperties
-                    if DebugPrints:
-                        print LocalStyleProperties
+                    # look for italic and notitalic
+                    if childnode.getAttribute("fo:font-style").find("italic")>-1:
+                        StyleProperties=StyleProperties|StyleBits["italic"]
+
+                    if childnode.getAttribute("fo:font-style").find("normal")>-1:
+                        StyleProperties=StyleProperties|StyleBits["notitalic"]
+                        StyleProperties=StyleProperties&~StyleBits["italic"] # if it was in parent
+                    
+                    # look for monospace and notmonospace
+                    # FIXME: is there a better way than checking for "Cour*" fonts?
+                    fontname=childnode.getAttribute("style:font-name").lower()
+                    if fontname<>"":
+                        if fontname.find("cour")>-1:
+                            StyleProperties=StyleProperties|StyleBits["monospace"]
+                        else:
+                            StyleProperties=StyleProperties|StyleBits["notmonospace"]
+                            StyleProperties=StyleProperties&~StyleBits["monospace"] # if it was in parent
+                        if self.Options.Process_AntiquaAsBold and fontname.find("antiqua")>-1:
+                            StyleProperties=StyleProperties|StyleBits["bold"]
+                    
+        # Save the style properties in the dictionary
+    #            print StyleName
+        self.StylesDictionary[StyleName]=StyleProperties
 
-                    # form the real style properties - start with existing ones 
-                    styleproperties=copy.deepcopy(LocalStyleProperties)
-                    # apply the "off" properties of the new style
-                    if "notbold" in newstyleproperties:
-                        styleproperties.discard("bold")
-                    if "notitalic" in newstyleproperties:
-                        styleproperties.discard("italic")
-                    if "notmonospace" in newstyleproperties:
-                        styleproperties.discard("monospace")
-                    # now add any new character properties
-                    styleproperties=styleproperties | (newstyleproperties & StylesCharacter)
 
-                    if DebugPrints:
-                        print LocalStyleProperties
+    # === STYLES CACHE ===============
+    # Added in 0.43: the dictionaries worked out from styles.xml, saved in a file in StylesCacheDir
+    # The file name is a hash of styles.xml and of everything else ProcessStylesNode depends on,
+    # so a file is never out of date; files can be deleted at any time
 
+    # The cache file for the styles.xml content StylesXML
+    def StylesCacheFile(self,StylesXML):
+        key=hashlib.sha1(StylesXML)
+        key.update(repr((StylesCacheVersion,StyleBitNames,self.Options.Process_AntiquaAsBold,self.Options.FrameMode)))
+        return os.path.join(self.Options.StylesCacheDir,key.hexdigest()+".styles")
+
+    # Read the style dictionaries from a cache file; returns False if there is no usable file
+    def ReadStylesCache(self,path):
+        try:
+            cachefile=open(path,"rb")
+        except IOError:
+            return False
+        try:
+            try:
+                (self.StylesDictionary,self.ListStylesDictionary,self.FrameModeStylesDictionary)=cPickle.load(cachefile)
+            finally:
+                cachefile.close()
+        except Exception as TheException:
+            self.debug(1,"Bad styles cache file %s: %s",path,TheException)
+            return False
+        self.debug(3,"Styles read from the cache file %s",path)
+        return True
+
+    # Save the style dictionaries to a cache file
+    # The file is written under a temporary name and then renamed, so conversions running at the same time
+    # never read a part written file; failing to write it is not an error
+    def WriteStylesCache(self,path):
+        try:
+            (handle,temppath)=tempfile.mkstemp(".tmp","styles",self.Options.StylesCacheDir)
+            cachefile=os.fdopen(handle,"wb")
+            try:
+                cPickle.dump((self.StylesDictionary,self.ListStylesDictionary,self.FrameModeStylesDictionary),
+                             cachefile,cPickle.HIGHEST_PROTOCOL)
+            finally:
+                cachefile.close()
+            try:
+                os.rename(temppath,path)
+            except OSError:
+                # on Windows, the file may have been written by another conversion in the meantime
+                os.remove(temppath)
+        except (IOError,OSError) as TheException:
+            self.debug(1,"Could not write styles cache file %s: %s",path,TheException)
 
-                    # !!TEMP
-                    if DebugPrints and childnode.getAttribute("text:style-name")=="T127":
-                        print "T127"
-                        print styleproperties
-                        print "local is"
+                            
+    # process a paragraph - presumably the contents of a <text:p> node
+    # such a node is passed but we do NOT check it in any way, so it can be a different tag
+    #  (this allows using the function for <text:h> when heading processing is not enabled)
+    # returns True if any result was rendered into the output, False otherwise
+    # Note that a <p> is NOT created; if a <p> is neded the OutputNode should be it
+    #  (this is because it can be the first paragraph of a cell/item)
+    # ParagraphStyleProperties is a style properties mask (of StyleBits)
+    # If IsTitle=True, this is a <text:h> node going into a title, ignore paragraph style
+    #  and restrictions apply
+
+    def ProcessParagraph(self,InputNode,OutputNode,ParagraphStyleProperties=0,IsTitle=False):
+
+        # LOCAL FUNCTIONS OPERATING AN OUTPUT NODE STACK
+        # output node stack: get current output node
+        def CurrentOutputNode():
+            return(OutputNodes[len(OutputNodes)-1])
+    
+        # output node stack: add a node with the given tag name as output node, add to stack
+        # FIXME: add attribute support?
+        def StartOutputNode(tag):
+            newnode=self.InitialOutputDOM.createElement(tag)
+            CurrentOutputNode().appendChild(newnode)
+            OutputNodes.append(newnode)
+
+        # output node stack: start a run of text with the given character tags, in StyleMaskTags order
+        # 0.43: if the last child of the current output node is a run with the same tags, or starting with them,
+        #  the run goes on in it (the tags it has are put back on the stack) and only the rest are started.
+        #  Word breaks text into many spans with different automatic styles but the same formatting,
+        #  and these come out as one element instead of one for each span.
+        # Tags started only to go back to the formatting outside a span (EmptyRun) are removed first
+        #  if nothing went into them, so that they are not in the way
+        # Returns the nodes started
+        def StartRun(tags):
+            for node in reversed(EmptyRun):
+                if node.parentNode<>None and not node.hasChildNodes():
+                    node.parentNode.removeChild(node)
+            del EmptyRun[:]
+            node=CurrentOutputNode().lastChild
+            Started=[]
+            for tag in tags:
+                if node<>None and node.nodeType==xml.dom.Node.ELEMENT_NODE and node.tagName==tag:
+                    OutputNodes.append(node)
+                    node=node.lastChild
+                else:
+                    node=None
+                    StartOutputNode(tag)
+                    Started.append(CurrentOutputNode())
+            return(Started)
+
+        # output node stack: end the current output node, use the previous one
+        def EndOutputNode():
+            OutputNodes.pop()
+
+        # output node stack: peel the output stack until we reach peelnode or (error!)
+        # the paragraph at the bottom of the stack
+        # if peelnode was re-opened by BreakParagraph, the stack now has its copy, so peel to that
+        def PeelOutputStack(peelnode):
+            while peelnode in Reopened:
+                peelnode=Reopened[peelnode]
+            while not CurrentOutputNode() in [peelnode,OutputNodes[0]]:
+                EndOutputNode()
+            if CurrentOutputNode()<>peelnode:
+                self.debug(3,"PeelOutputStack called with a peelnode not in the stack")
+
+        # output node stack: break the paragraph at a line break (0.43, SplitLinebreaks option)
+        # A new <p> with the same attributes (but not the ID) is started after the current one, and every node
+        # on the stack is re-opened in it, so the text goes on with the same formatting. This is what the old
+        # <temp:linebreak> and PostprocessLinebreak do, without moving any nodes later, but the output is not
+        # always the same, which is why SplitLinebreaks is off by default:
+        # - an image stays in the line it is in; the old pass moved it into the last line, so a code line can
+        #   now be a <p><codeph> with the image instead of joining the <codeblock>, and the other way around
+        # - paragraphs from a text box come before the following lines of the paragraph; the old pass put
+        #   those lines first
+        # - a footnote paragraph starting with a line break is not kept as a paragraph: <fn>gamma</fn>,
+        #   where the old pass gave <fn><p><note>gamma</note></p></fn> for a Note-style paragraph
+        # - lines holding only white space are paragraphs of their own, and PostprocessSpace clears them
+        # Nodes left with nothing in them at the end of the old paragraph held only the line break, so they go
+        def BreakParagraph():
+            self.FlushText()
+            for node in reversed(OutputNodes[1:]):
+                if not node.hasChildNodes():
+                    node.parentNode.removeChild(node)
+            Paragraph=OutputNodes[0]
+            NewParagraph=self.InitialOutputDOM.createElement("p")
+            CopyAttributes(Paragraph,NewParagraph)
+            self.CopyOtherprops(Paragraph,NewParagraph)
+            if NewParagraph.hasAttribute("id"):
+                NewParagraph.removeAttribute("id")
+            Paragraph.parentNode.insertBefore(NewParagraph,Paragraph.nextSibling)
+            Reopened[Paragraph]=NewParagraph
+            NewNodes=[NewParagraph]
+            for node in OutputNodes[1:]:
+                newnode=self.InitialOutputDOM.createElement(node.tagName)
+                CopyAttributes(node,newnode)
+                NewNodes[-1].appendChild(newnode)
+                NewNodes.append(newnode)
+                Reopened[node]=newnode
+                ReopenedNodes.append(newnode)
+            OutputNodes[:]=NewNodes
+            Paragraphs.append(NewParagraph)
+
+        # Set (only to true - this is a one way trigger) and get peeled flag
+        # FIXME: this is a hack, but namespace issues happen otherwise
+        def SetPeeled():
+            Peeled.append(1)
+        def GetPeeled():
+            if Peeled==[]:
+                return(False)
+            else:
+                return(True)
+
+        # LOCAL FUNCTION FOR PROCESSING TEXT
+        # Required because <text:span> can be nested
+        # Process all children of LocalInputNode into the current output node as per stack
+        # The style properties (character only are processed) are considered already set up
+        #  as by LocalStyleProperties
+        def LocalProcessText(LocalInputNode,LocalStyleProperties,DebugPrints=False):
+            if DebugPrints:
+                print "LocalProcessText called with DebugPrints"
+                print LocalStyleProperties
+            for childnode in LocalInputNode.childNodes:
+                # process plain text by copying it
+                if childnode.nodeType==xml.dom.Node.TEXT_NODE:
+                    self.AddTextAsChild(childnode.data,CurrentOutputNode())
+                
+                # process child elements
+                # FIXME: this currently is NOT verified to process every possible child as per spec!
+                #  (unprocessed child nodes will be logged at debug level 3)
+                if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                    if DebugPrints:
+                        print "processing node "+childnode.tagName+" with text:style-name: "+childnode.getAttribute("text:style-name")
                         print LocalStyleProperties
+                
+                    if childnode.tagName in ["text:description","text:sequence"]:
+                        # process contents as text
+                        LocalProcessText(childnode,LocalStyleProperties)
+                    elif childnode.tagName=="text:span":
+                        self.SpanCount=self.SpanCount+1
+                        SpanStyleKey=(LocalStyleProperties,childnode.getAttribute("text:style-name"))
+                        if SpanStyleKey in self.SpanStyles:
+                            self.SpanStyleHits=self.SpanStyleHits+1
+                            styleproperties=self.SpanStyles[SpanStyleKey]
+                        else:
+                            # get new style
+                            try:
+                                newstyleproperties=self.StylesDictionary[SpanStyleKey[1]]
+                            except KeyError:
+                                # a rare ODT issue - style not defined
+                                #!!TEMP
+                                #print "not found"
+                                newstyleproperties=LocalStyleProperties
+                            if DebugPrints:
+                                print LocalStyleProperties
+
+                            # form the real style properties - start with existing ones,
+                            # apply the "off" properties of the new style
+                            # and add any new character properties
+                            styleproperties=(LocalStyleProperties & ~CharacterOffMasks[newstyleproperties & MaskCharacterOff]) | (newstyleproperties & MaskCharacter)
+                            self.SpanStyles[SpanStyleKey]=styleproperties
+
+                        if DebugPrints:
+                            print LocalStyleProperties
+
+
+                        # !!TEMP
+                        if DebugPrints and childnode.getAttribute("text:style-name")=="T127":
+                            print "T127"
+                            print styleproperties
+                            print "local is"
+                            print LocalStyleProperties
 
                         
-                    # now we have the new style in styleproperties
-                    # first, check if any character style is currently on, but off in new style
-                    # and depending on this, ensure we set up the character style correctly
-
-                    # IMPORTANT: we are using a halfway house approach here
-                    # If the stack was ever peeled back to reset all character props
-                    #  then we just have to do it every single time within this paragraph,
-                    #  but this only happens if some prop was in a top level tag but not
-                    #  a bottom level one - a rare situation
+                        # now we have the new style in styleproperties
+                        # first, check if any character style is currently on, but off in new style
+                        # and depending on this, ensure we set up the character style correctly
 
-                    if ((LocalStyleProperties-styleproperties) & StylesCharacter)<>set([]) or GetPeeled():
-                        # We need to peel stack and re-setup all character style properties
+                        # IMPORTANT: we are using a halfway house approach here
+                        # If the stack was ever peeled back to reset all character props
+                        #  then we just have to do it every single time within this paragraph,
+                        #  but this only happens if some prop was in a top level tag but not
+                        #  a bottom level one - a rare situation
 
-                        #!!TEMP
-                        #print "peeling"
+                        if (LocalStyleProperties & ~styleproperties & MaskCharacter) or GetPeeled():
+                            # We need to peel stack and re-setup all character style properties
 
+                            #!!TEMP
+                            #print "peeling"
 
-                        SetPeeled()
-                        PeelOutputStack(CharacterRoot)
-                        for style in (styleproperties & StylesCharacter):
-                                StartOutputNode(StyleTags[style])
-                    else:
-                        # no character style property removal
-                        # just add any missing ones
-                        # and save the local root to return to after processing the text
 
-                        LocalRoot=CurrentOutputNode()
-                        for style in ((styleproperties-LocalStyleProperties) & StylesCharacter):
-                            StartOutputNode(StyleTags[style])
-
-                    # now, use recursion to process the contents of the span
-                    dp=False
-                    #if childnode.getAttribute("text:style-name")=="_7e_Special_20_term":
-                    #    dp=True
-                    LocalProcessText(childnode,styleproperties,dp)
-
-                    # get the old character style properties back before continuing
-                    if GetPeeled():
-                        # peel to character root and reset properties fully
-                        PeelOutputStack(CharacterRoot)
-                        for style in (LocalStyleProperties & StylesCharacter):
-                            StartOutputNode(StyleTags[style])
-                    else:
-                        # just get back to the local root, which still has the old properties
-                        PeelOutputStack(LocalRoot)
-                elif childnode.tagName=="draw:image" and not IsTitle: # process an image by creating an image tag
-                    imagenode=InitialOutputDOM.createElement("image")
-                    image_href=childnode.getAttribute("xlink:href")
-                    (image_root,image_ext)=os.path.splitext(image_href)
-                    if not (image_ext.lower() in [".jpg",".png"]):
-                        image_ext=".png"
-                    imagenode.setAttribute("href",image_root+image_ext)
-                    imagenode.setAttribute("placement","break")
-                    CurrentOutputNode().appendChild(imagenode)
-                    debug(3,"Image original "+image_href+" set as "+image_root+image_ext)
-                elif childnode.tagName.find("draw:")>-1 and not IsTitle: # draws other than image - process content as text node
-
-                    # 0.38 check for formula
+                            SetPeeled()
+                            PeelOutputStack(CharacterRoot)
+                            StartRun(StyleMaskTags(styleproperties & MaskCharacter))
+                        else:
+                            # no character style property removal
+                            # just add any missing ones
+                            # and save the local root to return to after processing the text
+
+                            LocalRoot=CurrentOutputNode()
+                            StartRun(StyleMaskTags(styleproperties & ~LocalStyleProperties & MaskCharacter))
+
+                        # now, use recursion to process the contents of the span
+                        dp=False
+                        #if childnode.getAttribute("text:style-name")=="_7e_Special_20_term":
+                        #    dp=True
+                        LocalProcessText(childnode,styleproperties,dp)
+
+                        # get the old character style properties back before continuing
+                        if GetPeeled():
+                            # peel to character root and reset properties fully
+                            PeelOutputStack(CharacterRoot)
+                            EmptyRun.extend(StartRun(StyleMaskTags(LocalStyleProperties & MaskCharacter)))
+                        else:
+                            # just get back to the local root, which still has the old properties
+                            PeelOutputStack(LocalRoot)
+                    elif childnode.tagName=="draw:image" and not IsTitle: # process an image by creating an image tag
+                        imagenode=self.InitialOutputDOM.createElement("image")
+                        image_href=childnode.getAttribute("xlink:href")
+                        (image_root,image_ext)=os.path.splitext(image_href)
+                        if not (image_ext.lower() in [".jpg",".png"]):
+                            image_ext=".png"
+                        imagenode.setAttribute("href",image_root+image_ext)
+                        imagenode.setAttribute("placement","break")
+                        CurrentOutputNode().appendChild(imagenode)
+                        self.debug(3,"Image original %s set as %s%s",image_href,image_root,image_ext)
+                    elif childnode.tagName.find("draw:")>-1 and not IsTitle: # draws other than image - process content as text node
+
+                        # 0.38 check for formula
                     
-                    foundFormula=False
-                    for grandchildnode in childnode.childNodes:
-                        if grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                            if grandchildnode.tagName=="svg:desc":
-                                descnode=grandchildnode.firstChild
-                                if descnode.nodeType==xml.dom.Node.TEXT_NODE:
-                                    if descnode.data.strip().lower()=="formula":
-                                        foundFormula=True
+                        foundFormula=False
+                        for grandchildnode in childnode.childNodes:
+                            if grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                                if grandchildnode.tagName=="svg:desc":
+                                    descnode=grandchildnode.firstChild
+                                    if descnode.nodeType==xml.dom.Node.TEXT_NODE:
+                                        if descnode.data.strip().lower()=="formula":
+                                            foundFormula=True
            
                     
-                    ProcessTextNode(childnode,False,OutputNode,foundFormula)
-                    # IMPORTANT: this may cause nested <p> tags!
-                    # fixed in postprocessing, to avoid further code clutter
-                elif childnode.tagName=="text:note" and not IsTitle:
-                    # process a footnote, or an endnote that becomes a footnote anyway
-                    # make an <fn> tag and process the footnote body into it
-                    fnnode=InitialOutputDOM.createElement("fn")
-                    CurrentOutputNode().appendChild(fnnode)
-                    for grandchildnode in childnode.childNodes:
-                        if grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                            if grandchildnode.tagName=="text:note-body":
-                                ProcessTextNode(grandchildnode,False,fnnode)
-                elif childnode.tagName=="text:s": # add spaces
-                    try:
-                        number=int(childnode.getAttribute("text:c"))
-                    except ValueError:
-                        number=1
-                    AddSpacesAsChild(number,CurrentOutputNode())
-                elif childnode.tagName=="text:tab": # FIXME: add 6 spaces - this may not be correct
-                    AddSpacesAsChild(6,CurrentOutputNode())
-                elif childnode.tagName=="text:a":
-                    # FIXME: only URI links for now
-                    # but nonprocessed links get text processed anyhow
-                    # if IsTitle, only process text anyway
-
-                    LocalRoot=CurrentOutputNode()
-                    linktarget=childnode.getAttribute("xlink:href")
-                    if (linktarget.lower().find("://")>-1 or linktarget.lower().find("mailto")>-1) \
-                       and not IsTitle:
-                        newnode=InitialOutputDOM.createElement("xref")
-                        CurrentOutputNode().appendChild(newnode)
-                        OutputNodes.append(newnode)
-                        newnode.setAttribute("scope","external")
-                        newnode.setAttribute("format","html")
-                        newnode.setAttribute("href",linktarget)
-                    LocalProcessText(childnode,LocalStyleProperties)
-                    PeelOutputStack(LocalRoot)                    
-                elif childnode.tagName=="text:line-break" and not IsTitle:
-                    # Processing a line break here would entail a new paragraph - too complicated
-                    # So we insert a <temp:linebreak> element and rely on postprocessing
-                    newnode=InitialOutputDOM.createElement("temp:linebreak")
-                    CurrentOutputNode().appendChild(newnode)
-                elif childnode.tagName in ["text:bookmark","text:bookmark-start"]:
-                    BookmarkID=childnode.getAttribute("text:name")
-                    #print "processing bookmark"
+                        self.ProcessTextNode(childnode,False,OutputNodes[0],foundFormula)
+                        # IMPORTANT: this may cause nested <p> tags!
+                        # fixed in postprocessing, to avoid further code clutter
+                    elif childnode.tagName=="text:note" and not IsTitle:
+                        # process a footnote, or an endnote that becomes a footnote anyway
+                        # make an <fn> tag and process the footnote body into it
+                        fnnode=self.InitialOutputDOM.createElement("fn")
+                        CurrentOutputNode().appendChild(fnnode)
+                        for grandchildnode in childnode.childNodes:
+                            if grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                                if grandchildnode.tagName=="text:note-body":
+                                    self.ProcessTextNode(grandchildnode,False,fnnode)
+                    elif childnode.tagName=="text:s": # add spaces
+                        try:
+                            number=int(childnode.getAttribute("text:c"))
+                        except ValueError:
+                            number=1
+                        self.AddSpacesAsChild(number,CurrentOutputNode())
+                    elif childnode.tagName=="text:tab": # FIXME: add 6 spaces - this may not be correct
+                        self.AddSpacesAsChild(6,CurrentOutputNode())
+                    elif childnode.tagName=="text:a":
+                        # FIXME: only URI links for now
+                        # but nonprocessed links get text processed anyhow
+                        # if IsTitle, only process text anyway
+
+                        LocalRoot=CurrentOutputNode()
+                        linktarget=childnode.getAttribute("xlink:href")
+                        if (linktarget.lower().find("://")>-1 or linktarget.lower().find("mailto")>-1) \
+                           and not IsTitle:
+                            newnode=self.InitialOutputDOM.createElement("xref")
+                            CurrentOutputNode().appendChild(newnode)
+                            OutputNodes.append(newnode)
+                            newnode.setAttribute("scope","external")
+                            newnode.setAttribute("format","html")
+                            newnode.setAttribute("href",linktarget)
+                        LocalProcessText(childnode,LocalStyleProperties)
+                        PeelOutputStack(LocalRoot)                    
+                    elif childnode.tagName=="text:line-break" and not IsTitle:
+                        # A line break means a new paragraph
+                        # Without SplitLinebreaks, we insert a <temp:linebreak> element and rely on postprocessing
+                        if self.Options.SplitLinebreaks and OutputNode.tagName=="p":
+                            BreakParagraph()
+                        else:
+                            newnode=self.InitialOutputDOM.createElement("temp:linebreak")
+                            CurrentOutputNode().appendChild(newnode)
+                            self.TempLinebreaks=True
+                    elif childnode.tagName in ["text:bookmark","text:bookmark-start"]:
+                        BookmarkID=childnode.getAttribute("text:name")
+                        #print "processing bookmark"
                     
-                    # Bookmark - first save it dictionary
-
-                    # saving REMOVED for 0.015
-                    #DocID=GetID(InitialOutputDOM)
-                    #Ref="#"+DocID
-                    #if not IsTitle:  # if this is a title, ref will be to whole doc, otehrwise to ID in doc
-                    #    Ref=Ref+"/"+BookmarkID
-                    #BookmarksDictionary[BookmarkID]=(DocID,Ref)
-
-                    # set the ID of the parent paragraph, or if it already exists, save duplicate
-                    if OutputNode.getAttribute("id")=="":
-                        OutputNode.setAttribute("id",BookmarkID)
-                    else:
-                        BookmarksDuplicate[BookmarkID]=OutputNode.getAttribute("id")
-                        #print "duplicate added at para proc: "+BookmarksDuplicate[BookmarkID]
+                        # Bookmark - first save it dictionary
+
+                        # saving REMOVED for 0.015
+                        #DocID=GetID(InitialOutputDOM)
+                        #Ref="#"+DocID
+                        #if not IsTitle:  # if this is a title, ref will be to whole doc, otehrwise to ID in doc
+                        #    Ref=Ref+"/"+BookmarkID
+                        #BookmarksDictionary[BookmarkID]=(DocID,Ref)
+
+                        # set the ID of the parent paragraph, or if it already exists, save duplicate
+                        if OutputNode.getAttribute("id")=="":
+                            OutputNode.setAttribute("id",BookmarkID)
+                        else:
+                            self.BookmarksDuplicate.Set(BookmarkID,OutputNode.getAttribute("id"))
+                            #print "duplicate added at para proc: "+BookmarksDuplicate[BookmarkID]
                         
-                elif childnode.tagName=="text:bookmark-ref":
-                    # Create a reference to the bookmark, with scope=local
-                    # NOTE: the actualy reference will be changed in postprocessing
-                    # FIXME? Currently we do NOT process text inside the ref, as DITA autogenerated link text
-                    #  is usually better
-                    newnode=InitialOutputDOM.createElement("xref")
-                    CurrentOutputNode().appendChild(newnode)
-                    newnode.setAttribute("scope","local")
-                    newnode.setAttribute("href",childnode.getAttribute("text:ref-name"))
-                elif childnode.tagName=="text:alphabetical-index-mark":
-                    # need to create an indexterm - in prolog keywords if IsTitle, on top of paragraph otherwise
-                    indextext=childnode.getAttribute("text:string-value")
-                    indexkey1=childnode.getAttribute("text:key1")
-                    # FIXME key2 not supported at present
+                    elif childnode.tagName=="text:bookmark-ref":
+                        # Create a reference to the bookmark, with scope=local
+                        # NOTE: the actualy reference will be changed in postprocessing
+                        # FIXME? Currently we do NOT process text inside the ref, as DITA autogenerated link text
+                        #  is usually better
+                        newnode=self.InitialOutputDOM.createElement("xref")
+                        CurrentOutputNode().appendChild(newnode)
+                        newnode.setAttribute("scope","local")
+                        newnode.setAttribute("href",childnode.getAttribute("text:ref-name"))
+                    elif childnode.tagName=="text:alphabetical-index-mark":
+                        # need to create an indexterm - in prolog keywords if IsTitle, on top of paragraph otherwise
+                        indextext=childnode.getAttribute("text:string-value")
+                        indexkey1=childnode.getAttribute("text:key1")
+                        # FIXME key2 not supported at present
                     
-                    global CurrentOutputKeywords
-                    if indextext<>"":
-                        if IsTitle:
-                            nodeforindexterm=CurrentOutputKeywords
-                        else:
-                            nodeforindexterm=OutputNode
-                        indextermnode=InitialOutputDOM.createElement("indexterm")
-                        nodeforindexterm.insertBefore(indextermnode,nodeforindexterm.firstChild)
-                        if indexkey1<>"":
-                            textnode=InitialOutputDOM.createTextNode(indexkey1)
+                        if indextext<>"":
+                            if IsTitle:
+                                nodeforindexterm=self.CurrentOutputKeywords
+                            else:
+                                nodeforindexterm=OutputNode
+                            indextermnode=self.InitialOutputDOM.createElement("indexterm")
+                            nodeforindexterm.insertBefore(indextermnode,nodeforindexterm.firstChild)
+                            if indexkey1<>"":
+                                textnode=self.InitialOutputDOM.createTextNode(indexkey1)
+                                indextermnode.appendChild(textnode)
+                                nodeforindexterm=indextermnode
+                                indextermnode=self.InitialOutputDOM.createElement("indexterm")
+                                nodeforindexterm.appendChild(indextermnode)
+                            textnode=self.InitialOutputDOM.createTextNode(indextext)
                             indextermnode.appendChild(textnode)
-                            nodeforindexterm=indextermnode
-                            indextermnode=InitialOutputDOM.createElement("indexterm")
-                            nodeforindexterm.appendChild(indextermnode)
-                        textnode=InitialOutputDOM.createTextNode(indextext)
-                        indextermnode.appendChild(textnode)
                         
                                 
-                else:
-                    unprocessed(LocalInputNode.tagName,childnode.tagName)
+                    else:
+                        self.unprocessed(LocalInputNode.tagName,childnode.tagName)
+
+        # MAIN FUNCTION BODY STARTS HERE
+        # set flag for paragraph start
+        self.IsStartParagraph=True
 
-    # MAIN FUNCTION BODY STARTS HERE
-    # set flag for paragraph start
-    global IsStartParagraph
-    IsStartParagraph=True
+        # Set up the output node stack  
+        OutputNodes=[OutputNode]
 
-    # Set up the output node stack  
-    OutputNodes=[OutputNode]
+        # Set up the peeled flag
+        Peeled=[]
 
-    # Set up the peeled flag
-    Peeled=[]
+        # Nodes started at the end of a span to go back to the formatting outside it, see StartRun
+        EmptyRun=[]
 
-    # if IsTitle, ignore any passed style properties
-    if IsTitle:
-        ParagraphStyleProperties=set([])
+        # Set up for line breaks: the paragraphs made from this one, the stack node re-opened for every
+        #  node that was on the stack at a break, and all the re-opened nodes
+        Paragraphs=[OutputNode]
+        Reopened={}
+        ReopenedNodes=[]
+
+        # if IsTitle, ignore any passed style properties
+        if IsTitle:
+            ParagraphStyleProperties=0
     
-    # process otherprops styles
-    # FIXME?: we put the otherprops in the parent tag without checking what tag it is
-    # while it probably can't break DITA or postprocessing, if anything does go wrong,
-    # check this as a possible reason
+        # process otherprops styles
+        # FIXME?: we put the otherprops in the parent tag without checking what tag it is
+        # while it probably can't break DITA or postprocessing, if anything does go wrong,
+        # check this as a possible reason
     
-    for style in (ParagraphStyleProperties & StylesOtherprops):
-        OutputNode.setAttribute("otherprops",OutputNode.getAttribute("otherprops")+StyleTags[style])
+        if ParagraphStyleProperties & MaskOtherprops:
+            self.Otherprops[OutputNode]=self.Otherprops.get(OutputNode,0) | (ParagraphStyleProperties & MaskOtherprops)
 
     
-    # process paragraph styles
-    for style in (ParagraphStyleProperties & StylesParagraph):
-        StartOutputNode(StyleTags[style])
+        # process paragraph styles
+        for tag in StyleMaskTags(ParagraphStyleProperties & MaskParagraph):
+            StartOutputNode(tag)
             
-    # node for peeling the stack to if we need to reset all character style properties
-    CharacterRoot=CurrentOutputNode()
+        # node for peeling the stack to if we need to reset all character style properties
+        CharacterRoot=CurrentOutputNode()
     
-    # process character styles
-    for style in (ParagraphStyleProperties & StylesCharacter):
-        StartOutputNode(StyleTags[style])
-
-    # process all text
-    LocalProcessText(InputNode, ParagraphStyleProperties)
-
-    # Remove all resulting empty elements
-    RemoveChildlessElementChildrenPara(OutputNode)
+        # process character styles
+        for tag in StyleMaskTags(ParagraphStyleProperties & MaskCharacter):
+            StartOutputNode(tag)
+
+        # process all text
+        LocalProcessText(InputNode, ParagraphStyleProperties)
+        self.FlushText()
+
+        # Remove re-opened nodes that got nothing after the line break, innermost first
+        for node in reversed(ReopenedNodes):
+            if node.parentNode<>None and not node.hasChildNodes():
+                node.parentNode.removeChild(node)
+
+        # Remove all resulting empty elements
+        for node in Paragraphs:
+            self.RemoveChildlessElementChildrenPara(node)
     
-# Process a table
-# InputNode is assumed to be a <table:table> element
-# Important: no table title is created, and no table head is used - all rows are in body
-# We assume any table head will be detected via otherprops, in postprocessing
-# This is to be fixed in postprocessing
-def ProcessTableNode(InputNode,OutputNode):
-
-    # Internal routine to process a row node
-    # Returns the table body node. This allows creation of the body within the routine
-    def ProcessRow(InputNode,IsHeaderRow=False):
-        # Table data has started. Create table core elements if they weer not created before
-        if TableStarted==[]:
-            TableStarted.append(1)
-            tablenode=InitialOutputDOM.createElement("table")
-            OutputNode.appendChild(tablenode)
+    # Process a table
+    # InputNode is assumed to be a <table:table> element
+    # Important: no table title is created, and no table head is used - all rows are in body
+    # We assume any table head will be detected via otherprops, in postprocessing
+    # This is to be fixed in postprocessing
+    def ProcessTableNode(self,InputNode,OutputNode):
+
+        # Internal routine to process a row node
+        # Returns the table body node. This allows creation of the body within the routine
+        def ProcessRow(InputNode,IsHeaderRow=False):
+            # Table data has started. Create table core elements if they weer not created before
+            if TableStarted==[]:
+                TableStarted.append(1)
+                tablenode=self.InitialOutputDOM.createElement("table")
+                OutputNode.appendChild(tablenode)
             
-            tgroupnode=InitialOutputDOM.createElement("tgroup")
-            tablenode.appendChild(tgroupnode)
-            tgroupnode.setAttribute("cols",str(ColumnCount))
-
-            for i in range (1,ColumnCount+1):
-                colspecnode=InitialOutputDOM.createElement("colspec")
-                tgroupnode.appendChild(colspecnode)
-                colspecnode.setAttribute("colname","col"+str(i))
-
-            # Create the TBody element. All rows are to be created in it.
-            body=InitialOutputDOM.createElement("tbody")
-            tgroupnode.appendChild(body)
-        else:
-            body=TBodyNode
+                tgroupnode=self.InitialOutputDOM.createElement("tgroup")
+                tablenode.appendChild(tgroupnode)
+                tgroupnode.setAttribute("cols",str(ColumnCount))
+
+                for i in range (1,ColumnCount+1):
+                    colspecnode=self.InitialOutputDOM.createElement("colspec")
+                    tgroupnode.appendChild(colspecnode)
+                    colspecnode.setAttribute("colname","col"+str(i))
+
+                # Create the TBody element. All rows are to be created in it.
+                body=self.InitialOutputDOM.createElement("tbody")
+                tgroupnode.appendChild(body)
+            else:
+                body=TBodyNode
         
-        RowNode=InitialOutputDOM.createElement("row")
-        body.appendChild(RowNode)
-
-        # process all cells
-        CurrentColumn=1
-        for grandchildnode in InputNode.childNodes:
-            if grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                if grandchildnode.tagName=="table:table-cell":
-                    EntryNode=InitialOutputDOM.createElement("entry")
-                    RowNode.appendChild(EntryNode)
-                    if IsHeaderRow:
-                        EntryNode.setAttribute("otherprops","header")
-                    spanned_string=grandchildnode.getAttribute("table:number-columns-spanned")
-                    if spanned_string=="":
-                        EntryNode.setAttribute("colname","col"+str(CurrentColumn))
-                        CurrentColumn=CurrentColumn+1
-                    else:
-                        spanned=int(spanned_string)
-                        EntryNode.setAttribute("namest","col"+str(CurrentColumn))
-                        EntryNode.setAttribute("nameend","col"+str(CurrentColumn+spanned-1))
-                        EntryNode.setAttribute("align","center")
-                        # FIXME? Alignment should be set as in table style?
-                        # but present approach is actually better for DITA uniformity
-                        CurrentColumn=CurrentColumn+spanned                          
+            RowNode=self.InitialOutputDOM.createElement("row")
+            body.appendChild(RowNode)
+
+            # process all cells
+            CurrentColumn=1
+            for grandchildnode in InputNode.childNodes:
+                if grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                    if grandchildnode.tagName=="table:table-cell":
+                        EntryNode=self.InitialOutputDOM.createElement("entry")
+                        RowNode.appendChild(EntryNode)
+                        if IsHeaderRow:
+                            self.Otherprops[EntryNode]=StyleBits["header"]
+                        spanned_string=grandchildnode.getAttribute("table:number-columns-spanned")
+                        if spanned_string=="":
+                            EntryNode.setAttribute("colname","col"+str(CurrentColumn))
+                            CurrentColumn=CurrentColumn+1
+                        else:
+                            spanned=int(spanned_string)
+                            EntryNode.setAttribute("namest","col"+str(CurrentColumn))
+                            EntryNode.setAttribute("nameend","col"+str(CurrentColumn+spanned-1))
+                            EntryNode.setAttribute("align","center")
+                            # FIXME? Alignment should be set as in table style?
+                            # but present approach is actually better for DITA uniformity
+                            CurrentColumn=CurrentColumn+spanned                          
 
-                    ProcessTextNode(grandchildnode,False,EntryNode)
-        return body
+                        self.ProcessTextNode(grandchildnode,False,EntryNode)
+            return body
 
     
-    global InTable
-    InTable=InTable+1
-    ColumnCount=0
-    TableStarted=[]  # Hack used as flag to show the table core elements were created
+        self.InTable=self.InTable+1
+        ColumnCount=0
+        TableStarted=[]  # Hack used as flag to show the table core elements were created
     
-    try:
-        for childnode in InputNode.childNodes:
-            if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                # 0.29 adding support for <table:table-header-columns>
-                if childnode.tagName=="table:table-header-columns":
-                    for grandchildnode in childnode.childNodes:
-                        if grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                            if grandchildnode.tagName=="table:table-column":
-                            # if table:number-columns-repeated is present, add this number to ColumnCount
-                            # if it is not present or not a number, just count the columns 
-                                try:
-                                    ColumnCount=ColumnCount+int(grandchildnode.getAttribute("table:number-columns-repeated"))
-                                except ValueError:
-                                    ColumnCount=ColumnCount+1
+        try:
+            for childnode in InputNode.childNodes:
+                if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                    # 0.29 adding support for <table:table-header-columns>
+                    if childnode.tagName=="table:table-header-columns":
+                        for grandchildnode in childnode.childNodes:
+                            if grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                                if grandchildnode.tagName=="table:table-column":
+                                # if table:number-columns-repeated is present, add this number to ColumnCount
+                                # if it is not present or not a number, just count the columns 
+                                    try:
+                                        ColumnCount=ColumnCount+int(grandchildnode.getAttribute("table:number-columns-repeated"))
+                                    except ValueError:
+                                        ColumnCount=ColumnCount+1
                         
-                if childnode.tagName=="table:table-column":
-                    # if table:number-columns-repeated is present, add this number to ColumnCount
-                    # if it is not present or not a number, just count the columns 
-                    try:
-                        ColumnCount=ColumnCount+int(childnode.getAttribute("table:number-columns-repeated"))
-                    except ValueError:
-                        ColumnCount=ColumnCount+1
-                elif childnode.tagName=="table:table-row":
-                    TBodyNode=ProcessRow(childnode)
-                elif childnode.tagName=="table:table-header-rows":
-                    for gcnode in childnode.childNodes:
-                        if gcnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                            if gcnode.tagName=="table:table-row":
-                                TBodyNode=ProcessRow(gcnode)
-    finally:
-        InTable=InTable-1
+                    if childnode.tagName=="table:table-column":
+                        # if table:number-columns-repeated is present, add this number to ColumnCount
+                        # if it is not present or not a number, just count the columns 
+                        try:
+                            ColumnCount=ColumnCount+int(childnode.getAttribute("table:number-columns-repeated"))
+                        except ValueError:
+                            ColumnCount=ColumnCount+1
+                    elif childnode.tagName=="table:table-row":
+                        TBodyNode=ProcessRow(childnode)
+                    elif childnode.tagName=="table:table-header-rows":
+                        for gcnode in childnode.childNodes:
+                            if gcnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                                if gcnode.tagName=="table:table-row":
+                                    TBodyNode=ProcessRow(gcnode)
+        finally:
+            self.InTable=self.InTable-1
                     
                     
 
-# Process a list
-# InputNode is assumed to be a <text:list> element
-def ProcessListNode(InputNode,OutputNode):
-    ColumnCount=0
-    ListStarted=False  # Flag to show the list element (ol/ul) was created
-
-    # Determine the list style name
-    # If it is not in the current tag get it from the stack
-    # If it IS in teh current tag, add it to the stack
-    # Also sets a flag whether to pop the stack at the end
-    # Note: stack is initialized with one member (empty string) so we don't check for empty stack
-    global ListStyleNamesStack
-    ListStyleName=InputNode.getAttribute("text:style-name")
-    if ListStyleName=="":
-        ListStyleName=ListStyleNamesStack[len(ListStyleNamesStack)-1]
-        StyleNameAppended=False
-    else:
-        ListStyleNamesStack.append(ListStyleName)
-        StyleNameAppended=True
+    # Process a list
+    # InputNode is assumed to be a <text:list> element
+    def ProcessListNode(self,InputNode,OutputNode):
+        ColumnCount=0
+        ListStarted=False  # Flag to show the list element (ol/ul) was created
+
+        # Determine the list style name
+        # If it is not in the current tag get it from the stack
+        # If it IS in teh current tag, add it to the stack
+        # Also sets a flag whether to pop the stack at the end
+        # Note: stack is initialized with one member (empty string) so we don't check for empty stack
+        ListStyleName=InputNode.getAttribute("text:style-name")
+        if ListStyleName=="":
+            ListStyleName=self.ListStyleNamesStack[len(self.ListStyleNamesStack)-1]
+            StyleNameAppended=False
+        else:
+            self.ListStyleNamesStack.append(ListStyleName)
+            StyleNameAppended=True
 
-    # Determine the list type string from the list style name
-    # First we find the dictionary of levels (if the style is undefined it's empty)
-    try:
-        ListLevels=ListStylesDictionary[ListStyleName]
-    except KeyError:
-        #print ListStylesDictionary
-        debug(3,"list style dictionary not found for: "+ListStyleName)
-        ListLevels={}
-    # Now implement the spec: if current level not found try lower levels
-    ListType=""
-    worklistlevel=CurrentListLevel
-    while ListType=="" and worklistlevel>0:
+        # Determine the list type string from the list style name
+        # First we find the dictionary of levels (if the style is undefined it's empty)
         try:
-            ListType=ListLevels[worklistlevel]
+            ListTypes=self.ListStylesDictionary[ListStyleName]
         except KeyError:
-            pass
-        worklistlevel=worklistlevel-1
-
-    # If type is still not found, default to bullet list
-    if ListType=="":
-        debug(3,"list style not found for: "+ListStyleName)
-        ListType="bullet"
+            #print ListStylesDictionary
+            self.debug(3,"list style dictionary not found for: %s",ListStyleName)
+            ListTypes=("",)
+        # The spec (if current level not found try lower levels) is implemented in ListTypes already
+        ListType=ListTypes[max(0,min(self.CurrentListLevel,len(ListTypes)-1))]
+
+        # If type is still not found, default to bullet list
+        if ListType=="":
+            self.debug(3,"list style not found for: %s",ListStyleName)
+            ListType="bullet"
         
-    # now process child nodes of the list, which are, by spec, text:list-header and text:list-item
-    for childnode in InputNode.childNodes:
-        if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-            if childnode.tagName=="text:list-header":
-                # process as normal text content, right into the parent node
-                # This is because DITA has no list headers by its spec but ODT does by its spec
-                ProcessTextNode(childnode,False,OutputNode)
-            elif childnode.tagName=="text:list-item":
-                # List data has started. Create list elements if not created before
-                if not ListStarted:
-                    ListStarted=True
-
-                    if ListType=="number":
-                        ListNode=InitialOutputDOM.createElement("ol")
-                    else:
-                        ListNode=InitialOutputDOM.createElement("ul")
-                    OutputNode.appendChild(ListNode)
+        # now process child nodes of the list, which are, by spec, text:list-header and text:list-item
+        for childnode in InputNode.childNodes:
+            if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                if childnode.tagName=="text:list-header":
+                    # process as normal text content, right into the parent node
+                    # This is because DITA has no list headers by its spec but ODT does by its spec
+                    self.ProcessTextNode(childnode,False,OutputNode)
+                elif childnode.tagName=="text:list-item":
+                    # List data has started. Create list elements if not created before
+                    if not ListStarted:
+                        ListStarted=True
+
+                        if ListType=="number":
+                            ListNode=self.InitialOutputDOM.createElement("ol")
+                        else:
+                            ListNode=self.InitialOutputDOM.createElement("ul")
+                        OutputNode.appendChild(ListNode)
                     
                 
-                # Now create and fill the list item node
-                ItemNode=InitialOutputDOM.createElement("li")
-                ListNode.appendChild(ItemNode)
-                ProcessTextNode(childnode,False,ItemNode)
-
-    # Finally, pop the list styles stack if needed
-    if StyleNameAppended:
-        ListStyleNamesStack.pop()
+                    # Now create and fill the list item node
+                    ItemNode=self.InitialOutputDOM.createElement("li")
+                    ListNode.appendChild(ItemNode)
+                    self.ProcessTextNode(childnode,False,ItemNode)
+
+        # Finally, pop the list styles stack if needed
+        if StyleNameAppended:
+            self.ListStyleNamesStack.pop()
         
 
 
-# Process a text node
-# if MainText then this is the main text node, <office:text>, or a <text:section> directly inside it
-# Here, output is always to InitialOutputBody and headings are processed with new files
-# mainText=False and OutputNode used for cells/items and other nested cases
-# 0.38: added isFormula. It is set if <svg:desc>formula</svg:desc> was found and then <draw:> is being processed
-def ProcessTextNode(InputNode,MainText=True,OutputNode=None,isFormula=False):
-
-    foundMathML=False   # 0.38 this flag is used if isFormula is True and we already found <draw:object>,
-                        # to exclude processing of <draw:image> after it
+    # Process a text node
+    # if MainText then this is the main text node, <office:text>, or a <text:section> directly inside it
+    # Here, output is always to InitialOutputBody and headings are processed with new files
+    # mainText=False and OutputNode used for cells/items and other nested cases
+    # 0.38: added isFormula. It is set if <svg:desc>formula</svg:desc> was found and then <draw:> is being processed
+    def ProcessTextNode(self,InputNode,MainText=True,OutputNode=None,isFormula=False):
 
+        foundMathML=False   # 0.38 this flag is used if isFormula is True and we already found <draw:object>,
+                            # to exclude processing of <draw:image> after it
 
 
     
-    if InputNode.nodeType<>xml.dom.Node.ELEMENT_NODE:
-        debug(1,"ProcessStyleNode: non-element node received")
-        # we can not process a non-element node so in this case we only output a debug message
-        return()
-
-    if MainText:
-        OutputNode=InitialOutputBody
-
-    for childnode in InputNode.childNodes:
-        if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-            if (childnode.tagName=="text:p") or ((childnode.tagName=="text:h") and (InTable>0)):
-                # process paragraph text
-                attr_stylename=childnode.getAttribute("text:style-name")
-#                try:
-#                    outlevel=StylesOutlineLevels[attr_stylename]
-#                except KeyError:
-#                    outlevel=0
-
-#                if attr_stylename.find("Head")>-1:
-#                    print attr_stylename+" "+str(outlevel)
-                
-                
-                
-                # 0.022: Frame Mode support for headingN names
-                if FrameMode and (attr_stylename in FrameModeStylesDictionary) and (InTable==0):
-                    # Process a Frame mode heading - create new title for later breakup into Output DOM
-                    # Save level into an attribute of the temp:topic node
-                    debug(3,"Frame Mode creating topic, style name: "+attr_stylename)
+        if InputNode.nodeType<>xml.dom.Node.ELEMENT_NODE:
+            self.debug(1,"ProcessStyleNode: non-element node received")
+            # we can not process a non-element node so in this case we only output a debug message
+            return()
 
-                    NewLevel=FrameModeStylesDictionary[attr_stylename]
+        if MainText:
+            OutputNode=self.InitialOutputBody
 
-                    # 0.31: the temp topic is always created under the main output body 
-                    TTNode=CreateNewTempTopic(InitialOutputBody)
-                    TTNode.setAttribute("level",str(NewLevel))
-                    
-                    # process the title
-                    ProcessParagraph(childnode,CurrentOutputTitle,set([]),True)
-                    MoveId(CurrentOutputTitle,TTNode)
-                    
-#                # 0.027: outline level support (COMMENTED OUT)
-#                elif (outlevel>0) and (InTable==0):
-#                    print "Triggered"
-#                    TTNode=CreateNewTempTopic(OutputNode)
-#                    TTNode.setAttribute("level",str(outlevel))
-#                    
-#                    # process the title
-#                    ProcessParagraph(childnode,CurrentOutputTitle,set([]),True)
-                    
-                
-                else:
-                    # process normal paragraph
-                    try:
-                        styleproperties=StylesDictionary[attr_stylename]
-                    except KeyError: styleproperties=set([]) # 0.40 added handling "style not defined" here
-                    paragraphnode=InitialOutputDOM.createElement("p")
-                    OutputNode.appendChild(paragraphnode)
-                    ProcessParagraph(childnode,paragraphnode,styleproperties)
-
-                    # After a paragraph was created - even if it was nested in another paragraph -
-                    # we need to process white space as in the start of a paragraph
-                    global IsStartParagraph
-                    IsStartParagraph=True
-            elif (childnode.tagName=="text:h") and (InTable==0):
-                # Process a heading - create new title for later breakup into Output DOM
+        for childnode in InputNode.childNodes:
+            if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                foundMathML=self.ProcessTextChild(childnode,InputNode.tagName,MainText,OutputNode,isFormula,foundMathML)
+
+    # Process one element child of a text node, as in ProcessTextNode
+    # Split out of ProcessTextNode in 0.43 so that streaming ingestion can feed top level blocks one at a time
+    # ParentTagName is only used for logging
+    # foundMathML is passed in from the previous sibling and the new value is returned
+    def ProcessTextChild(self,childnode,ParentTagName,MainText,OutputNode,isFormula,foundMathML):
+        if (childnode.tagName=="text:p") or ((childnode.tagName=="text:h") and (self.InTable>0)):
+            # process paragraph text
+            attr_stylename=childnode.getAttribute("text:style-name")
+    #                try:
+    #                    outlevel=StylesOutlineLevels[attr_stylename]
+    #                except KeyError:
+    #                    outlevel=0
+
+    #                if attr_stylename.find("Head")>-1:
+    #                    print attr_stylename+" "+str(outlevel)
+        
+        
+        
+            # 0.022: Frame Mode support for headingN names
+            if self.Options.FrameMode and (attr_stylename in self.FrameModeStylesDictionary) and (self.InTable==0):
+                # Process a Frame mode heading - create new title for later breakup into Output DOM
                 # Save level into an attribute of the temp:topic node
+                self.debug(3,"Frame Mode creating topic, style name: %s",attr_stylename)
 
+                NewLevel=self.FrameModeStylesDictionary[attr_stylename]
 
-                #print "HEADER FOUND"
-
+                # 0.31: the temp topic is always created under the main output body 
+                TTNode=self.CreateNewTempTopic(self.InitialOutputBody)
+                TTNode.setAttribute("level",str(NewLevel))
+            
+                # process the title
+                self.ProcessParagraph(childnode,self.CurrentOutputTitle,0,True)
+                self.MoveId(self.CurrentOutputTitle,TTNode)
+            
+    #                # 0.027: outline level support (COMMENTED OUT)
+    #                elif (outlevel>0) and (InTable==0):
+    #                    print "Triggered"
+    #                    TTNode=CreateNewTempTopic(OutputNode)
+    #                    TTNode.setAttribute("level",str(outlevel))
+    #                    
+    #                    # process the title
+    #                    ProcessParagraph(childnode,CurrentOutputTitle,set([]),True)
+            
+        
+            else:
+                # process normal paragraph
                 try:
-                    NewLevel=int(childnode.getAttribute("text:outline-level"))
-                except ValueError:
-                    NewLevel=1
+                    styleproperties=self.StylesDictionary[attr_stylename]
+                except KeyError: styleproperties=0 # 0.40 added handling "style not defined" here
+                paragraphnode=self.InitialOutputDOM.createElement("p")
+                OutputNode.appendChild(paragraphnode)
+                self.ProcessParagraph(childnode,paragraphnode,styleproperties)
 
-                TTNode=CreateNewTempTopic(InitialOutputBody)
-                TTNode.setAttribute("level",str(NewLevel))
-                # pre-0.15: CreateOutputDOM(NewLevel)
+                # After a paragraph was created - even if it was nested in another paragraph -
+                # we need to process white space as in the start of a paragraph
+                self.IsStartParagraph=True
+        elif (childnode.tagName=="text:h") and (self.InTable==0):
+            # Process a heading - create new title for later breakup into Output DOM
+            # Save level into an attribute of the temp:topic node
 
-                # process the title
-                ProcessParagraph(childnode,CurrentOutputTitle,set([]),True)
-                MoveId(CurrentOutputTitle,TTNode)
-                    
 
-                # pre-0.15: OutputNode=InitialOutputBody
-                
-                    
-            elif childnode.tagName=="draw:image": # process an image by creating an image tag
-                # 0.38 bypass image right after the MathML for a formula
-                if not foundMathML:
-                    imagenode=InitialOutputDOM.createElement("image")
-                    image_href=childnode.getAttribute("xlink:href")
-                    (image_root,image_ext)=os.path.splitext(image_href)
-                    if not (image_ext.lower() in [".jpg",".png"]):
-                         image_ext=".png"
-                    imagenode.setAttribute("href",image_root+image_ext)
-                    imagenode.setAttribute("placement","break")
-                    OutputNode.appendChild(imagenode)
-                    debug(3,"Image original "+image_href+" set as"+image_root+image_ext)
-            elif (childnode.tagName=="draw:object" and (isFormula or AggressiveFormula)): # 0.38 process the MathMLobject in a formula
-                fname=childnode.getAttribute("xlink:href")
-                if fname[:2]=="./":
-                    fname=fname[2:]
-                fname=fname+"/content.xml"
-                ToUnzip.add(fname)  # we will need to extract this MathML file
-                foundMathML=True
-
-                # now create the nodes
-                eqnode=InitialOutputDOM.createElement("equation-inline")
-                OutputNode.appendChild(eqnode)
-                mathmlnode=InitialOutputDOM.createElement("mathml")
-                eqnode.appendChild(mathmlnode)
-                mathmlrefnode=InitialOutputDOM.createElement("mathmlref")
-                mathmlrefnode.setAttribute("href",fname)
-                mathmlnode.appendChild(mathmlrefnode)                
-            elif childnode.tagName.find("draw:")>-1: # draws other than image - process content as text node
-                # 0.38 check for formula
-                foundFormula=False
-                for grandchildnode in childnode.childNodes:
-                    if grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                        if grandchildnode.tagName=="svg:desc":
-                            descnode=grandchildnode.firstChild
-                            if descnode.nodeType==xml.dom.Node.TEXT_NODE:
-                                if descnode.data.strip().lower()=="formula":
-                                    foundFormula=True
-
-                ProcessTextNode(childnode,False,OutputNode,foundFormula)
-            elif childnode.tagName=="table:table": # process table
-                ProcessTableNode(childnode,OutputNode)
-            elif childnode.tagName=="text:list":  # process list
-                global CurrentListLevel
-                CurrentListLevel+=1
-                ProcessListNode(childnode,OutputNode)
-                CurrentListLevel-=1
-            elif childnode.tagName=="text:section":  # process section - exactly the same as if it was not there
-                ProcessTextNode(childnode,MainText,OutputNode)
-                       
-            else:
-                unprocessed(InputNode.tagName,childnode.tagName+" in ProcessTextNode")
-    
-# == POSTPROCESSING ==============================================
+            #print "HEADER FOUND"
 
-# Service for postprocessing
-# Determine if a DITA node, presumed to be a paragraph-like entity (<p> or like it)
-# contains only stuff allowed in a "plain" paragraph, without images or anything, thus suitable
-# for a title, codeblock, etc
-# always true for non-Element nodes (this simplifies recursion)
-# IMPORTANT: relies on <p>s not being nested, so only for use after PostprocessFixNestedParagraphs
-
-def IsSimpleParagraph(node):
-    result=True
-    if node.nodeType==xml.dom.Node.ELEMENT_NODE:
-        if node.tagName in ["p","codeph","b","i"]:  # the usual formatting in a simple paragraph
-            # check all child nodes
-            for childnode in node.childNodes:
-                result=(result and IsSimpleParagraph(childnode))
-        else: # a different tag found - not a simple paragraph
-            result=False
-    return result
+            try:
+                NewLevel=int(childnode.getAttribute("text:outline-level"))
+            except ValueError:
+                NewLevel=1
 
-# Service: move id attribute from InputNode to OutputNode
-# If InputNode has no id, do nothing
-# if OutputNode already has an ID, replace the link in the table
-# remove the ID attribute from InputNode
-def MoveId(InputNode,OutputNode):
-    global BookmarksDictionary
-    if InputNode.hasAttribute("id"):
-        IDToMove=InputNode.getAttribute("id")
-        if OutputNode.hasAttribute("id") and OutputNode.getAttribute("id")<>IDToMove:
-            NewID=OutputNode.getAttribute("id")
-
-            # add to BookmarksDuplicate
-            BookmarksDuplicate[IDToMove]=NewID
-            #print "duplicate added at para move: "+BookmarksDuplicate[IDToMove]+" for ID "+IDToMove
-                        
+            TTNode=self.CreateNewTempTopic(self.InitialOutputBody)
+            TTNode.setAttribute("level",str(NewLevel))
+            # pre-0.15: CreateOutputDOM(NewLevel)
 
-            # If any entry in BookmarksDuplicate points to this ID, repoint it
-            for BookmarkID in BookmarksDuplicate:
-                if BookmarksDuplicate[BookmarkID]==IDToMove:
-                    BookmarksDuplicate[BookmarkID]=NewID
-                    #print "duplicate changed at para move: "+BookmarksDuplicate[IDToMove]+" for ID "+IDToMove
+            # process the title
+            self.ProcessParagraph(childnode,self.CurrentOutputTitle,0,True)
+            self.MoveId(self.CurrentOutputTitle,TTNode)
             
 
-
+            # pre-0.15: OutputNode=InitialOutputBody
+        
+            
+        elif childnode.tagName=="draw:image": # process an image by creating an image tag
+            # 0.38 bypass image right after the MathML for a formula
+            if not foundMathML:
+                imagenode=self.InitialOutputDOM.createElement("image")
+                image_href=childnode.getAttribute("xlink:href")
+                (image_root,image_ext)=os.path.splitext(image_href)
+                if not (image_ext.lower() in [".jpg",".png"]):
+                     image_ext=".png"
+                imagenode.setAttribute("href",image_root+image_ext)
+                imagenode.setAttribute("placement","break")
+                OutputNode.appendChild(imagenode)
+                self.debug(3,"Image original %s set as%s%s",image_href,image_root,image_ext)
+        elif (childnode.tagName=="draw:object" and (isFormula or self.Options.AggressiveFormula)): # 0.38 process the MathMLobject in a formula
+            fname=childnode.getAttribute("xlink:href")
+            if fname[:2]=="./":
+                fname=fname[2:]
+            fname=fname+"/content.xml"
+            self.ToUnzip.add(fname)  # we will need to extract this MathML file
+            foundMathML=True
+
+            # now create the nodes
+            eqnode=self.InitialOutputDOM.createElement("equation-inline")
+            OutputNode.appendChild(eqnode)
+            mathmlnode=self.InitialOutputDOM.createElement("mathml")
+            eqnode.appendChild(mathmlnode)
+            mathmlrefnode=self.InitialOutputDOM.createElement("mathmlref")
+            mathmlrefnode.setAttribute("href",fname)
+            mathmlnode.appendChild(mathmlrefnode)                
+        elif childnode.tagName.find("draw:")>-1: # draws other than image - process content as text node
+            # 0.38 check for formula
+            foundFormula=False
+            for grandchildnode in childnode.childNodes:
+                if grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                    if grandchildnode.tagName=="svg:desc":
+                        descnode=grandchildnode.firstChild
+                        if descnode.nodeType==xml.dom.Node.TEXT_NODE:
+                            if descnode.data.strip().lower()=="formula":
+                                foundFormula=True
+
+            self.ProcessTextNode(childnode,False,OutputNode,foundFormula)
+        elif childnode.tagName=="table:table": # process table
+            self.ProcessTableNode(childnode,OutputNode)
+        elif childnode.tagName=="text:list":  # process list
+            self.CurrentListLevel+=1
+            self.ProcessListNode(childnode,OutputNode)
+            self.CurrentListLevel-=1
+        elif childnode.tagName=="text:section":  # process section - exactly the same as if it was not there
+            self.ProcessTextNode(childnode,MainText,OutputNode)
+               
         else:
-            OutputNode.setAttribute("id",IDToMove)
-        InputNode.removeAttribute("id")
-
-# Save the "id" of a node which is to be removed
-# In case of failure (no next and previous element sibling,and the body element is the parent) output a warning and break link
-# If the node is not an element or has no ID, do nothing
-def SaveId(node):
-    if node.nodeType<>xml.dom.Node.ELEMENT_NODE:
-        return
-    if not node.hasAttribute("id"):
-        return
-    IDMoved=False
-    # First, check if the next sibling exists and is an element...
-    if node.nextSibling<>None:
-        if node.nextSibling.nodeType==xml.dom.Node.ELEMENT_NODE:
-            MoveId(node,node.nextSibling)
-            IDMoved=True
-    if not IDMoved:
-        # next, try the previous sibling...
-        if node.previousSibling<>None:
-            if node.previousSibling.nodeType==xml.dom.Node.ELEMENT_NODE:
-                MoveId(node,node.previousSibling)
+            self.unprocessed(ParentTagName,childnode.tagName+" in ProcessTextNode")
+        return foundMathML
+
+    # Process the content.xml file as a stream (0.43)
+    # Only <office:automatic-styles> and the top level blocks of <office:text> are expanded into DOM nodes,
+    # one at a time, and each is discarded after processing. So memory use on the input side depends
+    # on the largest single block, not on the whole document
+    # A <text:section> is processed exactly as if it was not there, so we do not expand it but
+    # treat its children as top level blocks too
+    def ProcessContentStream(self,InputStream):
+        events=xml.dom.pulldom.parse(InputStream)
+
+        # Tag names of the currently open elements, root first
+        # Expanded elements are closed by expandNode, so we pop them ourselves
+        OpenTags=[]
+
+        # Open elements whose element children are the top level blocks - <office:text> and sections in it
+        # Each member is a list [depth,foundMathML], depth being the length of OpenTags for the element
+        Containers=[]
+
+        for (event,node) in events:
+            if event==xml.dom.pulldom.START_ELEMENT:
+                OpenTags.append(node.tagName)
+                if Containers<>[] and len(OpenTags)==Containers[-1][0]+1:
+                    if node.tagName=="text:section":
+                        Containers.append([len(OpenTags),False])
+                    else:
+                        events.expandNode(node)
+                        OpenTags.pop()
+                        # SAX may deliver text in several pieces - join them as minidom.parse would have
+                        node.normalize()
+                        with self.Report.Phase("ProcessTextNode"):
+                            Containers[-1][1]=self.ProcessTextChild(node,OpenTags[-1],True,self.InitialOutputBody,False,Containers[-1][1])
+                        node.unlink()
+                elif len(OpenTags)==2 and node.tagName=="office:automatic-styles":
+                    events.expandNode(node)
+                    OpenTags.pop()
+                    with self.Report.Phase("ProcessStylesNode"):
+                        self.ProcessStylesNode(node)
+                    node.unlink()
+                elif len(OpenTags)==3 and OpenTags[1]=="office:body" and node.tagName=="office:text":
+                    Containers.append([len(OpenTags),False])
+            elif event==xml.dom.pulldom.END_ELEMENT:
+                if Containers<>[] and len(OpenTags)==Containers[-1][0]:
+                    Containers.pop()
+                OpenTags.pop()
+
+    # == POSTPROCESSING ==============================================
+
+    # Service: move id attribute from InputNode to OutputNode
+    # If InputNode has no id, do nothing
+    # if OutputNode already has an ID, replace the link in the table
+    # remove the ID attribute from InputNode
+    def MoveId(self,InputNode,OutputNode):
+        if InputNode.hasAttribute("id"):
+            self.Report.Count("IDs moved")
+            IDToMove=InputNode.getAttribute("id")
+            if OutputNode.hasAttribute("id") and OutputNode.getAttribute("id")<>IDToMove:
+                NewID=OutputNode.getAttribute("id")
+
+                # add to BookmarksDuplicate
+                # entries that point to this ID follow it
+                self.BookmarksDuplicate.Set(IDToMove,NewID)
+                #print "duplicate added at para move: "+BookmarksDuplicate[IDToMove]+" for ID "+IDToMove
+
+            else:
+                OutputNode.setAttribute("id",IDToMove)
+            InputNode.removeAttribute("id")
+
+    # Copy the otherprops marks of InputNode to OutputNode, replacing any it has, as CopyAttributes
+    #  did with the otherprops attribute; if InputNode has none, OutputNode is not changed
+    def CopyOtherprops(self,InputNode,OutputNode):
+        if InputNode in self.Otherprops:
+            self.Otherprops[OutputNode]=self.Otherprops[InputNode]
+
+    # Check if node is marked with the otherprops style property name ("caption","header","monospace")
+    def HasOtherprops(self,node,name):
+        return (self.Otherprops.get(node,0) & StyleBits[name])<>0
+
+    # Save the "id" of a node which is to be removed
+    # In case of failure (no next and previous element sibling,and the body element is the parent) output a warning and break link
+    # If the node is not an element or has no ID, do nothing
+    def SaveId(self,node):
+        if node.nodeType<>xml.dom.Node.ELEMENT_NODE:
+            return
+        if not node.hasAttribute("id"):
+            return
+        IDMoved=False
+        # First, check if the next sibling exists and is an element...
+        if node.nextSibling<>None:
+            if node.nextSibling.nodeType==xml.dom.Node.ELEMENT_NODE:
+                self.MoveId(node,node.nextSibling)
+                IDMoved=True
+        if not IDMoved:
+            # next, try the previous sibling...
+            if node.previousSibling<>None:
+                if node.previousSibling.nodeType==xml.dom.Node.ELEMENT_NODE:
+                    self.MoveId(node,node.previousSibling)
+                    IDMoved=True
+        if not IDMoved:
+            # next, try the parent...
+            if not (node.parentNode.tagName in ["conbody","section","context"]):
+                self.MoveId(node,node.parentNode)
                 IDMoved=True
-    if not IDMoved:
-        # next, try the parent...
-        if not (node.parentNode.tagName in ["conbody","section","context"]):
-            MoveId(node,node.parentNode)
-            IDMoved=True
-    if not IDMoved:
-        FailedID=node.getAttribute("id")
-        debug(1,"Failed to move id: "+FailedID)
-        # break link via BookmarksDuplicate
-        BookmarksDuplicate[FailedID]=None
-
-        # If any entry in BookmarksDuplicate points to this ID, repoint it
-        for BookmarkID in BookmarksDuplicate:
-            if BookmarksDuplicate[BookmarkID]==FailedID:
-                BookmarksDuplicate[BookmarkID]=None    
+        if not IDMoved:
+            FailedID=node.getAttribute("id")
+            self.debug(1,"Failed to move id: %s",FailedID)
+            # break link via BookmarksDuplicate
+            # entries that point to this ID are broken too
+            self.BookmarksDuplicate.Set(FailedID,None)
 
         
 
-# Service: remove all non-alpha characters from beginning of text under a DITA node
-def RemoveAllBeforeAlpha(node):
-    if node.nodeType<>xml.dom.Node.ELEMENT_NODE:
-        debug(1,"RemoveAllBeforeAlpha called on non-element node!")
-        return
-    firsttext=FindFirstText(node)
-    NeedMoreWork=True
-    while (firsttext<>None) and NeedMoreWork:
-        try:
-            while not firsttext.data[0].isalpha():
-                firsttext.data=firsttext.data[1:]
-        except IndexError:pass
-        if firsttext.data=='':
-            DestroyNode(firsttext)
-            firsttext=FindFirstText(node)
-        else:
-            NeedMoreWork=False
-
-# Service: get the text content of a node, as one string
-def GetTextAsString(node):
-    if node.nodeType==xml.dom.Node.TEXT_NODE:
-        return node.data
-    elif node.nodeType==xml.dom.Node.ELEMENT_NODE:
-        result=""
-        for childnode in node.childNodes:
-            result=result+GetTextAsString(childnode)
-        return result
-
-# Service: do a replace in the text content of a node
-# FIXME: does not handle cases when the replace would straddle text nodes
-def ReplaceText(node,old,new):
-    if node.nodeType==xml.dom.Node.TEXT_NODE:
-        node.data=node.data.replace(old,new)
-    elif node.nodeType in [xml.dom.Node.ELEMENT_NODE,xml.dom.Node.DOCUMENT_NODE]:
-        for childnode in node.childNodes:
-            ReplaceText(childnode,old,new)
+    # Service: remove all non-alpha characters from beginning of text under a DITA node
+    def RemoveAllBeforeAlpha(self,node):
+        if node.nodeType<>xml.dom.Node.ELEMENT_NODE:
+            self.debug(1,"RemoveAllBeforeAlpha called on non-element node!")
+            return
+        firsttext=FindFirstText(node)
+        NeedMoreWork=True
+        while (firsttext<>None) and NeedMoreWork:
+            try:
+                while not firsttext.data[0].isalpha():
+                    firsttext.data=firsttext.data[1:]
+            except IndexError:pass
+            if firsttext.data=='':
+                self.DestroyNode(firsttext)
+                firsttext=FindFirstText(node)
+            else:
+                NeedMoreWork=False
     
-# Service: elevate an element node so its parent is within a set of tag names
-# (or is the Document - flag this as an error)
-# NOTE: we have to pass the DOM to this as well, because the DOM is used to create new elements
-def ElevateNode(node,AllowedParentTagNames,DOM):
-    # move node up by breaking up the previous one, one step at a time
-    # for example, it was <node1>11<node2>22<p>text</p>22</node2>11</node1>
-    # then it becomes: <node1>11<node2>22</node2><p>text</p><node2>22</node2>11</node1>
-    # and finally: <node1>11<node2>22</node2></node1><p>text</p><node1><node2>22</node2>11</node1>
-    # if <p> is the sole child of a parent node, that parent node is simply destroyed,
-    #  with <p> taking its place
-    try:
-        while not (node.parentNode.tagName in AllowedParentTagNames):
-            parent=node.parentNode
-            newparent=parent.parentNode
-            parenttag=parent.tagName
-            # As the parent will be destroyed, move its ID to its first child - which may or may not be
-            # the node being elevated
-            MoveId(parent,parent.firstChild)
-
-            if node.previousSibling<>None:
-                newprevious=DOM.createElement(parenttag)
-                newparent.insertBefore(newprevious,parent)
-                CopyAttributes(parent,newprevious)
-                while node.previousSibling<>None:
-                    newprevious.appendChild(parent.firstChild)
-
-            if node.nextSibling<>None:
-                newnext=DOM.createElement(parenttag)
-                newparent.insertBefore(newnext,parent.nextSibling)
-                CopyAttributes(parent,newnext)
-                while node.nextSibling<>None:
-                    newnext.appendChild(node.nextSibling)
-
-            newparent.insertBefore(node,parent)
-            newparent.removeChild(parent)
-            parent.unlink()
-    except AttributeError:
-        debug(1,"ElevateNode: node apparently raised to document - report error")
+    # Service: elevate an element node so its parent is within a set of tag names
+    # (or is the Document - flag this as an error)
+    # NOTE: we have to pass the DOM to this as well, because the DOM is used to create new elements
+    def ElevateNode(self,node,AllowedParentTagNames,DOM):
+        # move node up by breaking up the previous one, one step at a time
+        # for example, it was <node1>11<node2>22<p>text</p>22</node2>11</node1>
+        # then it becomes: <node1>11<node2>22</node2><p>text</p><node2>22</node2>11</node1>
+        # and finally: <node1>11<node2>22</node2></node1><p>text</p><node1><node2>22</node2>11</node1>
+        # if <p> is the sole child of a parent node, that parent node is simply destroyed,
+        #  with <p> taking its place
+        try:
+            while not (node.parentNode.tagName in AllowedParentTagNames):
+                parent=node.parentNode
+                newparent=parent.parentNode
+                parenttag=parent.tagName
+                # As the parent will be destroyed, move its ID to its first child - which may or may not be
+                # the node being elevated
+                self.MoveId(parent,parent.firstChild)
+
+                if node.previousSibling<>None:
+                    newprevious=DOM.createElement(parenttag)
+                    newparent.insertBefore(newprevious,parent)
+                    CopyAttributes(parent,newprevious)
+                    self.CopyOtherprops(parent,newprevious)
+                    while node.previousSibling<>None:
+                        newprevious.appendChild(parent.firstChild)
+
+                if node.nextSibling<>None:
+                    newnext=DOM.createElement(parenttag)
+                    newparent.insertBefore(newnext,parent.nextSibling)
+                    CopyAttributes(parent,newnext)
+                    self.CopyOtherprops(parent,newnext)
+                    while node.nextSibling<>None:
+                        newnext.appendChild(node.nextSibling)
+
+                newparent.insertBefore(node,parent)
+                newparent.removeChild(parent)
+                parent.unlink()
+        except AttributeError:
+            self.debug(1,"ElevateNode: node apparently raised to document - report error")
     
 
     
 
 
+    # Break paragraphs into two where a <temp:linebreak> is encountered
+    def PostprocessLinebreak(self,DOM):
+        LNodes=DOM.getElementsByTagName("temp:linebreak")
+        for node in LNodes:
+            # Move the line break all the way up into the <p>, by breaking up nodes below the <p>
+            # IMPORTANT: this will lead to an error if <p> is not among the parents
+            # but we assume it is
 
-# Break paragraphs into two where a <temp:linebreak> is encountered
-def PostprocessLinebreak(DOM):
-    LNodes=DOM.getElementsByTagName("temp:linebreak")
-    for node in LNodes:
-        # Move the line break all the way up into the <p>, by breaking up nodes below the <p>
-        # IMPORTANT: this will lead to an error if <p> is not among the parents
-        # but we assume it is
-
-        ElevateNode(node,["p"],DOM)
-        
-
-        # Now create a new paragraph before the current one, and move all nodes before the linebreak to it
-        CurrentParagraph=node.parentNode  # This is a <p> because of the previous loop
-        NewPrevParagraph=DOM.createElement("p")
-        MoveId(CurrentParagraph,NewPrevParagraph)
-        CurrentParagraph.parentNode.insertBefore(NewPrevParagraph,CurrentParagraph)
-        CopyAttributes(CurrentParagraph,NewPrevParagraph)
-        while node.previousSibling<>None:
-            NewPrevParagraph.appendChild(node.parentNode.firstChild)
-
-    # Now that the work has been done, destroy the <temp:linebreak> nodes
-    for node in LNodes:
-        DestroyNode(node)
-            
+            self.ElevateNode(node,["p"],DOM)
         
-# Elevate all temp:topic elements into the body - no longer needed in 0.31 
-#def PostprocessElevateTempTopic(DOM):
-#    TNodes=DOM.getElementsByTagName("temp:topic")
-#    for node in TNodes:
-#        ElevateNode(node,"conbody",DOM)
-    
-
 
-# Fix <p> tags inside tags that can't contain them
-# This postprocessing step is required because of the way the main processing works
-# Perhaps we need to do this for some other tags? For <p> it's certain
-# First, a piece of data - which tags can contain <p>
-# WARNING: This is from DITA help and IS PROBABLY TOO MUCH
-# If illicit <p>s show up, the tag om which they show up must be removed from here
-CanContainP=["dita","data","title","shortdesc","desc","note","lq","q","sli",
-             "li","itemgroup","dthd","ddhd","dt","dd","fig","figgroup","pre",
-             "lines","ph","alt","object","stentry","draft-comment","fn",
-             "indexterm","index-base","cite","xref","table","tgroup","entry",
-             "author","source","publisher","copyright","copyrholder","category",
-             "keywords","prodinfo","prodname","brand","series","platform","prognum",
-             "featnum","component","topic","navtitle","searchtitle","abstract",
-             "body","section","example","prolog","metadata","related-links",
-             "linktext","linkinfo","linkpool","concept","conbody","task","taskbody",
-             "prereq","context","steps","steps-unordered","step","cmd","info",
-             "substeps","substep","tutorialinfo","stepxmp","choice","chhead",
-             "choptionhd","chdeschd","chrow","choption","chdesc","stepresult","result",
-             "postreq","reference","refbody","refsyn","properties","prophead",
-             "proptypehd","propvaluehd","propdeschd","property","proptype","propvalue",
-             "propdesc","glossentry","glossterm","glossdef","uicontrol","screen",
-             "tt","sup","sub","codeph","codeblock","var","synph","oper","delim","sep",
-             "parml","plentry","pt","pd","syntaxdiagram","synblk","groupseq",
-             "groupchoice","groupcomp","fragment","fragref","synnote","repsep",
-             "msgph","msgblock","filepath","userinput","systemoutput","area","coords",
-             "index-see","index-see-also","index-sort-as"]
-def PostprocessFixNestedParagraphs(DOM):
-    # the obvious and wrong solution is a simple scan of DOM.getElementsByTagName()
-    # but every raise of a <p> disrupts node structure and might delete any of the found nodes
-    # so we have to scan anew each time, until we find no illicitly located <p>s
-
-    SearchAgain=True
-
-    while SearchAgain:
-        SearchAgain=False
-        PNodes=DOM.getElementsByTagName("p")
+            # Now create a new paragraph before the current one, and move all nodes before the linebreak to it
+            CurrentParagraph=node.parentNode  # This is a <p> because of the previous loop
+            NewPrevParagraph=DOM.createElement("p")
+            self.MoveId(CurrentParagraph,NewPrevParagraph)
+            CurrentParagraph.parentNode.insertBefore(NewPrevParagraph,CurrentParagraph)
+            CopyAttributes(CurrentParagraph,NewPrevParagraph)
+            self.CopyOtherprops(CurrentParagraph,NewPrevParagraph)
+            while node.previousSibling<>None:
+                NewPrevParagraph.appendChild(node.parentNode.firstChild)
+
+        # Now that the work has been done, destroy the <temp:linebreak> nodes
+        for node in LNodes:
+            self.DestroyNode(node)
+    # Elevate all temp:topic elements into the body - no longer needed in 0.31 
+    #def PostprocessElevateTempTopic(DOM):
+    #    TNodes=DOM.getElementsByTagName("temp:topic")
+    #    for node in TNodes:
+    #        ElevateNode(node,"conbody",DOM)
+
+
+    # Fix <p> tags inside tags that can't contain them
+    # This postprocessing step is required because of the way the main processing works
+    # Perhaps we need to do this for some other tags? For <p> it's certain
+    # The tags that can contain <p> are in CanContainP
+    # Found, if given, is from a TagWalk or GetElementsByTagNames for "p"
+    def PostprocessFixNestedParagraphs(self,DOM,Found=None):
+        # Until 0.43 the DOM was scanned anew after every raise of a <p>, because the raise disrupts node structure
+        # ElevateNode only removes (and unlinks) the parents of the node it raises, putting copies with the same
+        # tag names in their place, and keeps all other nodes in document order. A removed parent can be a <p>,
+        # when a <p> nested in a <p> is raised; but a parent comes earlier in document order than the node,
+        # so it has been handled already, and whether any <p> still to come is in the right place does not change.
+        # So the <p>s found in one scan are all the work there is, and they are raised in one pass in document order
+        # The <p>s that a raise creates by splitting a parent <p> go where that parent was, which is
+        # a parent that can contain <p>, as any misplaced <p> above them was raised first
+
+        if Found==None:
+            Found=GetElementsByTagNames(DOM,["p"])
+        PNodes=Found["p"]
         for node in PNodes:
             if not (node.parentNode.tagName in CanContainP):
-                SearchAgain=True
-                ElevateNode(node,CanContainP,DOM)
-                break
-
+                self.ElevateNode(node,CanContainP,DOM)
 
 
-# Move blank space only <b> and <i> and <note> text into parent tags and destroy b/i/note (but not codeph) 
-# Then, blank space only paragraphs into empty paragraphs
-# We don't remove them at this stage as they may be needed, notably for code blocks
-def PostprocessSpace(DOM):
+    # Move blank space only <b> and <i> and <note> text into parent tags and destroy b/i/note (but not codeph) 
+    # Then, blank space only paragraphs into empty paragraphs
+    # We don't remove them at this stage as they may be needed, notably for code blocks
+    def PostprocessSpace(self,DOM):
 
-    # Internal text to see if there is anything except whitespace in a node, using recursion
-    # IMPORTANT: relies on all nodes being <p> or formatting, so only used after IsSimpleParagraph check
-    def IsBlank(node):
-        if node.nodeType==xml.dom.Node.TEXT_NODE:
-            return (node.data.isspace() or (node.data==''))
-        elif node.nodeType==xml.dom.Node.ELEMENT_NODE:
-            Blank=True
-            for childnode in node.childNodes:
-                Blank=(Blank and IsBlank(childnode))
-            return Blank
-        else: return True
+        # Internal text to see if there is anything except whitespace in a node, using recursion
+        # IMPORTANT: relies on all nodes being <p> or formatting, so only used after IsSimpleParagraph check
+        def IsBlank(node):
+            if node.nodeType==xml.dom.Node.TEXT_NODE:
+                return (node.data.isspace() or (node.data==''))
+            elif node.nodeType==xml.dom.Node.ELEMENT_NODE:
+                Blank=True
+                for childnode in node.childNodes:
+                    Blank=(Blank and IsBlank(childnode))
+                return Blank
+            else: return True
         
-    # move whitespace only <b>/<i>/<note> into parent
-    # note: has to be done repeatedly until no hits are found, because they might be nested
-    # only works if there are no children except one text - this is on purpose
-    NeedMoreWork=True
-    while NeedMoreWork:
-        NeedMoreWork=False
-        NodesToDelete=[]
-        for tag in ["b","i","note"]:
-            TNodes=DOM.getElementsByTagName(tag)
-            for TNode in TNodes:
-                if TNode.hasChildNodes():
-                    if TNode.firstChild==TNode.lastChild:
-                        if TNode.firstChild.nodeType==xml.dom.Node.TEXT_NODE:
-                            if TNode.firstChild.data.isspace():
-                                # found a space-only child
-                                TNode.parentNode.insertBefore(TNode.firstChild,TNode)
-                                NodesToDelete.append(TNode)
-                                NeedMoreWork=True
-        for node in NodesToDelete:
-            DestroyNode(node)
+        # move whitespace only <b>/<i>/<note> into parent
+        # note: has to be done repeatedly until no hits are found, because they might be nested
+        # only works if there are no children except one text - this is on purpose
+        # the <p>s are found in the same walk; the walk of the last round is up to date as nothing was deleted in it
+        NeedMoreWork=True
+        while NeedMoreWork:
+            NeedMoreWork=False
+            NodesToDelete=[]
+            Found=GetElementsByTagNames(DOM,["b","i","note","p"],self.Report)
+            for tag in ["b","i","note"]:
+                TNodes=Found[tag]
+                for TNode in TNodes:
+                    if TNode.hasChildNodes():
+                        if TNode.firstChild==TNode.lastChild:
+                            if TNode.firstChild.nodeType==xml.dom.Node.TEXT_NODE:
+                                if TNode.firstChild.data.isspace():
+                                    # found a space-only child
+                                    TNode.parentNode.insertBefore(TNode.firstChild,TNode)
+                                    NodesToDelete.append(TNode)
+                                    NeedMoreWork=True
+            for node in NodesToDelete:
+                self.DestroyNode(node)
                             
     
-    # handle blank paragraphs
-    PNodes=DOM.getElementsByTagName("p")
-    for node in PNodes:
-        if IsSimpleParagraph(node):
-            if IsBlank(node):
-                # remove all children but leave node intact
-                for childnode in node.childNodes:
-                    DestroyNode(childnode)
+        # handle blank paragraphs
+        PNodes=Found["p"]
+        for node in PNodes:
+            if IsSimpleParagraph(node):
+                if IsBlank(node):
+                    # remove all children but leave node intact
+                    for childnode in node.childNodes:
+                        self.DestroyNode(childnode)
         
     
 
     
-# Join immediately adjacent <ul> lists
-def PostprocessJoinLists(DOM):
-    # initialize list of nodes to delete
-    # make it a set, just to avoid duplicates
-    NodesToDelete=set([])
-
-    ulNodes=DOM.getElementsByTagName("ul")
-    for node in ulNodes:
-        if node.previousSibling<>None:
-            if node.previousSibling.nodeType==xml.dom.Node.ELEMENT_NODE:
-                if node.previousSibling.tagName=="ul":
-                    # the previous sibling is another list - need to merge
-                    # but first we need to check if this is not set for deletion,
-                    # and if it is move to previous siblings until finding a list not set for deletion
-                    # this allows normal merging of 3+ lists without repeated iterations
-                    destination=node.previousSibling
-                    while destination in NodesToDelete:
-                        destination=destination.previousSibling
-                        # if the new destination is not a <ul> something is broken in this code
-                        # (because only nodes after a <ul> can be flagged for deletion)
-                        # report error and quit function immediately
-                        if destination==None:
-                            debug(0,"Internal error in PostprocessJoinLists - no previous sibling")
-                            return()
-                        if not destination.nodeType==xml.dom.Node.ELEMENT_NODE:
-                            debug(0,"Internal error in PostprocessJoinLists - previous sibling not element")
-                            return()
-                        if not destination.tagName=="ul":
-                            debug(0,"Internal error in PostprocessJoinLists - previous sibling not <ul>")
-                            return()
-
-                    # move all child nodes and ID to destination, and flad the node for deletion
-                    MoveChildNodes(node,destination)
-                    MoveId(node,destination)
-                    NodesToDelete.add(node)
-
-    # delete the flagged nodes
-    for node in NodesToDelete:
-        node.parentNode.removeChild(node)
-        node.unlink()
-
-# 0.29 Fix nexted lists where each nesting only has one <li> and a list in there -
-# an artefact of ODT nested list processsing
-# Intentionally called *after* PostprocessJoinLists to avoid undesirable joining
-def PostprocessNestedOneLists(DOM):
-    listtags=["ul","ol"]
-    for nowtag in listtags:
-        foundlists=DOM.getElementsByTagName(nowtag)
-        MoreWork=True
-        while MoreWork:
-            Triggered=False
-            for listnode in foundlists:
-                if listnode.hasChildNodes():
-                    if listnode.firstChild==listnode.lastChild:
-                        childnode=listnode.firstChild
-                        if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                            if childnode.tagName=="li": # so far we have only one child and it is <li>
-                                if childnode.hasChildNodes():
-                                    if childnode.firstChild==childnode.lastChild:
-                                        grandchildnode=childnode.firstChild
-                                        if grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                                                if grandchildnode.tagName in listtags:
-                                                    # we have the specific situation
-                                                    # lift the newfound list before the list node,
-                                                    # remove the list node and start again
-                                                    listnode.parentNode.insertBefore(grandchildnode,listnode)
-                                                    DestroyNode(listnode)
-                                                    Triggered=True
-                                                    break # will apply to the for loop
-            MoreWork=Triggered
+    # Join immediately adjacent <ul> lists
+    # Found, if given, is from a TagWalk or GetElementsByTagNames for "ul"
+    def PostprocessJoinLists(self,DOM,Found=None):
+        # initialize list of nodes to delete
+        # make it a set, just to avoid duplicates
+        NodesToDelete=set([])
+
+        if Found==None:
+            Found=GetElementsByTagNames(DOM,["ul"])
+        ulNodes=Found["ul"]
+        for node in ulNodes:
+            if node.previousSibling<>None:
+                if node.previousSibling.nodeType==xml.dom.Node.ELEMENT_NODE:
+                    if node.previousSibling.tagName=="ul":
+                        # the previous sibling is another list - need to merge
+                        # but first we need to check if this is not set for deletion,
+                        # and if it is move to previous siblings until finding a list not set for deletion
+                        # this allows normal merging of 3+ lists without repeated iterations
+                        destination=node.previousSibling
+                        while destination in NodesToDelete:
+                            destination=destination.previousSibling
+                            # if the new destination is not a <ul> something is broken in this code
+                            # (because only nodes after a <ul> can be flagged for deletion)
+                            # report error and quit function immediately
+                            if destination==None:
+                                self.debug(0,"Internal error in PostprocessJoinLists - no previous sibling")
+                                return()
+                            if not destination.nodeType==xml.dom.Node.ELEMENT_NODE:
+                                self.debug(0,"Internal error in PostprocessJoinLists - previous sibling not element")
+                                return()
+                            if not destination.tagName=="ul":
+                                self.debug(0,"Internal error in PostprocessJoinLists - previous sibling not <ul>")
+                                return()
+
+                        # move all child nodes and ID to destination, and flad the node for deletion
+                        self.MoveChildNodes(node,destination)
+                        self.MoveId(node,destination)
+                        NodesToDelete.add(node)
+
+        # delete the flagged nodes
+        for node in NodesToDelete:
+            node.parentNode.removeChild(node)
+            node.unlink()
+
+    # 0.29 Fix nexted lists where each nesting only has one <li> and a list in there -
+    # an artefact of ODT nested list processsing
+    # Intentionally called *after* PostprocessJoinLists to avoid undesirable joining
+    # Found, if given, is from a TagWalk or GetElementsByTagNames for "ul" and "ol"
+    # (the <ul>s PostprocessJoinLists deletes have no children, so they are skipped)
+    def PostprocessNestedOneLists(self,DOM,Found=None):
+        listtags=["ul","ol"]
+        if Found==None:
+            Found=GetElementsByTagNames(DOM,listtags)
+        for nowtag in listtags:
+            foundlists=Found[nowtag]
+            MoreWork=True
+            while MoreWork:
+                Triggered=False
+                for listnode in foundlists:
+                    if listnode.hasChildNodes():
+                        if listnode.firstChild==listnode.lastChild:
+                            childnode=listnode.firstChild
+                            if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                                if childnode.tagName=="li": # so far we have only one child and it is <li>
+                                    if childnode.hasChildNodes():
+                                        if childnode.firstChild==childnode.lastChild:
+                                            grandchildnode=childnode.firstChild
+                                            if grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                                                    if grandchildnode.tagName in listtags:
+                                                        # we have the specific situation
+                                                        # lift the newfound list before the list node,
+                                                        # remove the list node and start again
+                                                        listnode.parentNode.insertBefore(grandchildnode,listnode)
+                                                        self.DestroyNode(listnode)
+                                                        Triggered=True
+                                                        break # will apply to the for loop
+                MoreWork=Triggered
 
                                                     
 
 
+    # Join immediately adjacent tags. Called for codeph, u and i . Made from the one for ul's, but FIXME no time to investigate joining them
+    # Found, if given, is from a TagWalk or GetElementsByTagNames for TagName
+    def PostprocessJoinTags(self,DOM,TagName,Found=None):
+        # initialize list of nodes to delete
+        # make it a set, just to avoid duplicates
+        NodesToDelete=set([])
 
-# Join immediately adjacent tags. Called for codeph, u and i . Made from the one for ul's, but FIXME no time to investigate joining them
-def PostprocessJoinTags(DOM,TagName):
-    # initialize list of nodes to delete
-    # make it a set, just to avoid duplicates
-    NodesToDelete=set([])
-
-    ulNodes=DOM.getElementsByTagName(TagName)
-    for node in ulNodes:
-        if node.previousSibling<>None:
-            if node.previousSibling.nodeType==xml.dom.Node.ELEMENT_NODE:
-                if node.previousSibling.tagName==TagName:
-                    # the previous sibling is another of the same tag - need to merge
-                    # but first we need to check if this is not set for deletion,
-                    # and if it is move to previous siblings until finding a list not set for deletion
-                    # this allows normal merging of 3+ tags without repeated iterations
-                    destination=node.previousSibling
-                    while destination in NodesToDelete:
-                        destination=destination.previousSibling
-                        # if the new destination is not a <ul> something is broken in this code
-                        # (because only nodes after a <ul> can be flagged for deletion)
-                        # report error and quit function immediately
-                        if destination==None:
-                            debug(0,"Internal error in PostprocessJoinTags - no previous sibling")
-                            return()
-                        if not destination.nodeType==xml.dom.Node.ELEMENT_NODE:
-                            debug(0,"Internal error in PostprocessJoinTags - previous sibling not element")
-                            return()
-                        if not destination.tagName==TagName:
-                            debug(0,"Internal error in PostprocessJoinTagss - previous sibling not same tag")
-                            return()
-
-                    # move all child nodes and ID to destination, and flad the node for deletion
-                    MoveChildNodes(node,destination)
-                    MoveId(node,destination)
-                    NodesToDelete.add(node)
-
-    # delete the flagged nodes
-    for node in NodesToDelete:
-        node.parentNode.removeChild(node)
-        node.unlink()
+        if Found==None:
+            Found=GetElementsByTagNames(DOM,[TagName])
+        ulNodes=Found[TagName]
+        for node in ulNodes:
+            if node.previousSibling<>None:
+                if node.previousSibling.nodeType==xml.dom.Node.ELEMENT_NODE:
+                    if node.previousSibling.tagName==TagName:
+                        # the previous sibling is another of the same tag - need to merge
+                        # but first we need to check if this is not set for deletion,
+                        # and if it is move to previous siblings until finding a list not set for deletion
+                        # this allows normal merging of 3+ tags without repeated iterations
+                        destination=node.previousSibling
+                        while destination in NodesToDelete:
+                            destination=destination.previousSibling
+                            # if the new destination is not a <ul> something is broken in this code
+                            # (because only nodes after a <ul> can be flagged for deletion)
+                            # report error and quit function immediately
+                            if destination==None:
+                                self.debug(0,"Internal error in PostprocessJoinTags - no previous sibling")
+                                return()
+                            if not destination.nodeType==xml.dom.Node.ELEMENT_NODE:
+                                self.debug(0,"Internal error in PostprocessJoinTags - previous sibling not element")
+                                return()
+                            if not destination.tagName==TagName:
+                                self.debug(0,"Internal error in PostprocessJoinTagss - previous sibling not same tag")
+                                return()
+
+                        # move all child nodes and ID to destination, and flad the node for deletion
+                        self.MoveChildNodes(node,destination)
+                        self.MoveId(node,destination)
+                        NodesToDelete.add(node)
+
+        # delete the flagged nodes
+        for node in NodesToDelete:
+            node.parentNode.removeChild(node)
+            node.unlink()
     
 
 
-# Remove first <p> (and move its attributes and content outside it) for several element types
-def PostprocessFirstP(DOM):
-    for tagname in ["li","entry","fn"]: # FIXME: are there more?
-        TNodes=DOM.getElementsByTagName(tagname)
-        for node in TNodes:
-            if node.hasChildNodes():
-                if node.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE:
-                    if node.firstChild.tagName=="p":
-                        PNode=node.firstChild
-                        MoveId(PNode,node)
-                        CopyAttributes(PNode,node)
-                        while PNode.hasChildNodes():
-                            node.insertBefore(PNode.firstChild,PNode)
-                        node.removeChild(PNode)
-                        PNode.unlink()
-
-# Remove <note> tags from footnotes
-# The first one goes into <fn> directly, the rest become <p>
-def PostprocessFootnotes(DOM):
-        TNodes=DOM.getElementsByTagName("fn")
-        for node in TNodes:
-            if node.hasChildNodes():
-                # process the first <note> tag
-                if node.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE:
-                    if node.firstChild.tagName=="note":
-                        PNode=node.firstChild
-                        MoveId(PNode,node)
-                        CopyAttributes(PNode,node)
-                        while PNode.hasChildNodes():
-                            node.insertBefore(PNode.firstChild,PNode)
-                        node.removeChild(PNode)
-                        PNode.unlink()
-
-                # process the rest now
-                for childnode in node.childNodes:
-                    if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                        if childnode.tagName=="note":
-                            childnode.tagName="p"
-                            try:
-                                childnode.removeAttribute("type")
-                            except NotFoundErr: pass
+    # Remove first <p> (and move its attributes and content outside it) for several element types
+    # Found, if given, is from a TagWalk or GetElementsByTagNames for "li", "entry" and "fn"
+    def PostprocessFirstP(self,DOM,Found=None):
+        tagnames=["li","entry","fn"] # FIXME: are there more?
+        if Found==None:
+            Found=GetElementsByTagNames(DOM,tagnames)
+        for tagname in tagnames:
+            TNodes=Found[tagname]
+            for node in TNodes:
+                if node.hasChildNodes():
+                    if node.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE:
+                        if node.firstChild.tagName=="p":
+                            PNode=node.firstChild
+                            self.MoveId(PNode,node)
+                            CopyAttributes(PNode,node)
+                            self.CopyOtherprops(PNode,node)
+                            while PNode.hasChildNodes():
+                                node.insertBefore(PNode.firstChild,PNode)
+                            node.removeChild(PNode)
+                            PNode.unlink()
+
+    # Remove <note> tags from footnotes
+    # The first one goes into <fn> directly, the rest become <p>
+    # Found, if given, is from a TagWalk or GetElementsByTagNames for "fn"
+    def PostprocessFootnotes(self,DOM,Found=None):
+            if Found==None:
+                Found=GetElementsByTagNames(DOM,["fn"])
+            TNodes=Found["fn"]
+            for node in TNodes:
+                if node.hasChildNodes():
+                    # process the first <note> tag
+                    if node.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE:
+                        if node.firstChild.tagName=="note":
+                            PNode=node.firstChild
+                            self.MoveId(PNode,node)
+                            CopyAttributes(PNode,node)
+                            self.CopyOtherprops(PNode,node)
+                            while PNode.hasChildNodes():
+                                node.insertBefore(PNode.firstChild,PNode)
+                            node.removeChild(PNode)
+                            PNode.unlink()
+
+                    # process the rest now
+                    for childnode in node.childNodes:
+                        if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                            if childnode.tagName=="note":
+                                childnode.tagName="p"
+                                try:
+                                    childnode.removeAttribute("type")
+                                except NotFoundErr: pass
                                                     
-# Postprocess the tables
-def PostprocessTables(DOM):
-
-    # Internal routine for moving stuff out of a table entry/cell and into the text
-    # Everything until a <p>, if it exists, is moved to a new <p>
-    # TableNode must be a child of OutputNode (it is the node before which text is to be put)
-    # Also, if a new <p> is created, the otherprops attribute from InputNode is copied to it
-    #  and the id attribute if present is moved
-    def MoveFromEntry(InputNode,OutputNode,TableNode):
-        if InputNode.hasChildNodes(): # only do anything at all if there are nodes to move
-            # Determine if a first <p> is needed
-            NeedToCreateP=True
-            if InputNode.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE:
-                if InputNode.firstChild.tagName=="p":
-                    NeedToCreateP=False
-
-
-            if NeedToCreateP:
-                # Create the <p>
-                PNode=DOM.createElement("p")
-                OutputNode.insertBefore(PNode,TableNode)
-
-                # Copy otherprops attribute
-                if InputNode.hasAttribute("otherprops"):
-                    PNode.setAttribute("otherprops",InputNode.getAttribute("otherprops"))
-
-                # Move id attribute
-                MoveId(InputNode,OutputNode)
+    # Postprocess the tables
+    # Found, if given, is from a TagWalk or GetElementsByTagNames for "table"
+    def PostprocessTables(self,DOM,Found=None):
+
+        # Internal routine for moving stuff out of a table entry/cell and into the text
+        # Everything until a <p>, if it exists, is moved to a new <p>
+        # TableNode must be a child of OutputNode (it is the node before which text is to be put)
+        # Also, if a new <p> is created, the otherprops from InputNode are copied to it
+        #  and the id attribute if present is moved
+        def MoveFromEntry(InputNode,OutputNode,TableNode):
+            if InputNode.hasChildNodes(): # only do anything at all if there are nodes to move
+                # Determine if a first <p> is needed
+                NeedToCreateP=True
+                if InputNode.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE:
+                    if InputNode.firstChild.tagName=="p":
+                        NeedToCreateP=False
+
+
+                if NeedToCreateP:
+                    # Create the <p>
+                    PNode=DOM.createElement("p")
+                    OutputNode.insertBefore(PNode,TableNode)
+
+                    # Copy otherprops
+                    self.CopyOtherprops(InputNode,PNode)
+
+                    # Move id attribute
+                    self.MoveId(InputNode,OutputNode)
 
                 
-                # Move nodes to the <p>
-                MoveNext=True
-                while MoveNext:
-                    PNode.appendChild(InputNode.firstChild)
-                    if not InputNode.hasChildNodes():
-                        MoveNext=False # stop the moving if we are out of nodes
-                    elif InputNode.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE:
-                        if InputNode.firstChild.tagName=="p":
-                            MoveNext=False  # stop the moving if the next node is a <p>
-
-            while InputNode.hasChildNodes(): # move remaining nodes, all assumed to be <p>
-                OutputNode.insertBefore(InputNode.firstChild,TableNode)
+                    # Move nodes to the <p>
+                    MoveNext=True
+                    while MoveNext:
+                        PNode.appendChild(InputNode.firstChild)
+                        if not InputNode.hasChildNodes():
+                            MoveNext=False # stop the moving if we are out of nodes
+                        elif InputNode.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE:
+                            if InputNode.firstChild.tagName=="p":
+                                MoveNext=False  # stop the moving if the next node is a <p>
+
+                while InputNode.hasChildNodes(): # move remaining nodes, all assumed to be <p>
+                    OutputNode.insertBefore(InputNode.firstChild,TableNode)
                 
                     
         
     
 
     
-    NodesToDelete=set([])
+        NodesToDelete=set([])
    
-    tableNodes=DOM.getElementsByTagName("table")
+        if Found==None:
+            Found=GetElementsByTagNames(DOM,["table"])
+        tableNodes=Found["table"]
     
-    for tablenode in tableNodes:
-        # get the TGroup node - it is the first child of the table as of now
-        # FIXME should I rely on this?
-        TGroupNode=tablenode.firstChild
-
-        NumberOfColumns=int(TGroupNode.getAttribute("cols"))
-
-        # A table can only have one title. Flag if found
-        TitleFound=False
-        # If a caption exists immediately before, use it
-        if tablenode.previousSibling<>None:
-            if tablenode.previousSibling.nodeType==xml.dom.Node.ELEMENT_NODE:
-                if tablenode.previousSibling.tagName=="p":
-                    if tablenode.previousSibling.getAttribute("otherprops").find("caption")>-1:
-                        captionnode=tablenode.previousSibling  
-                        if captionnode.hasChildNodes() and IsSimpleParagraph(captionnode):
-                            # only bother if the caption is not empty and content is suitable for title 
-                            # We need to get around any paragraph-wide child elements
-                            captionsourcenode=captionnode
-                            while captionsourcenode.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE and \
-                                captionsourcenode.firstChild==captionsourcenode.lastChild:
-                                    captionsourcenode=captionsourcenode.firstChild
-                            if captionsourcenode.hasChildNodes(): # only bother if the caption
-                                                                # AFTER all paragraph-wide tags is not empty
-                                # move the caption into the table title
-                                # FIXME: add removal of Table N
-                                tabletitlenode=DOM.createElement("title")
-                                tablenode.insertBefore(tabletitlenode,tablenode.firstChild)
-                                MoveChildNodes(captionsourcenode,tabletitlenode)
-                                TitleFound=True
-
-                                # copy any attributes from caption to table itself
-                                CopyAttributes(captionnode,tablenode)
+        for tablenode in tableNodes:
+            # get the TGroup node - it is the first child of the table as of now
+            # FIXME should I rely on this?
+            TGroupNode=tablenode.firstChild
+
+            NumberOfColumns=int(TGroupNode.getAttribute("cols"))
+
+            # A table can only have one title. Flag if found
+            TitleFound=False
+            # If a caption exists immediately before, use it
+            if tablenode.previousSibling<>None:
+                if tablenode.previousSibling.nodeType==xml.dom.Node.ELEMENT_NODE:
+                    if tablenode.previousSibling.tagName=="p":
+                        if self.HasOtherprops(tablenode.previousSibling,"caption"):
+                            captionnode=tablenode.previousSibling  
+                            if captionnode.hasChildNodes() and IsSimpleParagraph(captionnode):
+                                # only bother if the caption is not empty and content is suitable for title 
+                                # We need to get around any paragraph-wide child elements
+                                captionsourcenode=captionnode
+                                while captionsourcenode.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE and \
+                                    captionsourcenode.firstChild==captionsourcenode.lastChild:
+                                        captionsourcenode=captionsourcenode.firstChild
+                                if captionsourcenode.hasChildNodes(): # only bother if the caption
+                                                                    # AFTER all paragraph-wide tags is not empty
+                                    # move the caption into the table title
+                                    # FIXME: add removal of Table N
+                                    tabletitlenode=DOM.createElement("title")
+                                    tablenode.insertBefore(tabletitlenode,tablenode.firstChild)
+                                    self.MoveChildNodes(captionsourcenode,tabletitlenode)
+                                    TitleFound=True
+
+                                    # copy any attributes from caption to table itself
+                                    CopyAttributes(captionnode,tablenode)
                                 
-                                # carefully delete the caption and all para-wide child nodes we went into
-                                DestroyNode(captionnode)
+                                    # carefully delete the caption and all para-wide child nodes we went into
+                                    self.DestroyNode(captionnode)
                                     
 
                                 
         
         
         
-        # find the <tbody> and within it the first <row> and <entry>, and column names
-        # FIXME? this relies on exactly one tgroup in table (very first child)
-        #  and one <tbody> in table and
-        #  its first child being <row>
-        # *and* on the row's first child being <entry>
-        FirstColumn=""
-        LastColumn=""
-        TBodyNode=None
-        for childnode in TGroupNode.childNodes:
-            if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                #print childnode.tagName
-                if childnode.tagName=="colspec":
-                    colname=childnode.getAttribute("colname")
-                    # assign first column if it's first - not assigned, and last column in all occasions
-                    if FirstColumn=="":
-                        FirstColumn=colname
-                    LastColumn=colname
-                elif childnode.tagName=="tbody":
-                    TBodyNode=childnode
-
-        # 0.30 body not found - report error, remove table
-        if TBodyNode==None:
-            debug(1,"ATTENTION: table without tbody element removed")
-            NodesToDelete.add(tablenode)
-            continue
+            # find the <tbody> and within it the first <row> and <entry>, and column names
+            # FIXME? this relies on exactly one tgroup in table (very first child)
+            #  and one <tbody> in table and
+            #  its first child being <row>
+            # *and* on the row's first child being <entry>
+            FirstColumn=""
+            LastColumn=""
+            TBodyNode=None
+            for childnode in TGroupNode.childNodes:
+                if childnode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                    #print childnode.tagName
+                    if childnode.tagName=="colspec":
+                        colname=childnode.getAttribute("colname")
+                        # assign first column if it's first - not assigned, and last column in all occasions
+                        if FirstColumn=="":
+                            FirstColumn=colname
+                        LastColumn=colname
+                    elif childnode.tagName=="tbody":
+                        TBodyNode=childnode
+
+            # 0.30 body not found - report error, remove table
+            if TBodyNode==None:
+                self.debug(1,"ATTENTION: table without tbody element removed")
+                NodesToDelete.add(tablenode)
+                continue
         
-        if FirstColumn=="":
-            debug(1,"PostprocessTables: failed to determine first column, wrong results likely")
-        FirstRowNode=TBodyNode.firstChild
-        FirstEntryNode=FirstRowNode.firstChild
-
-        # Check if the first row spans all the table (or there is only one column)
-        # These are handled in a special way - being independent paragraphs if not a header
-        # or the table title if, indeed, a header and if no caption is present
-        # FIXME: for now, if there is a simple non-headered table with 1 column, this moves row 1 out of it
-        #  this might not be forrect in all cases
-        if (FirstEntryNode.getAttribute("namest")==FirstColumn and \
-           FirstEntryNode.getAttribute("nameend")==LastColumn) or NumberOfColumns==1:
-                if FirstEntryNode.getAttribute("otherprops").find("header")>-1:
-                   # this is a header - use as caption if title not found yet, otherwise don't change
-                   if not TitleFound:
-                        captionsourcenode=FirstEntryNode
-                        # get through paragraph-wide tags
-                        while captionsourcenode.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE and \
-                            captionsourcenode.firstChild==captionsourcenode.lastChild:
-                                captionsourcenode=captionsourcenode.firstChild
-
-                        # move the caption into the table title
-                        # FIXME: add removal of Table N
-                        tabletitlenode=DOM.createElement("title")
-                        tablenode.insertBefore(tabletitlenode,tablenode.firstChild)
-                        MoveChildNodes(captionsourcenode,tabletitlenode)
-
-                        # copy any attributes from caption to table itself
-                        CopyAttributes(FirstRowNode,tablenode)
-
-                        TitleFound=True
-
-                        # Remove the entire first row node 
-                        DestroyNode(FirstRowNode)
-                else:
-                    # this is not a header, make it independent paragraphs
-                    # the child nodes are to be moved immediately before the table node
-                    MoveFromEntry(FirstEntryNode,tablenode.parentNode,tablenode)
+            if FirstColumn=="":
+                self.debug(1,"PostprocessTables: failed to determine first column, wrong results likely")
+            FirstRowNode=TBodyNode.firstChild
+            FirstEntryNode=FirstRowNode.firstChild
+
+            # Check if the first row spans all the table (or there is only one column)
+            # These are handled in a special way - being independent paragraphs if not a header
+            # or the table title if, indeed, a header and if no caption is present
+            # FIXME: for now, if there is a simple non-headered table with 1 column, this moves row 1 out of it
+            #  this might not be forrect in all cases
+            if (FirstEntryNode.getAttribute("namest")==FirstColumn and \
+               FirstEntryNode.getAttribute("nameend")==LastColumn) or NumberOfColumns==1:
+                    if self.HasOtherprops(FirstEntryNode,"header"):
+                       # this is a header - use as caption if title not found yet, otherwise don't change
+                       if not TitleFound:
+                            captionsourcenode=FirstEntryNode
+                            # get through paragraph-wide tags
+                            while captionsourcenode.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE and \
+                                captionsourcenode.firstChild==captionsourcenode.lastChild:
+                                    captionsourcenode=captionsourcenode.firstChild
+
+                            # move the caption into the table title
+                            # FIXME: add removal of Table N
+                            tabletitlenode=DOM.createElement("title")
+                            tablenode.insertBefore(tabletitlenode,tablenode.firstChild)
+                            self.MoveChildNodes(captionsourcenode,tabletitlenode)
+
+                            # copy any attributes from caption to table itself
+                            CopyAttributes(FirstRowNode,tablenode)
+
+                            TitleFound=True
 
-                    # Remove the entire first row node
-                    DestroyNode(FirstRowNode)
+                            # Remove the entire first row node 
+                            self.DestroyNode(FirstRowNode)
+                    else:
+                        # this is not a header, make it independent paragraphs
+                        # the child nodes are to be moved immediately before the table node
+                        MoveFromEntry(FirstEntryNode,tablenode.parentNode,tablenode)
+
+                        # Remove the entire first row node
+                        self.DestroyNode(FirstRowNode)
         
-        # Now, recalculate FirstRowNode 
-        FirstRowNode=TBodyNode.firstChild
+            # Now, recalculate FirstRowNode 
+            FirstRowNode=TBodyNode.firstChild
 
-        # If no more rows do remain, flag table for deletion
-        if FirstRowNode==None:
-            NodesToDelete.add(tablenode)
-        else:
-            # continue processing if nodes remain
-            # now, if any rows in the beginning have the header in otherprops on ALL entries
-            #  then make them header rows
-            # BUT avoid doing this if only one row remains
-            HeaderAdded=False
-            HeaderRowFound=True
-            while (FirstRowNode.nextSibling<>None) and HeaderRowFound:
-                HeaderRowFound=True  # really redundant but kept for clarity
-                for EntryNode in (FirstRowNode.childNodes): # assume all row child nodes are <entry>
-                    if EntryNode.getAttribute("otherprops").find("header")==-1:
-                        HeaderRowFound=False
-
-                if HeaderRowFound:                        
-                    # add the header if not previously added
-                    if not HeaderAdded:
-                        THeadNode=DOM.createElement("thead")
-                        TGroupNode.insertBefore(THeadNode,TBodyNode)
-                        HeaderAdded=True
-                    # move the row to the header
-                    THeadNode.appendChild(FirstRowNode)
-
-                    # remove paragraph-wide <b> and <i> tags from every node in the new header row
-                    for EntryNode in FirstRowNode.childNodes:
-                        if EntryNode.hasChildNodes():
-                            ToCheck=True
-                            while ToCheck:
-                                ToCheck=False
-                                if not EntryNode.hasChildNodes(): # check added in 0.32
-                                    break
-                                if (EntryNode.firstChild==EntryNode.lastChild) and \
-                                   EntryNode.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE:
-                                    if EntryNode.firstChild.tagName in ["b","i"]:
-                                        # Will need to check again after this is complete
-                                        ToCheck=True
+            # If no more rows do remain, flag table for deletion
+            if FirstRowNode==None:
+                NodesToDelete.add(tablenode)
+            else:
+                # continue processing if nodes remain
+                # now, if any rows in the beginning have the header in otherprops on ALL entries
+                #  then make them header rows
+                # BUT avoid doing this if only one row remains
+                HeaderAdded=False
+                HeaderRowFound=True
+                while (FirstRowNode.nextSibling<>None) and HeaderRowFound:
+                    HeaderRowFound=True  # really redundant but kept for clarity
+                    for EntryNode in (FirstRowNode.childNodes): # assume all row child nodes are <entry>
+                        if not self.HasOtherprops(EntryNode,"header"):
+                            HeaderRowFound=False
+
+                    if HeaderRowFound:                        
+                        # add the header if not previously added
+                        if not HeaderAdded:
+                            THeadNode=DOM.createElement("thead")
+                            TGroupNode.insertBefore(THeadNode,TBodyNode)
+                            HeaderAdded=True
+                        # move the row to the header
+                        THeadNode.appendChild(FirstRowNode)
+
+                        # remove paragraph-wide <b> and <i> tags from every node in the new header row
+                        for EntryNode in FirstRowNode.childNodes:
+                            if EntryNode.hasChildNodes():
+                                ToCheck=True
+                                while ToCheck:
+                                    ToCheck=False
+                                    if not EntryNode.hasChildNodes(): # check added in 0.32
+                                        break
+                                    if (EntryNode.firstChild==EntryNode.lastChild) and \
+                                       EntryNode.firstChild.nodeType==xml.dom.Node.ELEMENT_NODE:
+                                        if EntryNode.firstChild.tagName in ["b","i"]:
+                                            # Will need to check again after this is complete
+                                            ToCheck=True
                                         
-                                        # Move all the information and remove the child node
-                                        childtoremove=EntryNode.firstChild
-                                        MoveChildNodes(childtoremove,EntryNode)
-                                        DestroyNode(childtoremove)
+                                            # Move all the information and remove the child node
+                                            childtoremove=EntryNode.firstChild
+                                            self.MoveChildNodes(childtoremove,EntryNode)
+                                            self.DestroyNode(childtoremove)
                                     
                     
 
-                    # recalculate FirstRowNode
-                    FirstRowNode=TBodyNode.firstChild
-
-            if TitleFound:
-                # Remove "Table something" from title
-                tnode=FindFirstText(tabletitlenode)
-                if tnode<>None:
-                    data=tnode.data
+                        # recalculate FirstRowNode
+                        FirstRowNode=TBodyNode.firstChild
 
-                    # Remove spaces from beginning - this will only get back into the note if an infostring is found
-                    # If data gets empty anywhere in the process, never mind
-                    # FIXME? This would not process titles where whitespace is the whole first text node
-                    #  rather unlikely but still possible 
-                    try:
-                        while data[0].isspace():
-                            data=data[1:]
-                    except IndexError: pass
+                if TitleFound:
+                    # Remove "Table something" from title
+                    tnode=FindFirstText(tabletitlenode)
+                    if tnode<>None:
+                        data=tnode.data
 
-                    # Check for "Table"
-                    # If the string is found, remove it and flag
-                    StringFound=False
-                    if data.lower().find("table")==0:
-                        data=data[5:]
-                        StringFound=True
-
-                    if StringFound:
-                        # If the string was found, remove any :, number etc (nonalpha chars)
-                        #  immediately after it
-                        # If data gets empty, that's ok
+                        # Remove spaces from beginning - this will only get back into the note if an infostring is found
+                        # If data gets empty anywhere in the process, never mind
+                        # FIXME? This would not process titles where whitespace is the whole first text node
+                        #  rather unlikely but still possible 
                         try:
-                            while not data[0].isalpha():
+                            while data[0].isspace():
                                 data=data[1:]
                         except IndexError: pass
 
-                        if data=='':
-                            # remove the text node, and handle possible empty nodes
-                            DestroyNode(tnode)
-                            RemoveChildlessElementChildrenPara(tabletitlenode)
-                        else:
-                            # set text node to new data
-                            tnode.data=data
-                        RemoveAllBeforeAlpha(tabletitlenode)
-
-    # delete flagged tables
-    for node in NodesToDelete:
-        DestroyNode(node)
-
-
-# Postprocesing to detect code blocks
-# For now, only paragraphs with a paragraph monospace property (or blank ones) are contemplated
-# relies on previous postprocessing
-def PostprocessCodeblock(DOM):
-    # initialize list of nodes to delete
-    # make it a set, just to avoid duplicates
-    NodesToDelete=set([])
-
-    PNodes=DOM.getElementsByTagName("p")
-
-    for PNode in PNodes:
-        if IsSimpleParagraph(PNode): # only check for anything at all if the paragraph has only formatting in it
-                                     # not images, tables, etc
-            # First we work out if this is a blank paragraph or a valid code paragraph
-            IsCode=False
-            if PNode.hasChildNodes():
-                IsBlank=False
-                if PNode.getAttribute("otherprops").find("codeph")>-1:
-                    # Check if there is a paragraph-wide <codeph>, which may be under others
-                    # If found, note and remove it
-                    if PNode.firstChild==PNode.lastChild:
-                        ToCheck=True
-                        CheckNode=PNode.firstChild
-                        while ToCheck:
-                            if CheckNode.nodeType<>xml.dom.Node.ELEMENT_NODE:
-                                ToCheck=False
-                            elif CheckNode.tagName=="codeph":
-                                CodephNode=CheckNode
-                                IsCode=True
-                                ToCheck=False
-                            elif CheckNode.hasChildNodes():
-                                ToCheck=(CheckNode.firstChild==CheckNode.lastChild)
-                                CheckNode=CheckNode.firstChild
+                        # Check for "Table"
+                        # If the string is found, remove it and flag
+                        StringFound=False
+                        if data.lower().find("table")==0:
+                            data=data[5:]
+                            StringFound=True
+
+                        if StringFound:
+                            # If the string was found, remove any :, number etc (nonalpha chars)
+                            #  immediately after it
+                            # If data gets empty, that's ok
+                            try:
+                                while not data[0].isalpha():
+                                    data=data[1:]
+                            except IndexError: pass
+
+                            if data=='':
+                                # remove the text node, and handle possible empty nodes
+                                self.DestroyNode(tnode)
+                                self.RemoveChildlessElementChildrenPara(tabletitlenode)
                             else:
-                                ToCheck=False
+                                # set text node to new data
+                                tnode.data=data
+                            self.RemoveAllBeforeAlpha(tabletitlenode)
 
-                        if IsCode:
-                            MoveChildNodes(CheckNode,CheckNode.parentNode)
-                            DestroyNode(CheckNode)
+        # delete flagged tables
+        for node in NodesToDelete:
+            self.DestroyNode(node)
 
-            else:
-                IsBlank=True
 
-            # Check if the previous node, if any, is a codeblock
-            PrevCodeblock=False
-            PrevNode=PNode.previousSibling
-            while (PrevNode<>None) and (PrevNode in NodesToDelete):
-                PrevNode=PrevNode.previousSibling
-            
-            if PrevNode<>None:
-                if PrevNode.nodeType==xml.dom.Node.ELEMENT_NODE:
-                    if PrevNode.tagName=="codeblock":
-                        PrevCodeblock=True
+    # Postprocesing to detect code blocks
+    # For now, only paragraphs with a paragraph monospace property (or blank ones) are contemplated
+    # relies on previous postprocessing
+    # 0.43: the paragraphs joined to a codeblock are collected, and every codeblock is put together
+    #  once at the end with AssembleCodeblock, instead of moving the paragraph content in and normalizing
+    #  the growing codeblock for every paragraph; the result is the same
+    def PostprocessCodeblock(self,DOM):
+        # initialize list of nodes to delete
+        # make it a set, just to avoid duplicates
+        NodesToDelete=set([])
 
-            if PrevCodeblock:
-                if IsBlank or IsCode:
-                    MoveChildNodes(PNode,PrevNode,"\n")
-                    # This works for a blank just as well - the \n is added and then nothing is there to move
+        # The codeblocks created, in order, and for every codeblock the paragraphs joined to it
+        Codeblocks=[]
+        JoinedParagraphs={}
 
-                    MoveId(PNode,PrevNode)
-                    
-                    NodesToDelete.add(PNode)
-            elif IsCode:
-                # Change paragraph into codeblock
-                PNode.tagName="codeblock"
+        # For every paragraph to delete, the codeblock it is joined to - this is the codeblock before it,
+        # as all the nodes between them are joined to it as well
+        JoinedTo={}
 
-    # delete the flagged nodes
-    for node in NodesToDelete:
-        node.parentNode.removeChild(node)
-        node.unlink()
+        PNodes=DOM.getElementsByTagName("p")
 
-    # Additional codeblock processing
-    # Remove trailing newlines from all codeblocks
-    # This could also be done without a search, by keeping a list of created codeblocks
-    
-    CodeblockNodes=DOM.getElementsByTagName("codeblock")
+        for PNode in PNodes:
+            if IsSimpleParagraph(PNode): # only check for anything at all if the paragraph has only formatting in it
+                                         # not images, tables, etc
+                # First we work out if this is a blank paragraph or a valid code paragraph
+                IsCode=False
+                if PNode.hasChildNodes():
+                    IsBlank=False
+                    if self.HasOtherprops(PNode,"monospace"):
+                        # Check if there is a paragraph-wide <codeph>, which may be under others
+                        # If found, note and remove it
+                        if PNode.firstChild==PNode.lastChild:
+                            ToCheck=True
+                            CheckNode=PNode.firstChild
+                            while ToCheck:
+                                if CheckNode.nodeType<>xml.dom.Node.ELEMENT_NODE:
+                                    ToCheck=False
+                                elif CheckNode.tagName=="codeph":
+                                    CodephNode=CheckNode
+                                    IsCode=True
+                                    ToCheck=False
+                                elif CheckNode.hasChildNodes():
+                                    ToCheck=(CheckNode.firstChild==CheckNode.lastChild)
+                                    CheckNode=CheckNode.firstChild
+                                else:
+                                    ToCheck=False
+
+                            if IsCode:
+                                self.MoveChildNodes(CheckNode,CheckNode.parentNode)
+                                self.DestroyNode(CheckNode)
 
-    for CNode in CodeblockNodes:
-        if CNode.hasChildNodes():
-            lastchild=CNode.lastChild
-            if lastchild.nodeType==xml.dom.Node.TEXT_NODE:
-                data=lastchild.data
-                try:
-                    while data<>"" and data[len(data)-1]=="\n":
-                        data=data[:-1]
-                except IndexError: pass
-                if data=="":
-                    DestroyNode(lastchild)
                 else:
-                    lastchild.data=data
-
+                    IsBlank=True
 
-# Postprocess notes
-# Remove all supported note information strings, reflecting them in type attribute instead
-NoteTypes=["note","attention","caution","danger","fastpath","important",
-           "remember","restriction","tip"]
-
-def PostprocessNotes(DOM):
-    NoteNodes=DOM.getElementsByTagName("note")
-    for NNode in NoteNodes:
-        tnode=FindFirstText(NNode)
-        if tnode<>None:
-            data=tnode.data
-
-            # Remove spaces from beginning - this will only get back into the note if an infostring is found
-            # If data gets empty anywhere in the process, we skip this note entirely
-            # FIXME? This would not process notes where whitespace is the whole first text node
-            #  rather unlikely but still possible 
-            try:
-                while data[0].isspace():
-                    data=data[1:]
-            except IndexError: continue
-
-            # Check for all note type info strings
-            # If the string is found, remove it and flag
-            StringFound=False
-            for notetype in NoteTypes:
-                if data.lower().find(notetype)==0:
-                    data=data[len(notetype):]
-                    NNode.setAttribute("type",notetype)
-                    StringFound=True
-
-            if StringFound:
-                # If the string was found, remove any : etc (nonalphanum chars) immediately after it
-                # If data gets empty, that's ok
+                # Check if the previous node, if any, is a codeblock
+                PrevCodeblock=False
+                PrevNode=PNode.previousSibling
+                if PrevNode in JoinedTo:
+                    PrevNode=JoinedTo[PrevNode]
+            
+                if PrevNode<>None:
+                    if PrevNode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                        if PrevNode.tagName=="codeblock":
+                            PrevCodeblock=True
+
+                if PrevCodeblock:
+                    if IsBlank or IsCode:
+                        # the content is joined to the codeblock, after a \n, by AssembleCodeblock
+                        # This works for a blank just as well - the \n is added and then nothing is there to move
+                        JoinedParagraphs[PrevNode].append(PNode)
+                        JoinedTo[PNode]=PrevNode
+
+                        self.MoveId(PNode,PrevNode)
+                    
+                        NodesToDelete.add(PNode)
+                elif IsCode:
+                    # Change paragraph into codeblock
+                    PNode.tagName="codeblock"
+                    Codeblocks.append(PNode)
+                    JoinedParagraphs[PNode]=[]
+
+        # put the codeblocks together
+        # Also remove trailing newlines from all codeblocks
+        for CNode in Codeblocks:
+            if JoinedParagraphs[CNode]<>[]:
+                self.AssembleCodeblock(CNode,JoinedParagraphs[CNode])
+            if CNode.hasChildNodes():
+                lastchild=CNode.lastChild
+                if lastchild.nodeType==xml.dom.Node.TEXT_NODE:
+                    data=lastchild.data.rstrip("\n")
+                    if data=="":
+                        self.DestroyNode(lastchild)
+                    else:
+                        lastchild.data=data
+
+        # delete the flagged nodes
+        # only now that their content is in the codeblocks, as unlink() would take it with them
+        RemoveNodes(NodesToDelete)
+
+    # Join the content of Paragraphs to the codeblock CNode, each after a "\n"
+    # The result is what MoveChildNodes(paragraph,CNode,"\n") for every paragraph gives, including the normalize():
+    #  adjacent text is joined into the first of the text nodes, empty text nodes are dropped,
+    #  and the elements are normalized; but the text is joined once, and every node is only visited once
+    def AssembleCodeblock(self,CNode,Paragraphs):
+        Nodes=list(CNode.childNodes)
+        for PNode in Paragraphs:
+            self.Report.Count("nodes moved",len(PNode.childNodes))
+            Nodes.append(None) # the "\n"
+            Nodes.extend(PNode.childNodes)
+            PNode.childNodes[:]=[]
+
+        Children=[]
+        TextParts=None # text to join into the last of Children, if it is a text node
+        for node in Nodes:
+            if node==None:
+                data="\n"
+            elif node.nodeType==xml.dom.Node.TEXT_NODE:
+                data=node.data
+            else:
+                data=None
+
+            if data==None:
+                if TextParts<>None:
+                    Children[-1].data="".join(TextParts)
+                    TextParts=None
+                Children.append(node)
+                if node.nodeType==xml.dom.Node.ELEMENT_NODE:
+                    node.normalize()
+            elif data=="":
+                # empty text is dropped
+                node.unlink()
+            elif TextParts<>None:
+                # joined into the text before
+                TextParts.append(data)
+                if node<>None:
+                    node.unlink()
+            else:
+                if node==None:
+                    node=CNode.ownerDocument.createTextNode(data)
+                Children.append(node)
+                TextParts=[data]
+        if TextParts<>None:
+            Children[-1].data="".join(TextParts)
+
+        # set up the child nodes as minidom's normalize() does
+        previous=None
+        for node in Children:
+            node.parentNode=CNode
+            node.previousSibling=previous
+            if previous<>None:
+                previous.nextSibling=node
+            previous=node
+        if previous<>None:
+            previous.nextSibling=None
+        CNode.childNodes[:]=Children
+
+    # Postprocess notes
+    # Remove all supported note information strings, reflecting them in type attribute instead
+    # Found, if given, is from a TagWalk or GetElementsByTagNames for "note"
+    def PostprocessNotes(self,DOM,Found=None):
+        if Found==None:
+            Found=GetElementsByTagNames(DOM,["note"])
+        NoteNodes=Found["note"]
+        for NNode in NoteNodes:
+            tnode=FindFirstText(NNode)
+            if tnode<>None:
+                data=tnode.data
+
+                # Remove spaces from beginning - this will only get back into the note if an infostring is found
+                # If data gets empty anywhere in the process, we skip this note entirely
+                # FIXME? This would not process notes where whitespace is the whole first text node
+                #  rather unlikely but still possible 
                 try:
-                    while not data[0].isalnum():
+                    while data[0].isspace():
                         data=data[1:]
-                except IndexError: pass
-
-                if data=='':
-                    # remove the text node, and handle possible empty nodes
-                    DestroyNode(tnode)
-                    RemoveChildlessElementChildrenPara(NNode)
-                else:
-                    # set text node to new data
-                    tnode.data=data
+                except IndexError: continue
+
+                # Check for all note type info strings
+                # If the string is found, remove it and flag
+                StringFound=False
+                for notetype in NoteTypes:
+                    if data.lower().find(notetype)==0:
+                        data=data[len(notetype):]
+                        NNode.setAttribute("type",notetype)
+                        StringFound=True
 
-# Postprocess notes from paragraphs
-# Convert all simple paragraphs satrting with supported note information strings to notes
-NoteTypes=["note","attention","caution","danger","fastpath","important",
-           "remember","restriction","tip"]
+                if StringFound:
+                    # If the string was found, remove any : etc (NoteSeparators and white space) immediately after it
+                    # Nothing else: a "(" or "&" that follows is text, and as adjacent spans share a text node
+                    #  it may even be the start of the next span
+                    # If data gets empty, that's ok
+                    try:
+                        while data[0] in NoteSeparators or data[0].isspace():
+                            data=data[1:]
+                    except IndexError: pass
 
-def PostprocessNotesFromParagraphs(DOM):
-    PNodes=DOM.getElementsByTagName("p")
-    for PNode in PNodes:
-      if IsSimpleParagraph(PNode):
-        tnode=FindFirstText(PNode)
-        if tnode<>None:
-            data=tnode.data
-
-            # Remove spaces from beginning - this will only get back into the note if an infostring is found
-            # If data gets empty anywhere in the process, we skip this note entirely
-            # FIXME? This would not process notes where whitespace is the whole first text node
-            #  rather unlikely but still possible 
-            try:
-                while data[0].isspace():
-                    data=data[1:]
-            except IndexError: continue
-
-            # Check for all note type info strings
-            # If the string is found, remove it and flag
-            StringFound=False
-            for notetype in NoteTypes:
-                if data.lower().find(notetype+":")==0:
-                    data=data[len(notetype):]
-                    PNode.tagName="note"
-                    PNode.setAttribute("type",notetype)
-                    StringFound=True
-
-            if StringFound:
-                # If the string was found, remove any : etc (nonalphanum chars) immediately after it
-                # If data gets empty, that's ok
+                    if data=='':
+                        # remove the text node, and handle possible empty nodes
+                        self.DestroyNode(tnode)
+                        self.RemoveChildlessElementChildrenPara(NNode)
+                    else:
+                        # set text node to new data
+                        tnode.data=data
+
+    # Postprocess notes from paragraphs
+    # Convert all simple paragraphs satrting with supported note information strings to notes
+    # Found, if given, is from a TagWalk or GetElementsByTagNames for "p"
+    # (the <p>s PostprocessNotes removes have no children, so they are skipped)
+    def PostprocessNotesFromParagraphs(self,DOM,Found=None):
+        if Found==None:
+            Found=GetElementsByTagNames(DOM,["p"])
+        PNodes=Found["p"]
+        for PNode in PNodes:
+          if IsSimpleParagraph(PNode):
+            tnode=FindFirstText(PNode)
+            if tnode<>None:
+                data=tnode.data
+
+                # Remove spaces from beginning - this will only get back into the note if an infostring is found
+                # If data gets empty anywhere in the process, we skip this note entirely
+                # FIXME? This would not process notes where whitespace is the whole first text node
+                #  rather unlikely but still possible 
                 try:
-                    while not data[0].isalnum():
+                    while data[0].isspace():
                         data=data[1:]
-                except IndexError: pass
+                except IndexError: continue
+
+                # Check for all note type info strings
+                # If the string is found, remove it and flag
+                StringFound=False
+                for notetype in NoteTypes:
+                    if data.lower().find(notetype+":")==0:
+                        data=data[len(notetype):]
+                        PNode.tagName="note"
+                        PNode.setAttribute("type",notetype)
+                        StringFound=True
 
-                if data=='':
-                    # remove the text node, and handle possible empty nodes
-                    DestroyNode(tnode)
-                    RemoveChildlessElementChildrenPara(PNode)
-                else:
-                    # set text node to new data
-                    tnode.data=data
-
-
-
-# Postprocess - break up the initial DOM to create output DOMs
-# Also set Output DOM IDs and types accordingly
-# In a title, [r] means reference and [t] means task
-# With a task, stub steps are also created
-# FIXME? Takes no arguments because it relies on InitialOutputBody
-def PostprocessBreakupIntoTopics():
-
-    # Internal recursion function - copying nodes, saving IDs in BookmarksDictionary
-    # InputNode is copied as a child to OutputNode
-    # CurrentOutputDOM is used (but not modified so namespace is not an issue)
-    def CopyToOutput(InputNode,OutputNode):
-        if InputNode.nodeType==xml.dom.Node.TEXT_NODE:
-            textnode=CurrentOutputDOM.createTextNode(InputNode.data)
-            OutputNode.appendChild(textnode)
-        elif InputNode.nodeType==xml.dom.Node.ELEMENT_NODE:
-            elemnode=CurrentOutputDOM.createElement(InputNode.tagName)
-            OutputNode.appendChild(elemnode)
-            #if InputNode.tagName=="xref":
-                #print "Transferred xref: "+InputNode.getAttribute("href")
-            CopyAttributes(InputNode,elemnode)
-
-            #process bookmark if ID found
-            BookmarkID=InputNode.getAttribute("id")
+                if StringFound:
+                    # If the string was found, remove any : etc (NoteSeparators and white space) immediately after it
+                    # Nothing else: a "(" or "&" that follows is text, and as adjacent spans share a text node
+                    #  it may even be the start of the next span
+                    # If data gets empty, that's ok
+                    try:
+                        while data[0] in NoteSeparators or data[0].isspace():
+                            data=data[1:]
+                    except IndexError: pass
+
+                    if data=='':
+                        # remove the text node, and handle possible empty nodes
+                        self.DestroyNode(tnode)
+                        self.RemoveChildlessElementChildrenPara(PNode)
+                    else:
+                        # set text node to new data
+                        tnode.data=data
+
+
+    # Postprocess - break up the initial DOM to create output DOMs
+    # Also set Output DOM IDs and types accordingly
+    # In a title, [r] means reference and [t] means task
+    # With a task, stub steps are also created
+    # FIXME? Takes no arguments because it relies on InitialOutputBody
+    def PostprocessBreakupIntoTopics(self):
+
+        # Internal recursion function - copying nodes, saving IDs in BookmarksDictionary
+        # InputNode is copied as a child to OutputNode
+        # CurrentOutputDOM is used (but not modified so namespace is not an issue)
+        def CopyToOutput(InputNode,OutputNode):
+            if InputNode.nodeType==xml.dom.Node.TEXT_NODE:
+                self.Report.Count("nodes created")
+                textnode=CurrentOutputDOM.createTextNode(InputNode.data)
+                OutputNode.appendChild(textnode)
+            elif InputNode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                self.Report.Count("nodes created")
+                elemnode=CurrentOutputDOM.createElement(InputNode.tagName)
+                OutputNode.appendChild(elemnode)
+                #if InputNode.tagName=="xref":
+                    #print "Transferred xref: "+InputNode.getAttribute("href")
+                CopyAttributes(InputNode,elemnode)
+
+                #process bookmark if ID found
+                BookmarkID=InputNode.getAttribute("id")
 
             
-            if BookmarkID<>"":
-                #print "ID found"
-                if BookmarkID in AllIDs:
-                    debug(1,"Duplicate bookmark ID: "+BookmarkID)
-                else:
-                    AllIDs.append(BookmarkID)
-                    Ref="#"+CurrentDocID+"/"+BookmarkID
-                    BookmarksDictionary[BookmarkID]=(CurrentDocID,Ref) 
+                if BookmarkID<>"":
+                    #print "ID found"
+                    if not self.AllIDs.Add(BookmarkID):
+                        self.debug(1,"Duplicate bookmark ID: %s",BookmarkID)
+                    else:
+                        Ref="#"+CurrentDocID+"/"+BookmarkID
+                        self.BookmarksDictionary[BookmarkID]=(CurrentDocID,Ref) 
+
+                # process child nodes
+                for childnode in InputNode.childNodes:
+                    CopyToOutput(childnode,elemnode)
+
+        # Internal recursion function - taking over a node moved from the initial DOM, saving IDs in BookmarksDictionary
+        # 0.43: used instead of CopyToOutput for the topic content, so that the document is not held in memory twice
+        # Does for InputNode what CopyToOutput does, in the same order; InputNode must already be in CurrentOutputDOM
+        def AdoptToOutput(InputNode):
+            self.Report.Count("nodes moved")
+            InputNode.ownerDocument=CurrentOutputDOM
+            if InputNode.nodeType==xml.dom.Node.ELEMENT_NODE:
+                # light tree attributes are just strings
+                if not self.Options.LightTree:
+                    for i in range(0,InputNode.attributes.length):
+                        InputNode.attributes.item(i).ownerDocument=CurrentOutputDOM
+
+                #process bookmark if ID found
+                BookmarkID=InputNode.getAttribute("id")
 
-            # process child nodes
-            for childnode in InputNode.childNodes:
-                CopyToOutput(childnode,elemnode)
+                if BookmarkID<>"":
+                    if not self.AllIDs.Add(BookmarkID):
+                        self.debug(1,"Duplicate bookmark ID: %s",BookmarkID)
+                    else:
+                        Ref="#"+CurrentDocID+"/"+BookmarkID
+                        self.BookmarksDictionary[BookmarkID]=(CurrentDocID,Ref) 
+
+                # process child nodes
+                # CopyToOutput only copies text and elements, so any other nodes are dropped
+                for childnode in list(InputNode.childNodes):
+                    if childnode.nodeType in [xml.dom.Node.TEXT_NODE,xml.dom.Node.ELEMENT_NODE]:
+                        AdoptToOutput(childnode)
+                    else:
+                        InputNode.removeChild(childnode)
+                        childnode.unlink()
 
-    # MAIN FUNCTION CODE
+        # MAIN FUNCTION CODE
 
-    # get the MiniDOM implementation - required for creating new DOMs 
-    impl=xml.dom.getDOMImplementation("minidom")
+        # get the MiniDOM implementation - required for creating new DOMs 
+        impl=xml.dom.getDOMImplementation("minidom")
 
 
-    for node in InitialOutputBody.childNodes:
-        if node.nodeType==xml.dom.Node.ELEMENT_NODE:
-            if node.tagName=="temp:topic":
-                # Start a new topic
+        # the content is moved out of InitialOutputBody as we go, so the loop is over a copy of the list of nodes
+        for node in list(self.InitialOutputBody.childNodes):
+            if node.nodeType==xml.dom.Node.ELEMENT_NODE:
+                if node.tagName=="temp:topic":
+                    # Start a new topic
 
-                # Get the level
+                    # Get the level
 
-                try:
-                    level=int(node.getAttribute("level"))
-                except ValueError:
-                    debug(1,"No level set in temp:title")
-                    level=1
+                    try:
+                        level=int(node.getAttribute("level"))
+                    except ValueError:
+                        self.debug(1,"No level set in temp:title")
+                        level=1
 
-                # Get the existing bookmark ID, if present
-                BookmarkID=node.getAttribute("id")
-                #print ("BookmarkID="+BookmarkID)
+                    # Get the existing bookmark ID, if present
+                    BookmarkID=node.getAttribute("id")
+                    #print ("BookmarkID="+BookmarkID)
 
 
-                # Process the title node - get doc title
-                TitleNode=node.getElementsByTagName("title").item(0)
-                doctitle=GetTextAsString(TitleNode).strip()
+                    # Process the title node - get doc title
+                    TitleNode=node.getElementsByTagName("title").item(0)
+                    doctitle=GetTextAsString(TitleNode).strip()
 
                 
-                # If this is an empty topic - blank title and next sibling is a <temp:topic> - move ID to next, and skip it
-		# if the title is empty but the topic is not, change title to "notitle"
-                if doctitle=="":
-                    doctitle="notitle"
-                    if node.nextSibling<>None:
-                        if node.nextSibling.nodeType==xml.dom.Node.ELEMENT_NODE:
-                            if node.nextSibling.tagName=="temp:topic":
-                                MoveId(node,node.nextSibling)
-                                continue
-
-                # Determine document type (and fix title)
-
-                doctypestr="concept" # this is the default
-                if doctitle.find("[r]")>-1:
-                    doctypestr="reference"
-                    ReplaceText(TitleNode,"[r]","")
-                    # remove any double space or final space this may have created
-                    ReplaceText(TitleNode,"  "," ")
-                    ltnode=FindLastText(TitleNode)
-                    if ltnode.data[len(ltnode.data)-1].isspace():
-                        ltnode.data=ltnode.data[:len(ltnode.data)-1]
+                    # If this is an empty topic - blank title and next sibling is a <temp:topic> - move ID to next, and skip it
+    		# if the title is empty but the topic is not, change title to "notitle"
+                    if doctitle=="":
+                        doctitle="notitle"
+                        if node.nextSibling<>None:
+                            if node.nextSibling.nodeType==xml.dom.Node.ELEMENT_NODE:
+                                if node.nextSibling.tagName=="temp:topic":
+                                    self.MoveId(node,node.nextSibling)
+                                    continue
+
+                    # Determine document type (and fix title)
+
+                    doctypestr="concept" # this is the default
+                    if doctitle.find("[r]")>-1:
+                        doctypestr="reference"
+                        ReplaceText(TitleNode,"[r]","")
+                        # remove any double space or final space this may have created
+                        ReplaceText(TitleNode,"  "," ")
+                        ltnode=FindLastText(TitleNode)
+                        if ltnode.data[len(ltnode.data)-1].isspace():
+                            ltnode.data=ltnode.data[:len(ltnode.data)-1]
                         
-                if doctitle.find("[t]")>-1:
-                    doctypestr="task"
-                    ReplaceText(TitleNode,"[t]","")
-                    # remove any double space or final space this may have created
-                    ReplaceText(TitleNode,"  "," ")
-                    ltnode=FindLastText(TitleNode)
-                    if ltnode.data[len(ltnode.data)-1].isspace():
-                        ltnode.data=ltnode.data[:len(ltnode.data)-1]
-
-                if doctitle.find("[c]")>-1:
-                    ReplaceText(TitleNode,"[c]","")
+                    if doctitle.find("[t]")>-1:
+                        doctypestr="task"
+                        ReplaceText(TitleNode,"[t]","")
+                        # remove any double space or final space this may have created
+                        ReplaceText(TitleNode,"  "," ")
+                        ltnode=FindLastText(TitleNode)
+                        if ltnode.data[len(ltnode.data)-1].isspace():
+                            ltnode.data=ltnode.data[:len(ltnode.data)-1]
+
+                    if doctitle.find("[c]")>-1:
+                        ReplaceText(TitleNode,"[c]","")
                     
                     
-                # changed in 0.36 on user request
-                # determine document (topic) ID - based on the title
-                # [r] and [t] are removed by this time, so we get the title text anew
-                CurrentDocID=GetTextAsString(TitleNode).strip().lower()
-
-                # 0.42 if the ID is empty,s et it to "notitle"
-                if CurrentDocID=="":
-                    CurrentDocID="notitle"
-
-                # replace non-alphanumeric characters with "_"
-                for n in range(0,len(CurrentDocID)):
-                    if not CurrentDocID[n].isalnum():
-                        CurrentDocID=CurrentDocID[:n]+"_"+CurrentDocID[n+1:]
-
-                # remove multiple "_" - replace with single "_"
-                while CurrentDocID.find("__")>=0:
-                    CurrentDocID=CurrentDocID.replace("__","_")
-
-                # truncate
-                CurrentDocID=CurrentDocID[:30]
+                    # changed in 0.36 on user request
+                    # determine document (topic) ID - based on the title
+                    # [r] and [t] are removed by this time, so we get the title text anew
+                    CurrentDocID=GetTextAsString(TitleNode).strip().lower()
+
+                    # 0.42 if the ID is empty,s et it to "notitle"
+                    if CurrentDocID=="":
+                        CurrentDocID="notitle"
+
+                    # replace non-alphanumeric characters with "_"
+                    for n in range(0,len(CurrentDocID)):
+                        if not CurrentDocID[n].isalnum():
+                            CurrentDocID=CurrentDocID[:n]+"_"+CurrentDocID[n+1:]
+
+                    # remove multiple "_" - replace with single "_"
+                    while CurrentDocID.find("__")>=0:
+                        CurrentDocID=CurrentDocID.replace("__","_")
+
+                    # truncate
+                    CurrentDocID=CurrentDocID[:30]
                         
                         
 
-                # prefix the ID with conc/task/refe
-                if not DoNotPrefix:
-                    if doctypestr=="reference":
-                        CurrentDocID="r_"+CurrentDocID
-                    elif doctypestr=="task":
-                        CurrentDocID="t_"+CurrentDocID
-                    else: # concept is the default
-                       CurrentDocID="c_"+CurrentDocID
-                else: # protection from leading number
-                    if not CurrentDocID[0].isaplha():
-                        CurrentDocID="a"+CurrentDocID
+                    # prefix the ID with conc/task/refe
+                    if not self.Options.DoNotPrefix:
+                        if doctypestr=="reference":
+                            CurrentDocID="r_"+CurrentDocID
+                        elif doctypestr=="task":
+                            CurrentDocID="t_"+CurrentDocID
+                        else: # concept is the default
+                           CurrentDocID="c_"+CurrentDocID
+                    else: # protection from leading number
+                        if not CurrentDocID[0].isaplha():
+                            CurrentDocID="a"+CurrentDocID
 
 
-                #remove trailing _'s unless it makes the id too short
-                while (len(CurrentDocID)>5) and (CurrentDocID[len(CurrentDocID)-1]=="_"):
-                    CurrentDocID=CurrentDocID[:len(CurrentDocID)-1]
+                    #remove trailing _'s unless it makes the id too short
+                    while (len(CurrentDocID)>5) and (CurrentDocID[len(CurrentDocID)-1]=="_"):
+                        CurrentDocID=CurrentDocID[:len(CurrentDocID)-1]
 
 
-                # replace non-ascii characters with underscores
-                for ii in range(0,len(CurrentDocID)-1):
-                    try:
-                        CurrentDocID[ii].decode("ascii")
-                    except (UnicodeDecodeError,UnicodeEncodeError):
-                        CurrentDocID=CurrentDocID[:ii]+"_"+CurrentDocID[ii+1:]
+                    # replace non-ascii characters with underscores
+                    for ii in range(0,len(CurrentDocID)-1):
+                        try:
+                            CurrentDocID[ii].decode("ascii")
+                        except (UnicodeDecodeError,UnicodeEncodeError):
+                            CurrentDocID=CurrentDocID[:ii]+"_"+CurrentDocID[ii+1:]
                    
-                # make sure doc ID is unique
-                IDbase=CurrentDocID
-                n=1
-                while CurrentDocID in AllIDs:
-                    CurrentDocID=IDbase+str(n)
-                    n=n+1
-
-                AllIDs.append(CurrentDocID)
-                #TEMP
-                #print "Topic ID: "+CurrentDocID
-
-#                if doctypestr=="reference":
-#                    doctype=impl.createDocumentType("reference", "-//IBM//DTD DITA IBM Reference//EN", "ibm-reference.dtd")
-#                elif doctypestr=="task":
-#                    doctype=impl.createDocumentType("task", "-//IBM//DTD DITA IBM Task//EN", "ibm-task.dtd")
-#                else: # concept is the default
-#                    doctype=impl.createDocumentType("concept", "-//IBM//DTD DITA IBM Concept//EN", "ibm-concept.dtd")
-
-                # OASIS
-                doctype=impl.createDocumentType(doctypestr, "-//OASIS//DTD DITA Composite//EN", "ditabase.dtd")
-
-                CurrentOutputDOM=impl.createDocument(None,doctypestr,doctype)
-
-                # set topic "id" attribute to the newly created ID
-                # and xml:lang as required - NOT NEEDED FOR OASIS
-                TopicElement=GetElementChild(CurrentOutputDOM)
-                TopicElement.setAttribute("id",CurrentDocID)
-                # TopicElement.setAttribute("xml:lang","en-us")
-                #OASIS seems to require xmlns:ditaarch
-                TopicElement.setAttribute("xmlns:ditaarch","http://dita.oasis-open.org/architecture/2005/")
+                    # make sure doc ID is unique
+                    CurrentDocID=self.AllIDs.Unique(CurrentDocID)
+                    #TEMP
+                    #print "Topic ID: "+CurrentDocID
+
+    #                if doctypestr=="reference":
+    #                    doctype=impl.createDocumentType("reference", "-//IBM//DTD DITA IBM Reference//EN", "ibm-reference.dtd")
+    #                elif doctypestr=="task":
+    #                    doctype=impl.createDocumentType("task", "-//IBM//DTD DITA IBM Task//EN", "ibm-task.dtd")
+    #                else: # concept is the default
+    #                    doctype=impl.createDocumentType("concept", "-//IBM//DTD DITA IBM Concept//EN", "ibm-concept.dtd")
+
+                    # OASIS
+                    doctype=impl.createDocumentType(doctypestr, "-//OASIS//DTD DITA Composite//EN", "ditabase.dtd")
+
+                    if self.Options.LightTree:
+                        CurrentOutputDOM=LightDocument(doctypestr,doctype)
+                    else:
+                        CurrentOutputDOM=impl.createDocument(None,doctypestr,doctype)
+
+                    # set topic "id" attribute to the newly created ID
+                    # and xml:lang as required - NOT NEEDED FOR OASIS
+                    TopicElement=self.GetElementChild(CurrentOutputDOM)
+                    TopicElement.setAttribute("id",CurrentDocID)
+                    # TopicElement.setAttribute("xml:lang","en-us")
+                    #OASIS seems to require xmlns:ditaarch
+                    TopicElement.setAttribute("xmlns:ditaarch","http://dita.oasis-open.org/architecture/2005/")
                 
 
-                # add the DOM to the list of output DOMs
-                OutputDOMs.append((CurrentOutputDOM,level))
+                    # add the DOM to the list of output DOMs
+                    self.OutputDOMs.append((CurrentOutputDOM,level))
                 
-                # Process bookmark if required
-                if BookmarkID<>"":
-                    BookmarksDictionary[BookmarkID]=(CurrentDocID,"#"+CurrentDocID)
+                    # Process bookmark if required
+                    if BookmarkID<>"":
+                        self.BookmarksDictionary[BookmarkID]=(CurrentDocID,"#"+CurrentDocID)
 
-                # create the title and copy content from the old title node
-                # NOTE: I do not use CopyToOutput for the entire title because I do not want to preserver the ID value or to process it in that routine
+                    # create the title and copy content from the old title node
+                    # NOTE: I do not use CopyToOutput for the entire title because I do not want to preserver the ID value or to process it in that routine
                 
-                NewTitleElement=CurrentOutputDOM.createElement("title")
-                TopicElement.appendChild(NewTitleElement)
-                for childnode in TitleNode.childNodes:
-                    CopyToOutput(childnode,NewTitleElement)
+                    NewTitleElement=CurrentOutputDOM.createElement("title")
+                    TopicElement.appendChild(NewTitleElement)
+                    for childnode in TitleNode.childNodes:
+                        CopyToOutput(childnode,NewTitleElement)
                 
-                # create the empty shortdesc
-                ShortdescElement=CurrentOutputDOM.createElement("shortdesc")
-                TopicElement.appendChild(ShortdescElement)
+                    # create the empty shortdesc
+                    ShortdescElement=CurrentOutputDOM.createElement("shortdesc")
+                    TopicElement.appendChild(ShortdescElement)
 
-                # Copy the prolog node only if it contains at least one indexterm 
-                PrologNode=node.getElementsByTagName("title").item(0)
-                if PrologNode.getElementsByTagName("indexterm").length>0:
-                    CopyToOutput(PrologNode,TopicElement)
+                    # Copy the prolog node only if it contains at least one indexterm 
+                    PrologNode=node.getElementsByTagName("title").item(0)
+                    if PrologNode.getElementsByTagName("indexterm").length>0:
+                        CopyToOutput(PrologNode,TopicElement)
 
     
 
-                # create the body, depending on document type
-                if doctypestr=="reference":
-                    # create new reference body, add the output body as its section
-                    RefBodyNode=CurrentOutputDOM.createElement("refbody")
-                    TopicElement.appendChild(RefBodyNode)
-                    CurrentOutputBody=CurrentOutputDOM.createElement("section")
-                    RefBodyNode.appendChild(CurrentOutputBody)                   
+                    # create the body, depending on document type
+                    if doctypestr=="reference":
+                        # create new reference body, add the output body as its section
+                        RefBodyNode=CurrentOutputDOM.createElement("refbody")
+                        TopicElement.appendChild(RefBodyNode)
+                        CurrentOutputBody=CurrentOutputDOM.createElement("section")
+                        RefBodyNode.appendChild(CurrentOutputBody)                   
 
                     
-                elif doctypestr=="task":
-                    # create new task body, add the output body as its context, and add dummy steps
-                    TaskBodyNode=CurrentOutputDOM.createElement("taskbody")
-                    TopicElement.appendChild(TaskBodyNode)
-                    CurrentOutputBody=CurrentOutputDOM.createElement("context")
-                    TaskBodyNode.appendChild(CurrentOutputBody)                   
-
-                    StepsNode=CurrentOutputDOM.createElement("steps")
-                    TaskBodyNode.appendChild(StepsNode)
-                    StepNode=CurrentOutputDOM.createElement("step")
-                    StepsNode.appendChild(StepNode)
-                    CmdNode=CurrentOutputDOM.createElement("cmd")
-                    StepNode.appendChild(CmdNode)
-                    CmdTextNode=CurrentOutputDOM.createTextNode("Place steps here")
-                    CmdNode.appendChild(CmdTextNode)
-
-                else: # concept is the default
-                    # create the output body as conbody
-                    CurrentOutputBody=CurrentOutputDOM.createElement("conbody")
-                    TopicElement.appendChild(CurrentOutputBody)
-
-            else:
-                # process an element that is not temp:title
-                # copy it into CurrentOutputBody
-                CopyToOutput(node,CurrentOutputBody)
-        else:
-            debug(3,"Non-element node found in the main body, type="+str(node.nodeType))
+                    elif doctypestr=="task":
+                        # create new task body, add the output body as its context, and add dummy steps
+                        TaskBodyNode=CurrentOutputDOM.createElement("taskbody")
+                        TopicElement.appendChild(TaskBodyNode)
+                        CurrentOutputBody=CurrentOutputDOM.createElement("context")
+                        TaskBodyNode.appendChild(CurrentOutputBody)                   
+
+                        StepsNode=CurrentOutputDOM.createElement("steps")
+                        TaskBodyNode.appendChild(StepsNode)
+                        StepNode=CurrentOutputDOM.createElement("step")
+                        StepsNode.appendChild(StepNode)
+                        CmdNode=CurrentOutputDOM.createElement("cmd")
+                        StepNode.appendChild(CmdNode)
+                        CmdTextNode=CurrentOutputDOM.createTextNode("Place steps here")
+                        CmdNode.appendChild(CmdTextNode)
 
-# Postprocess - change links
-# IMPORTANT: this must be run after all ID manupulation!
+                    else: # concept is the default
+                        # create the output body as conbody
+                        CurrentOutputBody=CurrentOutputDOM.createElement("conbody")
+                        TopicElement.appendChild(CurrentOutputBody)
 
-def PostprocessLinks(DOM):
-    #print BookmarksDictionary
-    # fix references for duplicate bookmarks
-    for BookmarkID in BookmarksDuplicate:
-        thedup=BookmarksDuplicate[BookmarkID]
-        if thedup<>None:
-            try:
-                BookmarksDictionary[BookmarkID]=BookmarksDictionary[thedup]
-            except KeyError:
-                # something has failed, never mind, the link will break
-                pass
-    
-    LinkNodes=DOM.getElementsByTagName("xref")
-    NodesToDelete=set([])
-    CurrentDocID=GetID(DOM)
-    for LNode in LinkNodes:
-        if LNode.getAttribute("scope")=="local":
-            BookmarkID=LNode.getAttribute("href")
-            try:
-                (DocID,LinkID)=BookmarksDictionary[BookmarkID]
-                if DocID==CurrentDocID:
-                    LinkString=LinkID
                 else:
-                    LinkString=DocID+".dita"+LinkID
-                LNode.setAttribute("href",LinkString)
-            except KeyError:
-                debug(1,"Bad bookmark "+BookmarkID)
-                NodesToDelete.add(LNode)
-                #print LNode.getAttribute("href")
-    #print "DELETING NODES..."
-    global Process_DeleteBadLinks
-    if Process_DeleteBadLinks:
-        for DNode in NodesToDelete:
-            #print DNode.getAttribute("href")
-            #print DNode.parentNode.tagName
-            DestroyNode(DNode)
-                
-
-# Postprocess - remove otherprops attributes
-def PostprocessRemoveOtherprops(DOM):
-
-    # Internal recursion routine
-    def RemoveOtherprops(node):
-        if node.nodeType==xml.dom.Node.ELEMENT_NODE:
-            if node.hasAttribute("otherprops"):
-                node.removeAttribute("otherprops")
-            for childnode in node.childNodes:
-                RemoveOtherprops(childnode)
-    for childnode in DOM.childNodes:
-        RemoveOtherprops(childnode)
-
-
-# Postprocess - attempt to create steps for a task. Run on split DOMs only
-def PostprocessTaskSteps(DOM):
-    taskElement=GetElementChild(DOM)
-    if taskElement.tagName<>"task":
-        return # not a task
-
-    contextElement=taskElement.getElementsByTagName("context").item(0)
-    stepsElement=taskElement.getElementsByTagName("steps").item(0)
-
-    # newconElement and destroyElement are hacks.
-    # newconelement will contain all nodes to remain in the context element
-    # at the end the nodes are moved back into the context element and newconElement is destroyed
-    # destroyelement iwll take all nodes to be destroyed, and it will just be destroyed with them
-    # In this wayu we can iterate over the contents of content Element by referring to the first child every time
-    # This hack is required cecause iterating over child nodes fails when some are moved in the process
-
-    newconElement=DOM.createElement("newcon")
-    taskElement.appendChild(newconElement)
-    destroyElement=DOM.createElement("destroy")
-    taskElement.appendChild(destroyElement)
-
-
-    dummystepElement=GetElementChild(stepsElement)
-    Started=False
-
-#    for node in contextElement.childNodes:     # this does NOT work correctly
-
-    while contextElement.hasChildNodes():
-        node=contextElement.firstChild
-
-        if (node.nodeType==xml.dom.Node.ELEMENT_NODE) and (node.tagName=="ol"):
-            destroyElement.appendChild(node)
-            for linode in node.childNodes: # these should be <li> and non-empty and anything else gets ignored
-                if (linode.nodeType==xml.dom.Node.ELEMENT_NODE) and (linode.tagName=="li") and (linode.hasChildNodes()):
-
-                    Started=True
-
-                    # make the new step and its contents, delay info until needed
-                    newstepElement=DOM.createElement("step")
-                    stepsElement.insertBefore(newstepElement,dummystepElement)
-                    cmdElement=DOM.createElement("cmd")
-                    newstepElement.appendChild(cmdElement)
-                    infoElement=None
-
-                    # if the li node has an id, move it to the step node
-                    if linode.hasAttribute("id"):
-                        newstepElement.setAttribute("id",linode.getAttribute("id"))
-                        linode.removeAttribute("id")
-
-                    # if the first child node of the <li> node is a text node, move to cmd
-                    if linode.firstChild.nodeType==xml.dom.Node.TEXT_NODE:
-                        textN=linode.firstChild
-                        if textN.data[-1].isspace():  # reomve last space - if no info this does not matter, and info ads a space
-                            textN.data=textN.data[:-1]
-                        cmdElement.appendChild(linode.firstChild)
-
-                    # now the rest of the child nodes, if any, go into info
-                    while linode.hasChildNodes():
-                        if infoElement==None:
-                            infoElement=DOM.createElement("info")
-                            newstepElement.appendChild(infoElement)
-                        infoElement.appendChild(linode.firstChild)
-        elif Started: #everything, just everything, that is not an ordered list, goes into the last info
-            if infoElement==None:
-                infoElement=DOM.createElement("info")
-                newstepElement.appendChild(infoElement) # there is a newstepElement as Started is true
-            infoElement.appendChild(node)
-        else:
-            newconElement.appendChild(node)
-
-    # now remove the dummy step if needed
-    if Started:
-        DestroyNode(dummystepElement)
-
-    # Destroy the node with all stuff to be destroyed in it
-    DestroyNode(destroyElement)
-
-    # all elements to remain in context go back there, newcon gets destroyed
-    while newconElement.hasChildNodes():
-        contextElement.appendChild(newconElement.firstChild)
-    DestroyNode(newconElement)
-        
+                    # process an element that is not temp:title
+                    # move it into CurrentOutputBody
+                    CurrentOutputBody.appendChild(node)
+                    AdoptToOutput(node)
+            else:
+                self.debug(3,"Non-element node found in the main body, type=%s",node.nodeType)
+
+        # report the topic IDs that had to be made unique
+        for (IDbase,ID) in self.AllIDs.Collisions:
+            self.debug(3,"Non-unique topic ID %s changed to %s",IDbase,ID)
+        if self.AllIDs.Collisions<>[]:
+            self.debug(3,"Non-unique topic IDs made unique: "+str(len(self.AllIDs.Collisions)))
+
+    # Postprocess - fix references for duplicate bookmarks
+    # Every alias in BookmarksDuplicate gets the BookmarksDictionary entry of the ID it resolves to
+    # Run once, after all ID manipulation and before PostprocessLinks
+
+    def PostprocessBookmarkAliases(self):
+        for BookmarkID in self.BookmarksDuplicate:
+            thedup=self.BookmarksDuplicate.Find(BookmarkID)
+            if thedup<>None and thedup<>BookmarkID:
+                try:
+                    self.BookmarksDictionary[BookmarkID]=self.BookmarksDictionary[thedup]
+                except KeyError:
+                    # something has failed, never mind, the link will break
+                    pass
+
+    # Postprocess - change links
+    # IMPORTANT: this must be run after all ID manupulation!
+
+    def PostprocessLinks(self,DOM):
+        #print BookmarksDictionary
+        LinkNodes=DOM.getElementsByTagName("xref")
+        NodesToDelete=set([])
+        CurrentDocID=self.GetID(DOM)
+        for LNode in LinkNodes:
+            if LNode.getAttribute("scope")=="local":
+                BookmarkID=LNode.getAttribute("href")
+                try:
+                    (DocID,LinkID)=self.BookmarksDictionary[BookmarkID]
+                    if DocID==CurrentDocID:
+                        LinkString=LinkID
+                    else:
+                        LinkString=DocID+".dita"+LinkID
+                    LNode.setAttribute("href",LinkString)
+                except KeyError:
+                    self.debug(1,"Bad bookmark %s",BookmarkID)
+                    NodesToDelete.add(LNode)
+                    #print LNode.getAttribute("href")
+        #print "DELETING NODES..."
+        if self.Options.Process_DeleteBadLinks:
+            for DNode in NodesToDelete:
+                #print DNode.getAttribute("href")
+                #print DNode.parentNode.tagName
+                self.DestroyNode(DNode)
+
+
+    # Postprocess - attempt to create steps for a task. Run on split DOMs only
+    def PostprocessTaskSteps(self,DOM):
+        taskElement=self.GetElementChild(DOM)
+        if taskElement.tagName<>"task":
+            return # not a task
+
+        contextElement=taskElement.getElementsByTagName("context").item(0)
+        stepsElement=taskElement.getElementsByTagName("steps").item(0)
+
+        # newconElement and destroyElement are hacks.
+        # newconelement will contain all nodes to remain in the context element
+        # at the end the nodes are moved back into the context element and newconElement is destroyed
+        # destroyelement iwll take all nodes to be destroyed, and it will just be destroyed with them
+        # In this wayu we can iterate over the contents of content Element by referring to the first child every time
+        # This hack is required cecause iterating over child nodes fails when some are moved in the process
+
+        newconElement=DOM.createElement("newcon")
+        taskElement.appendChild(newconElement)
+        destroyElement=DOM.createElement("destroy")
+        taskElement.appendChild(destroyElement)
+
+
+        dummystepElement=self.GetElementChild(stepsElement)
+        Started=False
+
+    #    for node in contextElement.childNodes:     # this does NOT work correctly
+
+        while contextElement.hasChildNodes():
+            node=contextElement.firstChild
+
+            if (node.nodeType==xml.dom.Node.ELEMENT_NODE) and (node.tagName=="ol"):
+                destroyElement.appendChild(node)
+                for linode in node.childNodes: # these should be <li> and non-empty and anything else gets ignored
+                    if (linode.nodeType==xml.dom.Node.ELEMENT_NODE) and (linode.tagName=="li") and (linode.hasChildNodes()):
+
+                        Started=True
+
+                        # make the new step and its contents, delay info until needed
+                        newstepElement=DOM.createElement("step")
+                        stepsElement.insertBefore(newstepElement,dummystepElement)
+                        cmdElement=DOM.createElement("cmd")
+                        newstepElement.appendChild(cmdElement)
+                        infoElement=None
+
+                        # if the li node has an id, move it to the step node
+                        if linode.hasAttribute("id"):
+                            newstepElement.setAttribute("id",linode.getAttribute("id"))
+                            linode.removeAttribute("id")
+
+                        # if the first child node of the <li> node is a text node, move to cmd
+                        if linode.firstChild.nodeType==xml.dom.Node.TEXT_NODE:
+                            textN=linode.firstChild
+                            if textN.data[-1].isspace():  # reomve last space - if no info this does not matter, and info ads a space
+                                textN.data=textN.data[:-1]
+                            cmdElement.appendChild(linode.firstChild)
+
+                        # now the rest of the child nodes, if any, go into info
+                        while linode.hasChildNodes():
+                            if infoElement==None:
+                                infoElement=DOM.createElement("info")
+                                newstepElement.appendChild(infoElement)
+                            infoElement.appendChild(linode.firstChild)
+            elif Started: #everything, just everything, that is not an ordered list, goes into the last info
+                if infoElement==None:
+                    infoElement=DOM.createElement("info")
+                    newstepElement.appendChild(infoElement) # there is a newstepElement as Started is true
+                infoElement.appendChild(node)
+            else:
+                newconElement.appendChild(node)
 
-                        
+        # now remove the dummy step if needed
+        if Started:
+            self.DestroyNode(dummystepElement)
 
-                    
-                
-    
+        # Destroy the node with all stuff to be destroyed in it
+        self.DestroyNode(destroyElement)
 
-                
-# ==========FINAL PROCESSING ======================
-# This processing must be done AFTER postprocessing as it may make changes incompatible with postprocessing
+        # all elements to remain in context go back there, newcon gets destroyed
+        while newconElement.hasChildNodes():
+            contextElement.appendChild(newconElement.firstChild)
+        self.DestroyNode(newconElement)
 
-# Rename all tags with a certain name to another name
-def FinalTagRename(DOM,OldName,NewName):
-    NodesToRename=[]
-    for RNode in DOM.getElementsByTagName(OldName):
-        NodesToRename.append(RNode)
-    for RNode in NodesToRename:
-        RNode.tagName=NewName
+    # ==========FINAL PROCESSING ======================
+    # This processing must be done AFTER postprocessing as it may make changes incompatible with postprocessing
 
-# Remove a tag, moving all text out of it
-def FinalTagRemove(DOM,Name):
-    TNodes=DOM.getElementsByTagName(Name)
-    NodesToRemove=[]
-    for node in TNodes:
-        while node.hasChildNodes():
-            node.parentNode.insertBefore(node.firstChild,node)
-        NodesToRemove.append(node)
-    for node in NodesToRemove:
-        DestroyNode(node)
+    # Remove a tag, moving all text out of it
+    def FinalTagRemove(self,DOM,Name):
+        TNodes=DOM.getElementsByTagName(Name)
+        NodesToRemove=[]
+        for node in TNodes:
+            while node.hasChildNodes():
+                node.parentNode.insertBefore(node.firstChild,node)
+            NodesToRemove.append(node)
+        for node in NodesToRemove:
+            self.DestroyNode(node)
         
         
 
     
-# === WRITING OUT ===============
-# And creating the DITA Map
-# note that we support a postfix on filenames - for multiple test writeouts mid-postprocess
-def WriteOut(dir,postfix=''):
-    # Create the DITAMAP DOM
-    impl=xml.dom.getDOMImplementation("minidom")
-    #doctype=impl.createDocumentType("map", "-//IBM//DTD DITA IBM Map//EN", "ibm-map.dtd")
-    # OASIS
-    doctype=impl.createDocumentType("map", "-//OASIS//DTD DITA Map//EN", "map.dtd")
-
-    MapDOM=impl.createDocument(None,"map",doctype)
-
-    # get the <map> element
-    # FIXME: is there a better way to get the initially created element?
-    MapNode=MapDOM.lastChild
-
-    # Set <map> attributes
-    MapNode.setAttribute("xml:lang","en-us")
-    MapNode.setAttribute("title",DocumentTitle)
-    #OASIS seems to require xmlns:ditaarch
-    MapNode.setAttribute("xmlns:ditaarch","http://dita.oasis-open.org/architecture/2005/")
-
-
-    # LevelDic contains last created topicref elements of all levels
-    # For level 0 it has the <map> element
-    LevelDic={0:MapNode}
-
-    # LastLevel is the level for which the last topicref was created
-    # A next level can not be over LastLevel+1 - we can not create empty topicrefs
-    LastLevel=0
-
-    # Skip first output as set
-    global OutputDOMs
-    OutputDOMs=OutputDOMs[SkipOutputSections:]
-
-    # Write out topic DOMs while creating the Map DOM
-    for DOM,level in OutputDOMs:
-
+    # Postprocess one output DOM, after the breakup into topics
+    # IMPORTANT: the links are set here, so this must be run after all ID manupulation
+    # 0.43: made a separate method so that every topic can be written out as soon as it is done
+
+    def PostprocessOutputDOM(self,DOM):
+        with self.Report.Phase("PostprocessLinks"):
+            self.PostprocessLinks(DOM)
+        #print "Links has run"
+
+        # FIXME: make this switchable
+        #FinalTagRemove(DOM,"codeph")
+        if self.Options.TaskPost:
+            with self.Report.Phase("PostprocessTaskSteps"):
+                self.PostprocessTaskSteps(DOM)
+
+        # tag replacement
+        with self.Report.Phase("FinalTagRename"):
+            if self.Options.ReplaceBoldWith<>"":
+                FinalTagRename(DOM,"b",self.Options.ReplaceBoldWith)
+            if self.Options.ReplaceItalicWith<>"":
+                FinalTagRename(DOM,"i",self.Options.ReplaceItalicWith)
+
+
+    # === WRITING OUT ===============
+    # And creating the DITA Map
+    # note that we support a postfix on filenames - for multiple test writeouts mid-postprocess
+    # 0.43: Run writes every topic with WriteTopic as soon as it is postprocessed, and then WriteMap;
+    #  WriteOut writes all the output DOMs at once, as before
+
+    def WriteOut(self,dir,postfix=''):
+        # Skip first output as set
+        self.OutputDOMs=self.OutputDOMs[self.Options.SkipOutputSections:]
+
+        # Write out topic DOMs, keeping what the Map needs
+        Topics=[]
+        for DOM,level in self.OutputDOMs:
+            filename=self.WriteTopic(DOM,dir,postfix)
+            if filename<>None:
+                Topics.append((filename,level))
+
+        self.WriteMap(Topics,dir,postfix)
+
+    # Write out one topic DOM, returning the file name
+    # A textless DOM is skipped, and None is returned
+    def WriteTopic(self,DOM,dir,postfix=''):
+        filename=self.TopicFileName(DOM,postfix)
+        if filename<>None:
+            self.WriteTopicFile(DOM,os.path.join(dir,filename))
+        return filename
+
+    # The file name for a topic DOM, or None if it is not to be written out because it is textless
+    def TopicFileName(self,DOM,postfix=''):
         # skip a DOM if it is textless
         if FindFirstText(DOM)==None:
-            continue
+            return None
         
-        filename=GetID(DOM)+postfix+".dita"
-
-        # Write the topic DOM
-        outfile=codecs.open(os.path.join(dir,filename),"w",encoding="utf-8")
-#        if UsePrettyXml:
-#            xmlstr=DOM.toprettyxml(encoding="utf-8")
-#        else:
-        xmlstr=DOM.toxml("utf-8")
-        outfile.write(xmlstr.decode("utf-8"))
-        outfile.close()
+        return self.GetID(DOM)+postfix+".dita"
 
-        # Create topicref
-        TopicrefNode=MapDOM.createElement("topicref")
-        TopicrefNode.setAttribute("href",filename)
-        TopicrefNode.setAttribute("format","dita")
+    # Write the topic DOM to a file
+    # NOTE: in Run this is done on the writer threads, so it must not change anything in the Converter
+    def WriteTopicFile(self,DOM,path):
+        outfile=open(path,"wb")
+        try:
+#            if UsePrettyXml:
+#                xmlstr=DOM.toprettyxml(encoding="utf-8")
+#            else:
+            WriteXML(DOM,outfile)
+        finally:
+            outfile.close()
+
+    # Write out the DITA Map
+    # Topics is a list of (file name,level) for the topics written out, in order
+    def WriteMap(self,Topics,dir,postfix=''):
+        # Create the DITAMAP DOM
+        impl=xml.dom.getDOMImplementation("minidom")
+        #doctype=impl.createDocumentType("map", "-//IBM//DTD DITA IBM Map//EN", "ibm-map.dtd")
+        # OASIS
+        doctype=impl.createDocumentType("map", "-//OASIS//DTD DITA Map//EN", "map.dtd")
+
+        MapDOM=impl.createDocument(None,"map",doctype)
+
+        # get the <map> element
+        # FIXME: is there a better way to get the initially created element?
+        MapNode=MapDOM.lastChild
+
+        # Set <map> attributes
+        MapNode.setAttribute("xml:lang","en-us")
+        MapNode.setAttribute("title",self.DocumentTitle)
+        #OASIS seems to require xmlns:ditaarch
+        MapNode.setAttribute("xmlns:ditaarch","http://dita.oasis-open.org/architecture/2005/")
+
+
+        # LevelDic contains last created topicref elements of all levels
+        # For level 0 it has the <map> element
+        LevelDic={0:MapNode}
+
+        # LastLevel is the level for which the last topicref was created
+        # A next level can not be over LastLevel+1 - we can not create empty topicrefs
+        LastLevel=0
+
+        for filename,level in Topics:
+            # Create topicref
+            TopicrefNode=MapDOM.createElement("topicref")
+            TopicrefNode.setAttribute("href",filename)
+            TopicrefNode.setAttribute("format","dita")
         
 
-        # Fix level if it is too high or too low
-        if level>(LastLevel+1):
-            level=LastLevel+1
-        if level<1:
-            level=1
+            # Fix level if it is too high or too low
+            if level>(LastLevel+1):
+                level=LastLevel+1
+            if level<1:
+                level=1
 
-        # Insert topicref under appropriate element
-        LevelDic[level-1].appendChild(TopicrefNode)
+            # Insert topicref under appropriate element
+            LevelDic[level-1].appendChild(TopicrefNode)
 
-        # Save the node in the dic, and save the last level
-        LevelDic[level]=TopicrefNode
-        LastLevel=level
+            # Save the node in the dic, and save the last level
+            LevelDic[level]=TopicrefNode
+            LastLevel=level
         
-    # Write out the ditamap
-
-    mapfilename=os.path.join(dir,NameRoot+postfix+".ditamap")
-    outfile=codecs.open(mapfilename,"w",encoding="utf-8")
-#    if UsePrettyXml:
-#        xmlstr=MapDOM.toprettyxml(encoding="utf-8")
-#    else:
-    xmlstr=MapDOM.toxml("utf-8")
-#    xmlstr=xmlstr.decode("utf-8").encode("utf-8")
-    outfile.write(xmlstr.decode("utf-8"))
-    outfile.close()
+        # Write out the ditamap
+
+        mapfilename=os.path.join(dir,self.Options.NameRoot+postfix+".ditamap")
+        outfile=open(mapfilename,"wb")
+    #    if UsePrettyXml:
+    #        xmlstr=MapDOM.toprettyxml(encoding="utf-8")
+    #    else:
+        WriteXML(MapDOM,outfile)
+        outfile.close()
     
     
 
-# == MAIN CONVERSION PROCEDURE  =============================
-
-def ConvertODTToDITA():
-    try:
-        # create the initial output DOM
-
-        CreateInitialOutputDOM()
-
-        # Open the zip file
-        ODTzip=zipfile.ZipFile(InputFile)
-        NamesInZip=ODTzip.namelist()
-
-
-        # process the meta.xml file for document title
-        MetaDOM=xml.dom.minidom.parse(ODTzip.open("meta.xml"))
-        rootnode=MetaDOM.firstChild
-        for childnode in rootnode.childNodes:
-            if (childnode.nodeType==xml.dom.Node.ELEMENT_NODE):
-                if childnode.tagName=="office:meta":
-                    for grandchildnode in childnode.childNodes:
-                        if (grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE):
-                            if grandchildnode.tagName=="dc:title" and grandchildnode.hasChildNodes():
-                                textnode=grandchildnode.firstChild
-                                if textnode.nodeType==xml.dom.Node.TEXT_NODE:
-                                    DocumentTitle=textnode.data
-
-
-        # process the styles.xml file
-        StylesDOM=xml.dom.minidom.parse(ODTzip.open("styles.xml"))
-        rootnode=StylesDOM.firstChild
-        for childnode in rootnode.childNodes:
-            if (childnode.nodeType==xml.dom.Node.ELEMENT_NODE):
-                if (childnode.tagName=="office:styles") or (childnode.tagName=="office:automatic-styles"):
-                    ProcessStylesNode(childnode)
-
-        # process the content.xml file
-                
-        ContentsDOM=xml.dom.minidom.parse(ODTzip.open("content.xml"))
-        rootnode=ContentsDOM.firstChild
-        for childnode in rootnode.childNodes:
-            if (childnode.nodeType==xml.dom.Node.ELEMENT_NODE):
-                if childnode.tagName=="office:automatic-styles":
-                    ProcessStylesNode(childnode)
-                elif childnode.tagName=="office:body":
-                    #FIXME this is an outright hack - looking for text nodes only within office:body
-                    # probably should be a separate function            
-                    for grandchildnode in childnode.childNodes:
-                        if (grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE):
-                            if grandchildnode.tagName=="office:text":
-                                ProcessTextNode(grandchildnode)
-
-
-
-        # Remove trademark signs
-        #ReplaceText(InitialOutputDOM,"®","")
-        ReplaceText(InitialOutputDOM,u'®',"")
-
-        # TEMP
-        #outfile=open("test_prepost.dita","w")
-        #xmlstr=InitialOutputDOM.toxml("UTF-8")
-        #outfile.write(xmlstr)
-        #outfile.close()
-
-
-        PostprocessSpace(InitialOutputDOM)
-        PostprocessLinebreak(InitialOutputDOM)
-
-
-#        PostprocessElevateTempTopic(InitialOutputDOM)
-        PostprocessFixNestedParagraphs(InitialOutputDOM)
-
-
-
-        PostprocessFirstP(InitialOutputDOM)
-        PostprocessFootnotes(InitialOutputDOM)
-        PostprocessJoinLists(InitialOutputDOM)
-        PostprocessNestedOneLists(InitialOutputDOM)
-
-        PostprocessJoinTags(InitialOutputDOM,"i")
-        PostprocessJoinTags(InitialOutputDOM,"u")
-        PostprocessJoinTags(InitialOutputDOM,"codeph")
-
-        # TEMP
-        #outfile=open("dumpdump.dita","w")
-        #xmlstr=InitialOutputDOM.toxml("UTF-8")
-        #outfile.write(xmlstr)
-        #outfile.close()
-
-
-        PostprocessTables(InitialOutputDOM)
-        PostprocessCodeblock(InitialOutputDOM)
-
-        # TEMP
-        #outfile=open("dumpdump.dita","w")
-        #xmlstr=InitialOutputDOM.toxml("UTF-8")
-        #outfile.write(xmlstr)
-        #outfile.close()
-
-        RemoveChildlessElementChildrenPara(InitialOutputDOM) # Remove blank paragraphs, now that they have been used for codeblocks
-
-        # TEMP2
-        #outfile=open("dumpdump2.dita","w")
-        #xmlstr=InitialOutputDOM.toxml("UTF-8")
-        #outfile.write(xmlstr)
-        #outfile.close()
-
-
-        PostprocessNotes(InitialOutputDOM)
-        PostprocessNotesFromParagraphs(InitialOutputDOM)
-
-        # TEMP2
-        #outfile=open("dumpdump2.dita","w")
-        #xmlstr=InitialOutputDOM.toxml("UTF-8")
-        #outfile.write(xmlstr)
-        #outfile.close()
-
-
-
-        PostprocessBreakupIntoTopics()
-        #debug(3,"Topic breakup complete")
-
-        # TEMP
-        #outfile=open("testnewdesign.dita","w")
-        #xmlstr=InitialOutputDOM.toxml("UTF-8")
-        #outfile.write(xmlstr)
-        #outfile.close()
-
-        #int("causeexception")
+    # == MAIN CONVERSION PROCEDURE  =============================
+    # Run the whole conversion as set up by the options
+    # Messages, including any exception, go to DebugText
+    # 0.43: the phases are timed in self.Report, and with the WriteReport option it is written out at the end
 
+    def Run(self):
+        Report=self.Report
+        try:
+            # create the initial output DOM
+
+            self.CreateInitialOutputDOM()
+
+            # Open the zip file
+            with Report.Phase("zip open"):
+                ODTzip=zipfile.ZipFile(self.Options.InputFile)
+                NamesInZip=ODTzip.namelist()
+
+
+            # process the meta.xml file for document title
+            with Report.Phase("meta parse"):
+                MetaDOM=xml.dom.minidom.parse(ODTzip.open("meta.xml"))
+                rootnode=MetaDOM.firstChild
+                for childnode in rootnode.childNodes:
+                    if (childnode.nodeType==xml.dom.Node.ELEMENT_NODE):
+                        if childnode.tagName=="office:meta":
+                            for grandchildnode in childnode.childNodes:
+                                if (grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE):
+                                    if grandchildnode.tagName=="dc:title" and grandchildnode.hasChildNodes():
+                                        textnode=grandchildnode.firstChild
+                                        if textnode.nodeType==xml.dom.Node.TEXT_NODE:
+                                            DocumentTitle=textnode.data
+
+
+            # process the styles.xml file
+            # With a styles cache, a styles.xml already seen is not parsed; the automatic styles in content.xml
+            #  are processed for every document, as usual
+            StylesCached=False
+            if self.Options.StylesCacheDir<>"":
+                with Report.Phase("styles cache"):
+                    StylesXML=ODTzip.read("styles.xml")
+                    StylesCacheFile=self.StylesCacheFile(StylesXML)
+                    StylesCached=self.ReadStylesCache(StylesCacheFile)
+            if not StylesCached:
+                with Report.Phase("styles parse"):
+                    if self.Options.StylesCacheDir<>"":
+                        StylesDOM=xml.dom.minidom.parseString(StylesXML)
+                    else:
+                        StylesDOM=xml.dom.minidom.parse(ODTzip.open("styles.xml"))
+                rootnode=StylesDOM.firstChild
+                # the styles and automatic styles are processed together, as styles can inherit across them
+                StylesNodes=[]
+                for childnode in rootnode.childNodes:
+                    if (childnode.nodeType==xml.dom.Node.ELEMENT_NODE):
+                        if (childnode.tagName=="office:styles") or (childnode.tagName=="office:automatic-styles"):
+                            StylesNodes.append(childnode)
+                with Report.Phase("ProcessStylesNode"):
+                    self.ProcessStylesNodes(StylesNodes)
+                StylesDOM.unlink()
+                if self.Options.StylesCacheDir<>"":
+                    with Report.Phase("styles cache"):
+                        self.WriteStylesCache(StylesCacheFile)
+
+            # process the content.xml file
+            # when streaming, ProcessTextNode and ProcessStylesNode are timed for every block in ProcessContentStream,
+            #  and the rest of the time is the parse
+            with Report.Phase("content parse"):
+                if self.Options.StreamContent:
+                    self.ProcessContentStream(ODTzip.open("content.xml"))
+                else:
+                    ContentsDOM=xml.dom.minidom.parse(ODTzip.open("content.xml"))
+            if not self.Options.StreamContent:
+                rootnode=ContentsDOM.firstChild
+                for childnode in rootnode.childNodes:
+                    if (childnode.nodeType==xml.dom.Node.ELEMENT_NODE):
+                        if childnode.tagName=="office:automatic-styles":
+                            with Report.Phase("ProcessStylesNode"):
+                                self.ProcessStylesNode(childnode)
+                        elif childnode.tagName=="office:body":
+                            #FIXME this is an outright hack - looking for text nodes only within office:body
+                            # probably should be a separate function            
+                            for grandchildnode in childnode.childNodes:
+                                if (grandchildnode.nodeType==xml.dom.Node.ELEMENT_NODE):
+                                    if grandchildnode.tagName=="office:text":
+                                        with Report.Phase("ProcessTextNode"):
+                                            self.ProcessTextNode(grandchildnode)
+
+            # every node in the initial output DOM so far has been created by ProcessTextNode
+            Report.Count("nodes created",CountNodes(self.InitialOutputDOM))
+            Report.Count("spans",self.SpanCount)
+            Report.Count("span style cache hits",self.SpanStyleHits)
+
+
+            # Remove trademark signs
+            #ReplaceText(InitialOutputDOM,"®","")
+            with Report.Phase("ReplaceText"):
+                ReplaceText(self.InitialOutputDOM,u'®',"")
+
+            # TEMP
+            #outfile=open("test_prepost.dita","w")
+            #xmlstr=InitialOutputDOM.toxml("UTF-8")
+            #outfile.write(xmlstr)
+            #outfile.close()
+
+
+            with Report.Phase("PostprocessSpace"):
+                self.PostprocessSpace(self.InitialOutputDOM)
+            if self.TempLinebreaks:
+                with Report.Phase("PostprocessLinebreak"):
+                    self.PostprocessLinebreak(self.InitialOutputDOM)
+
+
+    #        PostprocessElevateTempTopic(InitialOutputDOM)
+
+            # 0.43: passes that can share a walk of the tree are run with TagWalk, see there
+            # Raising <p>s creates copies of other tags, so the lists, <i>, <u> and <codeph> have to be found after it
+            DOM=self.InitialOutputDOM
+            Walk=TagWalk(Report)
+            Walk.Register(["p"],lambda Found: self.PostprocessFixNestedParagraphs(DOM,Found),"PostprocessFixNestedParagraphs")
+            Walk.Register(["li","entry","fn"],lambda Found: self.PostprocessFirstP(DOM,Found),"PostprocessFirstP")
+            Walk.Register(["fn"],lambda Found: self.PostprocessFootnotes(DOM,Found),"PostprocessFootnotes")
+            Walk.Run(DOM)
+
+            Walk=TagWalk(Report)
+            Walk.Register(["ul"],lambda Found: self.PostprocessJoinLists(DOM,Found),"PostprocessJoinLists")
+            Walk.Register(["ul","ol"],lambda Found: self.PostprocessNestedOneLists(DOM,Found),"PostprocessNestedOneLists")
+            Walk.Register(["i"],lambda Found: self.PostprocessJoinTags(DOM,"i",Found),"PostprocessJoinTags")
+            Walk.Register(["u"],lambda Found: self.PostprocessJoinTags(DOM,"u",Found),"PostprocessJoinTags")
+            Walk.Register(["codeph"],lambda Found: self.PostprocessJoinTags(DOM,"codeph",Found),"PostprocessJoinTags")
+            Walk.Register(["table"],lambda Found: self.PostprocessTables(DOM,Found),"PostprocessTables")
+            Walk.Run(DOM)
+
+            # TEMP
+            #outfile=open("dumpdump.dita","w")
+            #xmlstr=InitialOutputDOM.toxml("UTF-8")
+            #outfile.write(xmlstr)
+            #outfile.close()
+
+
+            with Report.Phase("PostprocessCodeblock"):
+                self.PostprocessCodeblock(self.InitialOutputDOM)
+
+            # TEMP
+            #outfile=open("dumpdump.dita","w")
+            #xmlstr=InitialOutputDOM.toxml("UTF-8")
+            #outfile.write(xmlstr)
+            #outfile.close()
+
+            with Report.Phase("RemoveChildlessElementChildrenPara"):
+                self.RemoveChildlessElementChildrenPara(self.InitialOutputDOM) # Remove blank paragraphs, now that they have been used for codeblocks
+
+            # TEMP2
+            #outfile=open("dumpdump2.dita","w")
+            #xmlstr=InitialOutputDOM.toxml("UTF-8")
+            #outfile.write(xmlstr)
+            #outfile.close()
+
+
+            Walk=TagWalk(Report)
+            Walk.Register(["note"],lambda Found: self.PostprocessNotes(DOM,Found),"PostprocessNotes")
+            Walk.Register(["p"],lambda Found: self.PostprocessNotesFromParagraphs(DOM,Found),"PostprocessNotesFromParagraphs")
+            Walk.Run(DOM)
+
+            # TEMP2
+            #outfile=open("dumpdump2.dita","w")
+            #xmlstr=InitialOutputDOM.toxml("UTF-8")
+            #outfile.write(xmlstr)
+            #outfile.close()
+
+
+            with Report.Phase("PostprocessBreakupIntoTopics"):
+                self.PostprocessBreakupIntoTopics()
+            self.Otherprops={}
+            #debug(3,"Topic breakup complete")
+
+            # TEMP
+            #outfile=open("testnewdesign.dita","w")
+            #xmlstr=InitialOutputDOM.toxml("UTF-8")
+            #outfile.write(xmlstr)
+            #outfile.close()
+
+            #int("causeexception")
+
+
+            with Report.Phase("PostprocessBookmarkAliases"):
+                self.PostprocessBookmarkAliases()
+
+            # postprocess by DOM and write out
+            # 0.43: every topic is written out and freed as soon as it is postprocessed,
+            #  and only the file name and level are kept for the Map
+            # The first SkipOutputSections DOMs are postprocessed (for the log) but not written
+            # With WriteThreads over 1, the files are written on a pool of threads while postprocessing goes on
+            # A file that can not be written is reported, and the rest are still written, but then the map is not
+            # The time spent writing the topic files is the "WriteOut" phase; with several threads it is their total
+
+            # Write one topic file and free the DOM; returns the error message, or None if written
+            def WriteAndFree(DOM,path):
+                StartWall=time.time()
+                StartCPU=CPUTime()
+                try:
+                    self.WriteTopicFile(DOM,path)
+                    return None
+                except IOError as TheException:
+                    return str(TheException)
+                finally:
+                    DOM.unlink()
+                    Report.AddTime("WriteOut",time.time()-StartWall,CPUTime()-StartCPU)
+
+            if self.Options.WriteThreads>1:
+                WriterPool=multiprocessing.pool.ThreadPool(self.Options.WriteThreads)
+            else:
+                WriterPool=None
 
-        # postprocess by DOM
+            Topics=[]
+            Writes=[]
+            DOMNumber=0
+            try:
+                while self.OutputDOMs<>[]:
+                    DOM,level=self.OutputDOMs.pop(0)
+                    self.PostprocessOutputDOM(DOM)
+                    filename=None
+                    if DOMNumber>=self.Options.SkipOutputSections:
+                        filename=self.TopicFileName(DOM)
+                    DOMNumber=DOMNumber+1
+                    if filename==None:
+                        DOM.unlink()
+                        continue
+
+                    Topics.append((filename,level))
+                    path=os.path.join(self.Options.OutputDirectory,filename)
+                    if WriterPool==None:
+                        Writes.append((filename,WriteAndFree(DOM,path)))
+                    else:
+                        Writes.append((filename,WriterPool.apply_async(WriteAndFree,(DOM,path))))
+            finally:
+                if WriterPool<>None:
+                    WriterPool.close()
+                    with Report.Phase("WriteOut wait"):
+                        WriterPool.join()
+
+            WriteErrors=0
+            for filename,result in Writes:
+                if WriterPool<>None:
+                    result=result.get()
+                if result<>None:
+                    self.debug(0,"Error writing file "+filename+": "+result)
+                    WriteErrors=WriteErrors+1
+
+            # No map if a topic file was not written, as the map would point to it - the same as before 0.43,
+            #  when the first error stopped the writeout before the map
+            # (Leaving the missing topics out of the map would put the topics under them in the wrong place)
+            if WriteErrors>0:
+                self.debug(0,"Error writing files! "+str(WriteErrors)+" topic files were not written, the map is not written")
+                return
 
-        for DOM,level in OutputDOMs:
-            PostprocessLinks(DOM)
-            #print "Links has run"
-            PostprocessRemoveOtherprops(DOM)
-            #debug(3,"Otherprops has run")
-        #debug(3,"Links/otherprops done")
+            try:
+                with Report.Phase("WriteMap"):
+                    self.WriteMap(Topics,self.Options.OutputDirectory)
+            except IOError as TheException:
+                self.debug(0,"Error writing files!"+str(TheException))
+                return
+
+            # extract pictures, converting as necessary
+            #print "Images started"
+            # 0.35 conversion removed
+            # 0.38 extracting formulas as in ToUnzip added
+    #        import Image
+            with Report.Phase("picture extraction"):
+                for name in NamesInZip:
+                    if name.find("Pictures")==0:
+                        ODTzip.extract(name,self.Options.OutputDirectory)
+                    else:
+                        for unzname in self.ToUnzip:
+                            if name.find(unzname)>-1:
+                                ODTzip.extract(name,self.Options.OutputDirectory)
+                                break
+                    
+    #                if name[len(name)-4:]==".png":
+    #                    inname=os.path.join(OutputDirectory,name)
+    #                    outname=inname[:len(inname)-4]+".jpg"
+    #                    Image.open(inname).convert("RGB").save(outname,quality=95)
+
+            self.Completed=True
+            # the counts of repeated messages go before the final line, so that it stays the last one
+            self.Log.WriteRepeats()
+            self.debug(0,"Conversion completed successfully")
+       #use this line to validate the try statement if exceptions are re-enabled temporarily
+       #(by commenting out the "except Exception" clause)
+    #    except ValueError: pass
+
+        except Exception as TheException:
+            self.Log.WriteRepeats()
+            self.debug(0, "Exception "+str(type(TheException)))
+            self.debug(0,str(TheException))
+
+        if self.Options.WriteReport:
+            ReportFile=os.path.join(self.Options.OutputDirectory,self.Options.NameRoot+".report.json")
+            try:
+                Report.Write(ReportFile,input=self.Options.InputFile,completed=self.Completed)
+            except IOError as TheException:
+                self.debug(0,"Error writing the report "+ReportFile+": "+str(TheException))
 
-            # FIXME: make this switchable
-            #FinalTagRemove(DOM,"codeph")
-            if TaskPost:
-                PostprocessTaskSteps(DOM)
+        self.Log.Close()
 
 
-            # tag replacement
-            if ReplaceBoldWith<>"":
-                for DOM,level in OutputDOMs:
-                    FinalTagRename(DOM,"b",ReplaceBoldWith)
-            if ReplaceItalicWith<>"":
-                for DOM,level in OutputDOMs:
-                    FinalTagRename(DOM,"i",ReplaceItalicWith)
-                
-                               
-        # write out
+# == MODULE LEVEL ENTRY POINT ==============
+# Kept for the GUI and the command line: converts with the module level options
+# and leaves the log in the module level Log, a new one for every conversion
+# Returns the ConversionReport of the conversion
+def ConvertODTToDITA():
+    TheConverter=Converter(ConversionOptions(),Log=NewLog())
+    TheConverter.Run()
+    return TheConverter.Report
+
+
+# == BATCH CONVERSION ==============
+# Added in 0.43: convert many ODT files at once on a pool of worker processes
+# Every document goes into its own subdirectory of the output directory, named after the file,
+# and its conversion log is saved there as <name>.log
+
+# Collect the input files for a batch
+# Names can be ODT files or directories (all .odt files directly in them are taken)
+# Manifests are text files listing one input file per line; relative names are relative to the manifest
+def CollectBatchFiles(Names,Manifests):
+    Files=[]
+    for name in Names:
+        if os.path.isdir(name):
+            for filename in sorted(os.listdir(name)):
+                if filename.lower().endswith(".odt") and os.path.isfile(os.path.join(name,filename)):
+                    Files.append(os.path.join(name,filename))
+        else:
+            Files.append(name)
+    for manifest in Manifests:
+        manifestfile=codecs.open(manifest,"r",encoding="utf-8")
+        for line in manifestfile:
+            line=line.strip()
+            if line<>"" and not line.startswith("#"):
+                Files.append(os.path.join(os.path.dirname(manifest),line))
+        manifestfile.close()
+    return Files
+
+# Convert one document of a batch - runs in a worker process
+# Job is a tuple (input file, output directory, ConversionOptions)
+# Returns a tuple (input file, success flag, wall time in seconds)
+def ConvertBatchJob(Job):
+    (InFile,OutDir,Options)=Job
+    StartTime=time.time()
+    Success=False
+    try:
+        Options.InputFile=InFile
+        Options.OutputDirectory=OutDir
+        Options.NameRoot=os.path.splitext(os.path.basename(InFile))[0]
+        if not os.path.isdir(OutDir):
+            os.makedirs(OutDir)
+
+        # the log is written to the file as the conversion goes
+        logfile=codecs.open(os.path.join(OutDir,Options.NameRoot+".log"),"w",encoding="utf-8")
         try:
-            WriteOut(OutputDirectory)
-        except IOError as TheException:
-            debug(0,"Error writing files!"+str(TheException))
-            return
-
-        # extract pictures, converting as necessary
-        #print "Images started"
-        # 0.35 conversion removed
-        # 0.38 extracting formulas as in ToUnzip added
-#        import Image
-        for name in NamesInZip:
-            if name.find("Pictures")==0:
-                ODTzip.extract(name,OutputDirectory)
-            else:
-                for unzname in ToUnzip:
-                    if name.find(unzname)>-1:
-                        ODTzip.extract(name,OutputDirectory)
-                        break
-                    
-#                if name[len(name)-4:]==".png":
-#                    inname=os.path.join(OutputDirectory,name)
-#                    outname=inname[:len(inname)-4]+".jpg"
-#                    Image.open(inname).convert("RGB").save(outname,quality=95)
-
-        debug(0,"Conversion completed successfully")
-   #use this line to validate the try statement if exceptions are re-enabled temporarily
-   #(by commenting out the "except Exception" clause)
-#    except ValueError: pass
-
-    except Exception as TheException:
-        debug(0, "Exception "+str(type(TheException)))
-        debug(0,str(TheException))
+            TheConverter=Converter(Options,logfile)
+            TheConverter.Run()
+            Success=TheConverter.Completed
+        finally:
+            logfile.close()
+    except Exception:
+        # the Converter catches its own exceptions, so this is about the directory or the log
+        Success=False
+    return (InFile,Success,time.time()-StartTime)
+
+# Convert a list of files, each into its own subdirectory of OutputDir
+# Workers is the number of worker processes; None means the number of CPUs
+# Returns the list of ConvertBatchJob results, in the order of Files
+def ConvertBatch(Files,OutputDir,Options,Workers=None):
+    Jobs=[]
+    UsedNames=set([])
+    for InFile in Files:
+        # documents with the same file name from different directories get numbered subdirectories
+        subdir=os.path.splitext(os.path.basename(InFile))[0]
+        name=subdir
+        n=1
+        while name.lower() in UsedNames:
+            name=subdir+str(n)
+            n=n+1
+        UsedNames.add(name.lower())
+        Jobs.append((InFile,os.path.join(OutputDir,name),copy.copy(Options)))
+
+    if Workers==None:
+        Workers=multiprocessing.cpu_count()
+    if Workers<=1 or len(Jobs)<=1:
+        return map(ConvertBatchJob,Jobs)
+
+    pool=multiprocessing.Pool(min(Workers,len(Jobs)))
+    try:
+        # chunksize 1, as documents differ a lot in size
+        return pool.map(ConvertBatchJob,Jobs,1)
+    finally:
+        pool.close()
+        pool.join()
+
+# Print the summary of a batch conversion
+def PrintBatchSummary(Results):
+    Failed=0
+    TotalTime=0.0
+    for (InFile,Success,WallTime) in Results:
+        if Success:
+            status="OK    "
+        else:
+            status="FAILED"
+            Failed=Failed+1
+        TotalTime=TotalTime+WallTime
+        print "%s %8.2fs  %s" % (status,WallTime,InFile)
+    print "%d converted, %d failed, %.2fs total conversion time" % (len(Results)-Failed,Failed,TotalTime)
 
 # ============ USER INTERFACE ================
+# 0.43: Tk is only imported, and the GUI classes are only defined, when the GUI is started,
+# so that the module can be imported for conversion without Tk and without starting anything
 
-# text viewer for log - copied from Python standard library
+def StartGUI():
+    import Tkinter
+    import Tix
+    import tkFont
+    import tkFileDialog
 
-class TextViewer(Toplevel):
-    """ Copied from: A simple text viewer dialog for IDLE
+    # text viewer for log - copied from Python standard library
+
+    class TextViewer(Tkinter.Toplevel):
+        """ Copied from: A simple text viewer dialog for IDLE
    
     
-    """
-    def __init__(self, parent, title, text):
-        """Show the given text in a scrollable window with a 'close' button
-
         """
-        Toplevel.__init__(self, parent)
-        self.configure(borderwidth=5)
-        self.geometry("=%dx%d+%d+%d" % (625, 500,
-                                        parent.winfo_rootx() + 10,
-                                        parent.winfo_rooty() + 10))
-        #elguavas - config placeholders til config stuff completed
-        self.bg = '#ffffff'
-        self.fg = '#000000'
-
-        self.CreateWidgets()
-        self.title(title)
-        self.transient(parent)
-        self.grab_set()
-        self.protocol("WM_DELETE_WINDOW", self.Ok)
-        self.parent = parent
-        self.textView.focus_set()
-        #key bindings for this dialog
-        self.bind('<Return>',self.Ok) #dismiss dialog
-        self.bind('<Escape>',self.Ok) #dismiss dialog
-
-        self.textView.config(font=tkFont.Font(size=16))
-
-        self.textView.insert(0.0, text)
-        self.textView.config(state=DISABLED)
-        self.wait_window()
-
-    def CreateWidgets(self):
-        frameText = Frame(self, relief=SUNKEN, height=700)
-        frameButtons = Frame(self)
-        self.buttonOk = Button(frameButtons, text='Close',
-                               command=self.Ok, takefocus=FALSE)
-        self.scrollbarView = Scrollbar(frameText, orient=VERTICAL,
-                                       takefocus=FALSE, highlightthickness=0)
-        self.textView = Text(frameText, wrap=WORD, highlightthickness=0,
-                             fg=self.fg, bg=self.bg)
-        self.scrollbarView.config(command=self.textView.yview)
-        self.textView.config(yscrollcommand=self.scrollbarView.set)
-        self.buttonOk.pack()
-        self.scrollbarView.pack(side=RIGHT,fill=Y)
-        self.textView.pack(side=LEFT,expand=TRUE,fill=BOTH)
-        frameButtons.pack(side=BOTTOM,fill=X)
-        frameText.pack(side=TOP,expand=TRUE,fill=BOTH)
-
-    def Ok(self, event=None):
-        self.destroy()
-
-
-
-# ============ MAIN CLASS
-class Application(Frame):
-    def Run(self):
-        if InputFile=="NOT SELECTED":
-            debug(0,"You must select input file")
-            return
-
-        if OutputDirectory=="NOT SELECTED":
-            debug(0,"You must select output directory")
-            return
-
-        self.InFileButton.config(state="disabled")
-        self.OutDirButton.config(state="disabled")
-        self.RunButton.config(state="disabled")
-        self.CloseButton.config(state="disabled")
-
-        global Process_AntiquaAsBold
-        Process_AntiquaAsBold=(self.UseAntiqueVar.get()==1)
-        global Process_DeleteBadLinks
-        Process_DeleteBadLinks=(self.DelbadlinksVar.get()==1)
-
-        global DoNotPrefix
-        DoNotPrefix=(self.DoNotPrefixVar.get()==1)
-
-        global TaskPost
-        TaskPost=(self.TaskPostVar.get()==1)
-
-        global AggressiveFormula
-        AggressiveFormula=(self.AggressiveFormulaVar.get()==1)
-
-
-
-#        global UsePrettyXml
-#        UsePrettyXml=(self.UsePrettyXmlVar.get()==1)
-
-        global FrameMode
-        FrameMode=(self.FrameModeVar.get()==1)
-
-        global ReplaceBoldWith
-        if self.ReplaceBoldVar.get()==1:
-            ReplaceBoldWith=self.ReplaceBoldEntry.get()
-        else:
-            ReplaceBoldWith=""
+        def __init__(self, parent, title, text):
+            """Show the given text in a scrollable window with a 'close' button
+
+            """
+            Tkinter.Toplevel.__init__(self, parent)
+            self.configure(borderwidth=5)
+            self.geometry("=%dx%d+%d+%d" % (625, 500,
+                                            parent.winfo_rootx() + 10,
+                                            parent.winfo_rooty() + 10))
+            #elguavas - config placeholders til config stuff completed
+            self.bg = '#ffffff'
+            self.fg = '#000000'
+
+            self.CreateWidgets()
+            self.title(title)
+            self.transient(parent)
+            self.grab_set()
+            self.protocol("WM_DELETE_WINDOW", self.Ok)
+            self.parent = parent
+            self.textView.focus_set()
+            #key bindings for this dialog
+            self.bind('<Return>',self.Ok) #dismiss dialog
+            self.bind('<Escape>',self.Ok) #dismiss dialog
+
+            self.textView.config(font=tkFont.Font(size=16))
+
+            self.textView.insert(0.0, text)
+            self.textView.config(state=Tkinter.DISABLED)
+            self.wait_window()
+
+        def CreateWidgets(self):
+            frameText = Tkinter.Frame(self, relief=Tkinter.SUNKEN, height=700)
+            frameButtons = Tkinter.Frame(self)
+            self.buttonOk = Tkinter.Button(frameButtons, text='Close',
+                                   command=self.Ok, takefocus=Tkinter.FALSE)
+            self.scrollbarView = Tkinter.Scrollbar(frameText, orient=Tkinter.VERTICAL,
+                                           takefocus=Tkinter.FALSE, highlightthickness=0)
+            self.textView = Tkinter.Text(frameText, wrap=Tkinter.WORD, highlightthickness=0,
+                                 fg=self.fg, bg=self.bg)
+            self.scrollbarView.config(command=self.textView.yview)
+            self.textView.config(yscrollcommand=self.scrollbarView.set)
+            self.buttonOk.pack()
+            self.scrollbarView.pack(side=Tkinter.RIGHT,fill=Tkinter.Y)
+            self.textView.pack(side=Tkinter.LEFT,expand=Tkinter.TRUE,fill=Tkinter.BOTH)
+            frameButtons.pack(side=Tkinter.BOTTOM,fill=Tkinter.X)
+            frameText.pack(side=Tkinter.TOP,expand=Tkinter.TRUE,fill=Tkinter.BOTH)
+
+        def Ok(self, event=None):
+            self.destroy()
+
+
+
+    # ============ MAIN CLASS
+    class Application(Tkinter.Frame):
+        def Run(self):
+            # 0.43: these messages are shown in the log viewer; before, the next conversion dropped them
+            if InputFile=="NOT SELECTED":
+                NewLog()
+                debug(0,"You must select input file")
+                TextViewer(self,"Conversion log",Log.Text())
+                return
+
+            if OutputDirectory=="NOT SELECTED":
+                NewLog()
+                debug(0,"You must select output directory")
+                TextViewer(self,"Conversion log",Log.Text())
+                return
+
+            self.InFileButton.config(state="disabled")
+            self.OutDirButton.config(state="disabled")
+            self.RunButton.config(state="disabled")
+            self.CloseButton.config(state="disabled")
+
+            global Process_AntiquaAsBold
+            Process_AntiquaAsBold=(self.UseAntiqueVar.get()==1)
+            global Process_DeleteBadLinks
+            Process_DeleteBadLinks=(self.DelbadlinksVar.get()==1)
+
+            global DoNotPrefix
+            DoNotPrefix=(self.DoNotPrefixVar.get()==1)
+
+            global TaskPost
+            TaskPost=(self.TaskPostVar.get()==1)
+
+            global AggressiveFormula
+            AggressiveFormula=(self.AggressiveFormulaVar.get()==1)
+
+
+
+    #        global UsePrettyXml
+    #        UsePrettyXml=(self.UsePrettyXmlVar.get()==1)
+
+            global FrameMode
+            FrameMode=(self.FrameModeVar.get()==1)
+
+            global ReplaceBoldWith
+            if self.ReplaceBoldVar.get()==1:
+                ReplaceBoldWith=self.ReplaceBoldEntry.get()
+            else:
+                ReplaceBoldWith=""
             
-        global ReplaceItalicWith
-        if self.ReplaceItalicVar.get()==1:
-            ReplaceItalicWith=self.ReplaceItalicEntry.get()
-        else:
-            ReplaceItalicWith=""      
-
-
-
-        # reset globals
-
-        global DebugText
-        DebugText=""
-        
-        global BookmarksDictionary
-        BookmarksDictionary={}
-
-        global BookmarksDuplicate
-        BookmarksDuplicate={}
-
-        global StylesDictionary
-        StylesDictionary={"":set([])}
-
-#        global StylesOutlineLevels
-#        StylesOutlineLevels={"":0}
-
-        global InTable
-        InTable=0
-
-
-        global ListStylesDictionary
-        ListStylesDictionary={"":{}}
-
-        global CurrentListLevel
-        CurrentListLevel=0
-
-        global ListStyleNamesStack
-        ListStyleNamesStack=[""]
-
-        global OutputDOMs
-        OutputDOMs=[]
-
-        global AutoCreatedIDs
-        AutoCreatedIDs=[]
-
-        global AllIDs
-        AllIDs=[]
-
-        global AutoID_Counter
-        AutoID_Counter=0
-
-        global InitialOutputDOM
-        InitialOutputDOM=None
-
-        global InitialOutputBody
-        InitialOutputBody=None
-
-        global CurrentOutputTitle
-        CurrentOutputTitle=None
-
-        global CurrentOutputKeywords
-        CurrentOutputKeywords=None
-
-        global FrameModeStylesDictionary
-        FrameModeStylesDictionary={}
-
-        global ToUnzip
-        ToUnzip=set([])
+            global ReplaceItalicWith
+            if self.ReplaceItalicVar.get()==1:
+                ReplaceItalicWith=self.ReplaceItalicEntry.get()
+            else:
+                ReplaceItalicWith=""      
 
 
 
+            # no globals to reset since 0.43 - every conversion gets a new Converter
 
-        ConvertODTToDITA()
+            ConvertODTToDITA()
 
-        TextViewer(self,"Conversion log",DebugText)
+            TextViewer(self,"Conversion log",Log.Text())
 
-        self.InFileButton.config(state="normal")
-        self.OutDirButton.config(state="normal")
-        self.RunButton.config(state="normal")
-        self.CloseButton.config(state="normal")
+            self.InFileButton.config(state="normal")
+            self.OutDirButton.config(state="normal")
+            self.RunButton.config(state="normal")
+            self.CloseButton.config(state="normal")
 
 
         
     
 
-    def SelectInputFile(self):
-        ftypes = [('Document', '.odt'),
-             ('All Files', '.*')]
+        def SelectInputFile(self):
+            ftypes = [('Document', '.odt'),
+                 ('All Files', '.*')]
 
-        d = tkFileDialog.askopenfilename(filetypes=ftypes)
+            d = tkFileDialog.askopenfilename(filetypes=ftypes)
 
-        if d<>"":
-            global InputFile
-            InputFile=d
-            self.InFileLabel["text"]=d
-            (pth,nme)=os.path.split(d)
-            global NameRoot
-            (NameRoot,ext)=os.path.splitext(nme)
+            if d<>"":
+                global InputFile
+                InputFile=d
+                self.InFileLabel["text"]=d
+                (pth,nme)=os.path.split(d)
+                global NameRoot
+                (NameRoot,ext)=os.path.splitext(nme)
             
         
 
 
-    def SelectOutputDirectory(self):
-        d = tkFileDialog.askdirectory(initialdir=".")
-        if d<>"":
-            global OutputDirectory
-            OutputDirectory=d
-            self.OutDirLabel["text"]=d
+        def SelectOutputDirectory(self):
+            d = tkFileDialog.askdirectory(initialdir=".")
+            if d<>"":
+                global OutputDirectory
+                OutputDirectory=d
+                self.OutDirLabel["text"]=d
             
         
-    def createWidgets(self):
-        self.TopLabel = Label(self)
-        self.TopLabel["text"] = "ODT to DITA converter version 0.41 OASIS 1"
-        self.TopLabel.pack()
+        def createWidgets(self):
+            self.TopLabel = Tkinter.Label(self)
+            self.TopLabel["text"] = "ODT to DITA converter version 0.41 OASIS 1"
+            self.TopLabel.pack()
 
-        self.TopLabel2 = Label(self)
-        self.TopLabel2["text"] = "BETA VERSION: limited distribution"
-        self.TopLabel2.pack()
+            self.TopLabel2 = Tkinter.Label(self)
+            self.TopLabel2["text"] = "BETA VERSION: limited distribution"
+            self.TopLabel2.pack()
 
-        self.TopLabel3 = Label(self)
-        self.TopLabel3["text"] = "(C) Copyright IBM 2010, 2016"
-        self.TopLabel3.pack()
+            self.TopLabel3 = Tkinter.Label(self)
+            self.TopLabel3["text"] = "(C) Copyright IBM 2010, 2016"
+            self.TopLabel3.pack()
 
         
-        self.TopLabel4 = Label(self)
-        self.TopLabel4["text"] = "Code: Mikhail Ramendik ramendim@ie.ibm.com"
-        self.TopLabel4.pack()
+            self.TopLabel4 = Tkinter.Label(self)
+            self.TopLabel4["text"] = "Code: Mikhail Ramendik ramendim@ie.ibm.com"
+            self.TopLabel4.pack()
 
-#        self.TopLabel5 = Label(self)
-#        self.TopLabel5["text"] = "Tivoli ID Center of Excellence: Ireland"
-#        self.TopLabel5.pack()
+    #        self.TopLabel5 = Label(self)
+    #        self.TopLabel5["text"] = "Tivoli ID Center of Excellence: Ireland"
+    #        self.TopLabel5.pack()
 
         
-        self.InFileFrame = Frame(self)
-        self.InFileFrame.pack()
-
-        self.InFileButton = Button(self.InFileFrame)
-        self.InFileButton.config(text="ODT file")
-        self.InFileButton["command"] = self.SelectInputFile
-        self.InFileButton.pack({"side":"left"})
-        self.InFileLabel = Label(self.InFileFrame)
-        self.InFileLabel["text"]="NOT SELECTED"
-        self.InFileLabel.pack({"side":"left"})
-
-        self.OutDirFrame = Frame(self)
-        self.OutDirFrame.pack()
-
-        self.OutDirButton = Button(self.OutDirFrame)
-        self.OutDirButton.config(text="Output dir")
-        self.OutDirButton["command"] = self.SelectOutputDirectory
-        self.OutDirButton.pack({"side":"left"})
-        self.OutDirLabel = Label(self.OutDirFrame)
-        self.OutDirLabel["text"]="NOT SELECTED"
-        self.OutDirLabel.pack({"side":"left"})
-
-        self.UseAntiqueVar=IntVar()
-        self.UseAntiqueCheck=Checkbutton(self)
-        self.UseAntiqueCheck["text"]="Process Antiqua text as Bold"
-        self.UseAntiqueCheck["variable"]=self.UseAntiqueVar
-        self.UseAntiqueCheck.pack()
-
-        self.DelbadlinksVar=IntVar()
-        self.DelbadlinksCheck=Checkbutton(self)
-        self.DelbadlinksCheck["text"]="Delete xref tags for non-working internal links"
-        self.DelbadlinksCheck["variable"]=self.DelbadlinksVar
-        self.DelbadlinksCheck.pack()
-
-        self.FrameModeVar=IntVar()
-        self.FrameModeCheck=Checkbutton(self)
-        self.FrameModeCheck["text"]='Frame Mode: treat "headingN" style names as headers'
-        self.FrameModeCheck["variable"]=self.FrameModeVar
-        self.FrameModeCheck.pack()
-
-        self.DoNotPrefixVar=IntVar()
-        self.DoNotPrefixCheck=Checkbutton(self)
-        self.DoNotPrefixCheck["text"]="Do NOT prefix file names with topic type letter"
-        self.DoNotPrefixCheck["variable"]=self.DoNotPrefixVar
-        self.DoNotPrefixCheck.pack()
-
-        self.TaskPostVar=IntVar()
-        self.TaskPostVar.set(1)
-        self.TaskPostCheck=Checkbutton(self)
-        self.TaskPostCheck["text"]="Process steps in tasks (uncheck if tasks are converted badly)"
-        self.TaskPostCheck["variable"]=self.TaskPostVar
-        self.TaskPostCheck.pack()
-
-        self.AggressiveFormulaVar=IntVar()
-        self.AggressiveFormulaCheck=Checkbutton(self)
-        self.AggressiveFormulaCheck["text"]="Aggressive formula detection"
-        self.AggressiveFormulaCheck["variable"]=self.AggressiveFormulaVar
-        self.AggressiveFormulaCheck.pack()
-
-
-
-#        self.UsePrettyXmlVar=IntVar()
-#        self.UsePrettyXmlCheck=Checkbutton(self)
-#        self.UsePrettyXmlCheck["text"]="Use pretty XML for output (UNTESTED)"
-#        self.UsePrettyXmlCheck["variable"]=self.UsePrettyXmlVar
-#        self.UsePrettyXmlCheck.pack()
-
-
-        self.WarningLabel=Label(self)
-        self.WarningLabel["text"]="Tag replacement: UNSUPPORTED. USE AT YOUR OWN RISK!"
-        self.WarningLabel.pack()
-
-        self.BoldFrame = Frame(self)
-        self.BoldFrame.pack()
-        self.ReplaceBoldVar=IntVar()
-        self.ReplaceBoldCheck=Checkbutton(self.BoldFrame)
-        self.ReplaceBoldCheck["text"]="Replace Bold tag with:"
-        self.ReplaceBoldCheck["variable"]=self.ReplaceBoldVar
-        self.ReplaceBoldCheck.pack({"side":"left"})
-        self.ReplaceBoldEntry=Entry(self.BoldFrame)
-        self.ReplaceBoldEntry.insert(0,"uicontrol")
-        self.ReplaceBoldEntry.pack({"side":"left"})
-
-        self.ItalicFrame = Frame(self)
-        self.ItalicFrame.pack()
-        self.ReplaceItalicVar=IntVar()
-        self.ReplaceItalicCheck=Checkbutton(self.ItalicFrame)
-        self.ReplaceItalicCheck["text"]="Replace Italic tag with:"
-        self.ReplaceItalicCheck["variable"]=self.ReplaceItalicVar
-        self.ReplaceItalicCheck.pack({"side":"left"})
-        self.ReplaceItalicEntry=Entry(self.ItalicFrame)
-        self.ReplaceItalicEntry.insert(0,"term")
-        self.ReplaceItalicEntry.pack({"side":"left"})
+            self.InFileFrame = Tkinter.Frame(self)
+            self.InFileFrame.pack()
+
+            self.InFileButton = Tkinter.Button(self.InFileFrame)
+            self.InFileButton.config(text="ODT file")
+            self.InFileButton["command"] = self.SelectInputFile
+            self.InFileButton.pack({"side":"left"})
+            self.InFileLabel = Tkinter.Label(self.InFileFrame)
+            self.InFileLabel["text"]="NOT SELECTED"
+            self.InFileLabel.pack({"side":"left"})
+
+            self.OutDirFrame = Tkinter.Frame(self)
+            self.OutDirFrame.pack()
+
+            self.OutDirButton = Tkinter.Button(self.OutDirFrame)
+            self.OutDirButton.config(text="Output dir")
+            self.OutDirButton["command"] = self.SelectOutputDirectory
+            self.OutDirButton.pack({"side":"left"})
+            self.OutDirLabel = Tkinter.Label(self.OutDirFrame)
+            self.OutDirLabel["text"]="NOT SELECTED"
+            self.OutDirLabel.pack({"side":"left"})
+
+            self.UseAntiqueVar=Tkinter.IntVar()
+            self.UseAntiqueCheck=Tkinter.Checkbutton(self)
+            self.UseAntiqueCheck["text"]="Process Antiqua text as Bold"
+            self.UseAntiqueCheck["variable"]=self.UseAntiqueVar
+            self.UseAntiqueCheck.pack()
+
+            self.DelbadlinksVar=Tkinter.IntVar()
+            self.DelbadlinksCheck=Tkinter.Checkbutton(self)
+            self.DelbadlinksCheck["text"]="Delete xref tags for non-working internal links"
+            self.DelbadlinksCheck["variable"]=self.DelbadlinksVar
+            self.DelbadlinksCheck.pack()
+
+            self.FrameModeVar=Tkinter.IntVar()
+            self.FrameModeCheck=Tkinter.Checkbutton(self)
+            self.FrameModeCheck["text"]='Frame Mode: treat "headingN" style names as headers'
+            self.FrameModeCheck["variable"]=self.FrameModeVar
+            self.FrameModeCheck.pack()
+
+            self.DoNotPrefixVar=Tkinter.IntVar()
+            self.DoNotPrefixCheck=Tkinter.Checkbutton(self)
+            self.DoNotPrefixCheck["text"]="Do NOT prefix file names with topic type letter"
+            self.DoNotPrefixCheck["variable"]=self.DoNotPrefixVar
+            self.DoNotPrefixCheck.pack()
+
+            self.TaskPostVar=Tkinter.IntVar()
+            self.TaskPostVar.set(1)
+            self.TaskPostCheck=Tkinter.Checkbutton(self)
+            self.TaskPostCheck["text"]="Process steps in tasks (uncheck if tasks are converted badly)"
+            self.TaskPostCheck["variable"]=self.TaskPostVar
+            self.TaskPostCheck.pack()
+
+            self.AggressiveFormulaVar=Tkinter.IntVar()
+            self.AggressiveFormulaCheck=Tkinter.Checkbutton(self)
+            self.AggressiveFormulaCheck["text"]="Aggressive formula detection"
+            self.AggressiveFormulaCheck["variable"]=self.AggressiveFormulaVar
+            self.AggressiveFormulaCheck.pack()
+
+
+
+    #        self.UsePrettyXmlVar=IntVar()
+    #        self.UsePrettyXmlCheck=Checkbutton(self)
+    #        self.UsePrettyXmlCheck["text"]="Use pretty XML for output (UNTESTED)"
+    #        self.UsePrettyXmlCheck["variable"]=self.UsePrettyXmlVar
+    #        self.UsePrettyXmlCheck.pack()
+
+
+            self.WarningLabel=Tkinter.Label(self)
+            self.WarningLabel["text"]="Tag replacement: UNSUPPORTED. USE AT YOUR OWN RISK!"
+            self.WarningLabel.pack()
+
+            self.BoldFrame = Tkinter.Frame(self)
+            self.BoldFrame.pack()
+            self.ReplaceBoldVar=Tkinter.IntVar()
+            self.ReplaceBoldCheck=Tkinter.Checkbutton(self.BoldFrame)
+            self.ReplaceBoldCheck["text"]="Replace Bold tag with:"
+            self.ReplaceBoldCheck["variable"]=self.ReplaceBoldVar
+            self.ReplaceBoldCheck.pack({"side":"left"})
+            self.ReplaceBoldEntry=Tkinter.Entry(self.BoldFrame)
+            self.ReplaceBoldEntry.insert(0,"uicontrol")
+            self.ReplaceBoldEntry.pack({"side":"left"})
+
+            self.ItalicFrame = Tkinter.Frame(self)
+            self.ItalicFrame.pack()
+            self.ReplaceItalicVar=Tkinter.IntVar()
+            self.ReplaceItalicCheck=Tkinter.Checkbutton(self.ItalicFrame)
+            self.ReplaceItalicCheck["text"]="Replace Italic tag with:"
+            self.ReplaceItalicCheck["variable"]=self.ReplaceItalicVar
+            self.ReplaceItalicCheck.pack({"side":"left"})
+            self.ReplaceItalicEntry=Tkinter.Entry(self.ItalicFrame)
+            self.ReplaceItalicEntry.insert(0,"term")
+            self.ReplaceItalicEntry.pack({"side":"left"})
         
         
         
 
-        self.RunButton=Button(self)
-        self.RunButton["text"]="Convert!"
-        self.RunButton["command"]=self.Run
-        self.RunButton.pack()
+            self.RunButton=Tkinter.Button(self)
+            self.RunButton["text"]="Convert!"
+            self.RunButton["command"]=self.Run
+            self.RunButton.pack()
 
-        self.CloseButton=Button(self, text="Close", command=root.destroy)
-        self.CloseButton.pack()
+            self.CloseButton=Tkinter.Button(self, text="Close", command=root.destroy)
+            self.CloseButton.pack()
         
         
 
 
         
-    def __init__(self, master=None):
-        Frame.__init__(self, master)
-        self.pack()
-        self.createWidgets()
-
-
-if len(sys.argv) == 1:
-	# GUI
-	root = Tk()
-	app = Application(master=root)
-	app.mainloop()
-	try:
-    		root.destroy()
-	except Exception as e:
-		print e 
-		print "GUI fails, please use the command line. Use the -h option to view command line options"
-else:
-	#CLI
+        def __init__(self, master=None):
+            Tkinter.Frame.__init__(self, master)
+            self.pack()
+            self.createWidgets()
+
+
+    root = Tix.Tk()
+    app = Application(master=root)
+    app.mainloop()
+    try:
+        root.destroy()
+    except Exception as e:
+        print e 
+        print "GUI fails, please use the command line. Use the -h option to view command line options"
+
+
+
+if __name__=="__main__":
+    # 0.43: guarded, so that worker processes of a batch conversion can import this module
+    if len(sys.argv) == 1:
+        # GUI
+        StartGUI()
+    else:
+        #CLI
         parser = argparse.ArgumentParser("Convert ODT to DITA. (C) IBM, Mikhail Ramendik 2010, 2017")
-        parser.add_argument("infile", help="the name/location of the input file")
-        parser.add_argument("outdir", help="the name/location of the input file")
+        parser.add_argument("infile", nargs="*", help="the name/location of the input file; for batch mode, any number of files and directories")
+        parser.add_argument("outdir", help="the name/location of the output directory")
         parser.add_argument("-b", help="the tag to use for bold instead of b (optional)")
         parser.add_argument("-i", help="the tag to use for italic instead of i (optional)")
         parser.add_argument("-nt", help="do NOT try to process numbered staps in tasks (optional)", action="store_true")
         parser.add_argument("-np", help="do NOT prefix file names with topic type letter (optional)", action="store_true")
         parser.add_argument("-a", help="process antigua text as bold (optional)", action="store_true")
         parser.add_argument("-x", help="remove xref tags for non-working internal links (optional)", action="store_true")
+        parser.add_argument("-ns", help="do NOT stream content.xml, parse it whole - uses more memory (optional)", action="store_true")
+        parser.add_argument("-sl", help="split paragraphs at line breaks while reading them - much faster with many line breaks, but the output can differ (optional)", action="store_true")
+        parser.add_argument("-md", help="build the output with minidom instead of the light tree - slower, uses more memory (optional)", action="store_true")
+        parser.add_argument("-c", help="directory for the styles cache: documents with the same styles.xml (template) are faster to convert; can be shared by batch runs (optional)")
+        parser.add_argument("-r", help="write a report of the time spent in each conversion phase, and counters, as <name>.report.json next to the ditamap; "+
+                            "the peak memory of a phase is the peak of the process at its end, not within the phase (optional)", action="store_true")
+        parser.add_argument("-w", help="number of threads writing out topic files, default is 1 - more can help on network drives (optional)", type=int, default=1)
+        parser.add_argument("-m", help="batch mode: a manifest file listing input files, one per line; can be repeated (optional)", action="append", default=[])
+        parser.add_argument("-j", help="batch mode: number of worker processes, default is the number of CPUs (optional)", type=int)
 
         args = parser.parse_args()
 
-        # assign input and output to globals
-        InputFile=args.infile
-        if not os.path.isfile(InputFile):
-            print "Input file does not exist"
-            sys.exit(2)
+        # Batch mode is used for several input files, for a directory, or with a manifest
+        BatchMode=(len(args.infile)<>1) or (args.m<>[]) or os.path.isdir(args.infile[0])
 
-        (pth,nme)=os.path.split(InputFile)
-        (NameRoot,ext)=os.path.splitext(nme)
+        if not BatchMode:
+            # assign input and output to globals
+            InputFile=args.infile[0]
+            if not os.path.isfile(InputFile):
+                print "Input file does not exist"
+                sys.exit(2)
+
+            (pth,nme)=os.path.split(InputFile)
+            (NameRoot,ext)=os.path.splitext(nme)
 
         OutputDirectory=args.outdir
         if not os.path.isdir(OutputDirectory):
@@ -3398,6 +4766,21 @@ else:
         Process_AntiquaAsBold=args.a
         Process_DeleteBadLinks=args.x
 
+        StreamContent=(not args.ns)
+
+        SplitLinebreaks=args.sl
+
+        LightTree=(not args.md)
+
+        WriteThreads=args.w
+
+        WriteReport=args.r
+
+        if args.c != None:
+            StylesCacheDir=args.c
+            if not os.path.isdir(StylesCacheDir):
+                os.makedirs(StylesCacheDir)
+
         DoNotPrefix=args.np
 
         TaskPost=(not args.nt)
@@ -3412,14 +4795,22 @@ else:
         else:
             ReplaceItalicWith=""
 
-        print "Converting, please wait"
-
-        ConvertODTToDITA()
+        if BatchMode:
+            BatchFiles=CollectBatchFiles(args.infile,args.m)
+            if BatchFiles==[]:
+                print "No input files found"
+                sys.exit(2)
 
-        print "Conversion log:"
-        print DebugText
+            print "Converting "+str(len(BatchFiles))+" files, please wait"
 
+            BatchResults=ConvertBatch(BatchFiles,OutputDirectory,ConversionOptions(),args.j)
+            PrintBatchSummary(BatchResults)
+            if False in [BatchSuccess for (BatchFile,BatchSuccess,BatchTime) in BatchResults]:
+                sys.exit(1)
+        else:
+            print "Converting, please wait"
 
+            ConvertODTToDITA()
 
-	
-    
+            print "Conversion log:"
+            print Log.Text()